@@ -1,6 +1,6 @@
 # 假设模型在 booking app 下，路径为 booking/admin.py
 from django.contrib import admin
-from .models import Booking, ApprovalRecord  # 导入你的两个模型
+from .models import Booking, ApprovalRecord, ApprovalQueueCounter, FinanceCallback
 
 # -------------------------- 审批记录 内联显示配置 --------------------------
 # 让审批记录可以在预约申请页面直接查看/编辑（更友好）
@@ -54,4 +54,20 @@ class ApprovalRecordAdmin(admin.ModelAdmin):
     fields = ('booking', 'approver', 'approval_level', 'action', 'comment', 'approval_time')
 
 # 如果你的模型不在 booking app 下，只需把导入路径改成正确的即可，比如：
-# from devices.models import Booking, ApprovalRecord
\ No newline at end of file
+# from devices.models import Booking, ApprovalRecord
+# -------------------------- 审批队列计数 Admin 配置 --------------------------
+@admin.register(ApprovalQueueCounter)
+class ApprovalQueueCounterAdmin(admin.ModelAdmin):
+    # 计数由信号维护，偏差用 reconcile_queue_counters 命令校正，后台只读
+    list_display = ('queue', 'teacher', 'count', 'updated_at')
+    list_filter = ('queue',)
+    readonly_fields = ('queue', 'teacher', 'count', 'updated_at')
+
+# -------------------------- 财务回调记录 Admin 配置 --------------------------
+@admin.register(FinanceCallback)
+class FinanceCallbackAdmin(admin.ModelAdmin):
+    # 幂等键记录由缴费回调接口写入，后台只读
+    list_display = ('transaction_id', 'booking_code', 'payment_status', 'received_at')
+    search_fields = ('transaction_id', 'booking_code')
+    list_filter = ('payment_status',)
+    readonly_fields = ('transaction_id', 'booking_code', 'payment_status', 'claim_token', 'response', 'received_at')
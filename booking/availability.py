@@ -0,0 +1,156 @@
+"""时段可用性引擎：每个设备每天只用一次聚合查询判断各时段是否空闲"""
+import hashlib
+from datetime import timedelta
+from django.core.cache import cache
+from django.db.models import Count, Q
+from .models import Booking
+
+# 所有可预约时段
+TIME_SLOTS = [
+    '08:00-10:00',
+    '10:00-12:00',
+    '12:00-14:00',
+    '14:00-16:00',
+    '16:00-18:00',
+    '18:00-20:00',
+]
+
+# 校内人员（享有优先权，可覆盖校外人员的预约）
+INTERNAL_USER_TYPES = ('student', 'teacher')
+
+
+class DayAvailability:
+    """某设备某一天的时段占用情况
+
+    slot_counts: {时段: (有效预约总数, 其中校外人员预约数)}
+    """
+
+    def __init__(self, slot_counts=None):
+        self.slot_counts = slot_counts or {}
+
+    @classmethod
+    def for_device(cls, device, booking_date):
+        """按时段分组聚合该设备当天的有效预约（单条SQL）"""
+        rows = Booking.objects.filter(
+            device=device,
+            booking_date=booking_date,
+            status__in=Booking.ACTIVE_STATUSES
+        ).values('time_slot').annotate(
+            total=Count('id'),
+            external=Count('id', filter=Q(applicant__user_type='external'))
+        ).order_by()
+        return cls({row['time_slot']: (row['total'], row['external']) for row in rows})
+
+    @property
+    def occupied_slots(self):
+        """已被占用的时段列表"""
+        return [slot for slot, (total, _) in self.slot_counts.items() if total > 0]
+
+    def is_occupied(self, time_slot):
+        """该时段是否已有有效预约"""
+        total, _ = self.slot_counts.get(time_slot, (0, 0))
+        return total > 0
+
+    def can_override(self, time_slot):
+        """该时段是否只被校外人员占用（校内人员优先规则下可覆盖）"""
+        total, external = self.slot_counts.get(time_slot, (0, 0))
+        return total > 0 and total == external
+
+    def is_available(self, time_slot, user_type=None):
+        """该用户类型能否预约该时段"""
+        if not self.is_occupied(time_slot):
+            return True
+        return user_type in INTERNAL_USER_TYPES and self.can_override(time_slot)
+
+    def available_slots(self, user_type=None, slots=TIME_SLOTS):
+        """该用户类型可预约的时段列表"""
+        return [slot for slot in slots if self.is_available(slot, user_type)]
+
+
+# ---------------------- 批量占用矩阵（多设备 × 多天） ----------------------
+# 矩阵缓存时间（秒）；预约状态变化时通过日期版本号失效
+AVAILABILITY_CACHE_TIMEOUT = 300
+AVAILABILITY_CACHE_PREFIX = 'booking:availability'
+
+
+def slot_bit(time_slot):
+    """时段对应的位（TIME_SLOTS中第i个时段为 1 << i），非标准时段返回0"""
+    try:
+        return 1 << TIME_SLOTS.index(time_slot)
+    except ValueError:
+        return 0
+
+
+def build_occupancy_matrix(devices, start_date, end_date):
+    """一次批量查询计算多设备多天的占用位图
+
+    返回 {设备ID: {'occupied': [每天的位图], 'external_only': [每天的位图]}}
+    occupied 中的位表示该时段已被占用；external_only 中的位表示该时段只被校外人员占用
+    （校内人员可覆盖）。
+    """
+    device_ids = [getattr(device, 'pk', device) for device in devices]
+    days = (end_date - start_date).days + 1
+    matrix = {
+        device_id: {'occupied': [0] * days, 'external_only': [0] * days}
+        for device_id in device_ids
+    }
+    if not device_ids or days <= 0:
+        return matrix
+
+    rows = Booking.objects.filter(
+        device_id__in=device_ids,
+        booking_date__gte=start_date,
+        booking_date__lte=end_date,
+        status__in=Booking.ACTIVE_STATUSES
+    ).values('device_id', 'booking_date', 'time_slot').annotate(
+        total=Count('id'),
+        external=Count('id', filter=Q(applicant__user_type='external'))
+    ).order_by()
+
+    for row in rows:
+        bit = slot_bit(row['time_slot'])
+        if not bit:
+            continue
+        day_index = (row['booking_date'] - start_date).days
+        cell = matrix[row['device_id']]
+        cell['occupied'][day_index] |= bit
+        if row['total'] == row['external']:
+            cell['external_only'][day_index] |= bit
+    return matrix
+
+
+def _day_version_key(day):
+    return f'{AVAILABILITY_CACHE_PREFIX}:version:{day.isoformat()}'
+
+
+def invalidate_availability(*dates):
+    """使包含这些日期的占用矩阵缓存失效（预约新增、状态变化或删除时调用）"""
+    for day in set(dates):
+        if day is None:
+            continue
+        key = _day_version_key(day)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, 1, None)
+
+
+def get_occupancy_matrix(devices, start_date, end_date):
+    """带缓存的占用矩阵，缓存键由（设备集合, 日期范围, 各日期版本号）组成"""
+    device_ids = sorted({getattr(device, 'pk', device) for device in devices})
+    days = [start_date + timedelta(days=i) for i in range((end_date - start_date).days + 1)]
+    version_keys = [_day_version_key(day) for day in days]
+    versions = cache.get_many(version_keys)
+    signature = '|'.join([
+        ','.join(str(device_id) for device_id in device_ids),
+        start_date.isoformat(),
+        end_date.isoformat(),
+        ','.join(str(versions.get(key, 0)) for key in version_keys),
+    ])
+    cache_key = f'{AVAILABILITY_CACHE_PREFIX}:matrix:' + hashlib.md5(signature.encode()).hexdigest()
+
+    matrix = cache.get(cache_key)
+    if matrix is None:
+        matrix = build_occupancy_matrix(device_ids, start_date, end_date)
+        cache.set(cache_key, matrix, AVAILABILITY_CACHE_TIMEOUT)
+    return matrix
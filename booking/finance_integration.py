@@ -1,65 +1,186 @@
-"""财务处系统集成模块"""
+"""财务处系统集成模块
+
+缴费确认回调（finance_payment_callback）：
+- 幂等：每条确认以财务处交易号（transaction_id）为幂等键写入 FinanceCallback，
+  财务处重试或重复推送时直接返回首次处理的结果，不再修改预约；
+- 批量：请求体可以是单条确认，也可以是 {"confirmations": [...]}（或确认列表），一次处理多条；
+- 写入次数与条数无关：一次 INSERT 认领幂等键 → 一次查询预约 → 待缴费的预约一次条件 UPDATE（预约状态机），
+  其他状态只补记缴费结果的一次条件 UPDATE → 一次 bulk_update 保存处理结果，全部在一个事务中。
+缴费请求（send_payment_requests）合并为一批，在后台线程中发送到 FINANCE_API_URL。
+本地压测可用 python manage.py finance_stub_server 模拟财务处。
+"""
+import json
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from urllib import request as urllib_request
+from django.conf import settings
+from django.db import connection, transaction
 from django.http import JsonResponse
+from django.utils import timezone
 from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods
-from booking.models import Booking
-from django.utils import timezone
-import json
+from booking.models import Booking, FinanceCallback
+from booking.state_machine import TransitionConflict, transition
+
+# 一次回调最多包含的确认条数
+MAX_CALLBACK_BATCH = 1000
+
+NOT_FOUND = '预约不存在'
+PAID_FIELDS = {'payment_status': 'paid', 'finance_confirmed': True}
+
+# 一次发送到财务处的缴费请求最多包含的预约数
+PAYMENT_REQUEST_BATCH = 500
+FINANCE_REQUEST_TIMEOUT = 10
+
+logger = logging.getLogger(__name__)
+_executor = None
+
+
+def _idempotency_key(confirmation):
+    """幂等键：财务处交易号；旧版回调没有交易号时按预约编号和缴费状态去重"""
+    transaction_id = confirmation.get('transaction_id')
+    if transaction_id:
+        return str(transaction_id)
+    return f"{confirmation['booking_code']}:{confirmation.get('payment_status')}"
+
+
+def _apply(records):
+    """处理新认领的回调记录，返回 {交易号: 处理结果}"""
+    codes = {record.booking_code for record in records}
+    bookings = Booking.objects.filter(booking_code__in=codes)
+    if connection.features.has_select_for_update:
+        bookings = bookings.select_for_update()
+    bookings = {booking.booking_code: booking for booking in bookings} if codes else {}
+
+    responses = {}
+    to_approve, to_mark = {}, {}
+    for record in records:
+        response = {'transaction_id': record.transaction_id, 'booking_code': record.booking_code}
+        booking = bookings.get(record.booking_code)
+        if booking is None:
+            response.update(success=False, error=NOT_FOUND)
+        elif record.payment_status != 'paid':
+            response.update(success=False, error='缴费失败')
+        else:
+            response.update(success=True, message='缴费确认成功')
+            if booking.status == 'payment_pending':
+                # 待缴费：同时更新为全部审批通过
+                to_approve[booking.id] = booking
+            elif (booking.payment_status, booking.finance_confirmed) != ('paid', True):
+                # 不是待缴费：只记录缴费结果
+                to_mark[booking.id] = booking
+        responses[record.transaction_id] = response
+
+    if to_approve:
+        transition(to_approve.values(), 'manager_approved', **PAID_FIELDS)
+    if to_mark:
+        # update() 不会触发 auto_now，需显式更新 update_time
+        Booking.objects.filter(id__in=list(to_mark)).update(update_time=timezone.now(), **PAID_FIELDS)
+    return responses
+
+
+def process_confirmations(confirmations):
+    """处理一批缴费确认，返回每条的处理结果（顺序与 confirmations 相同）
+
+    每条确认：{'transaction_id', 'booking_code', 'payment_status'（'paid' 或 'failed'）}
+    结果：{'transaction_id', 'booking_code', 'success', 'message' 或 'error'}，重复的交易另有 'duplicate': True。
+    预约状态已被并发修改时整批回滚（TransitionConflict），幂等键不保留，财务处重试即可。
+    """
+    keys = []
+    entries = {}  # 交易号 -> 确认
+    for confirmation in confirmations:
+        if not isinstance(confirmation, dict) or not confirmation.get('booking_code'):
+            keys.append(None)
+            continue
+        key = _idempotency_key(confirmation)
+        keys.append(key)
+        entries.setdefault(key, confirmation)
+
+    invalid = {key for key, confirmation in entries.items()
+               if len(key) > 64 or len(str(confirmation['booking_code'])) > 20}
+    token = uuid.uuid4().hex
+    records = {}
+    if len(entries) > len(invalid):
+        with transaction.atomic():
+            # 先认领幂等键：已存在（处理过或正在由其他请求处理）的交易号插入时被忽略
+            FinanceCallback.objects.bulk_create([
+                FinanceCallback(
+                    transaction_id=key, booking_code=str(confirmation['booking_code']),
+                    payment_status=str(confirmation.get('payment_status') or ''), claim_token=token,
+                )
+                for key, confirmation in entries.items() if key not in invalid
+            ], ignore_conflicts=True)
+            records = {
+                record.transaction_id: record
+                for record in FinanceCallback.objects.filter(transaction_id__in=[key for key in entries if key not in invalid])
+            }
+            claimed = [record for record in records.values() if record.claim_token == token]
+            if claimed:
+                responses = _apply(claimed)
+                for record in claimed:
+                    record.response = responses[record.transaction_id]
+                FinanceCallback.objects.bulk_update(claimed, ['response'])
+
+    results = []
+    seen = set()
+    for key in keys:
+        if key is None:
+            results.append({'success': False, 'error': '缺少预约编号'})
+        elif key in invalid:
+            results.append({'transaction_id': key, 'success': False, 'error': '交易号或预约编号过长'})
+        else:
+            record = records[key]
+            result = dict(record.response)
+            if record.claim_token != token or key in seen:
+                result['duplicate'] = True
+            seen.add(key)
+            results.append(result)
+    return results
+
 
 @csrf_exempt
 @require_http_methods(["POST"])
 def finance_payment_callback(request):
-    """财务处缴费确认回调接口"""
+    """财务处缴费确认回调接口（单条确认或 {"confirmations": [...]} 批量确认）"""
     try:
         data = json.loads(request.body)
-        booking_code = data.get('booking_code')
-        payment_status = data.get('payment_status')  # 'paid' 或 'failed'
-        payment_time = data.get('payment_time')
-        
-        if not booking_code:
-            return JsonResponse({'success': False, 'error': '缺少预约编号'}, status=400)
-        
-        try:
-            booking = Booking.objects.get(booking_code=booking_code)
-        except Booking.DoesNotExist:
-            return JsonResponse({'success': False, 'error': '预约不存在'}, status=404)
-        
-        if payment_status == 'paid':
-            # 缴费成功
-            booking.payment_status = 'paid'
-            booking.finance_confirmed = True
-            booking.save()
-            
-            # 如果状态是待缴费，更新为全部审批通过
-            if booking.status == 'payment_pending':
-                booking.status = 'manager_approved'
-                booking.save()
-            
+        if isinstance(data, dict) and 'confirmations' in data:
+            data = data['confirmations']
+
+        if isinstance(data, list):
+            if len(data) > MAX_CALLBACK_BATCH:
+                return JsonResponse({'success': False, 'error': f'一次最多确认{MAX_CALLBACK_BATCH}条'}, status=400)
+            try:
+                results = process_confirmations(data)
+            except TransitionConflict as e:
+                return JsonResponse({'success': False, 'error': str(e)}, status=409)
+            succeeded = sum(1 for result in results if result['success'])
             return JsonResponse({
                 'success': True,
-                'message': '缴费确认成功',
-                'booking_code': booking_code
-            })
-        else:
-            # 缴费失败
-            return JsonResponse({
-                'success': False,
-                'error': '缴费失败',
-                'booking_code': booking_code
+                'total': len(results),
+                'succeeded': succeeded,
+                'failed': len(results) - succeeded,
+                'results': results,
             })
-            
+
+        if not isinstance(data, dict) or not data.get('booking_code'):
+            return JsonResponse({'success': False, 'error': '缺少预约编号'}, status=400)
+        try:
+            result = process_confirmations([data])[0]
+        except TransitionConflict as e:
+            return JsonResponse({'success': False, 'error': str(e)}, status=409)
+        return JsonResponse(result, status=404 if result.get('error') == NOT_FOUND else 200)
+
     except json.JSONDecodeError:
         return JsonResponse({'success': False, 'error': 'JSON格式错误'}, status=400)
     except Exception as e:
         return JsonResponse({'success': False, 'error': str(e)}, status=500)
 
 
-def send_payment_request_to_finance(booking):
-    """发送缴费请求到财务处系统（模拟）"""
-    # 在实际环境中，这里应该调用财务处的API
-    # 这里只是模拟，实际需要根据财务处系统的API文档实现
-    
-    payment_data = {
+def payment_request_data(booking):
+    """一个预约的缴费请求内容，booking 需已加载 applicant 和 device"""
+    return {
         'booking_code': booking.booking_code,
         'applicant_name': booking.applicant.name,
         'applicant_code': booking.applicant.user_code,
@@ -70,13 +191,48 @@ def send_payment_request_to_finance(booking):
         'payment_amount': float(booking.payment_amount),
         'callback_url': f'/booking/finance/callback/'  # 财务处确认后的回调地址
     }
-    
-    # TODO: 实际调用财务处API
-    # response = requests.post('https://finance.jnu.edu.cn/api/payment', json=payment_data)
-    
-    # 模拟：直接返回成功（实际应该等待财务处回调）
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix='finance-request')
+    return _executor
+
+
+def _post_payment_requests(api_url, payloads):
+    """把一批缴费请求一次 POST 到财务处（后台线程中执行，失败只记录日志）"""
+    try:
+        req = urllib_request.Request(
+            api_url, data=json.dumps({'requests': payloads}).encode('utf-8'),
+            headers={'Content-Type': 'application/json'}, method='POST',
+        )
+        with urllib_request.urlopen(req, timeout=FINANCE_REQUEST_TIMEOUT) as response:
+            response.read()
+    except OSError:
+        logger.exception('缴费请求发送失败：%s', '、'.join(payload['booking_code'] for payload in payloads))
+
+
+def send_payment_requests(bookings):
+    """发送一批缴费请求到财务处系统
+
+    配置了 FINANCE_API_URL 时每 PAYMENT_REQUEST_BATCH 个预约合并为一次 POST（如本地的 finance_stub_server），
+    交给后台线程发送，不阻塞当前请求；否则只模拟发送。请求内容在调用时生成，后台线程不访问数据库。
+    """
+    payloads = [payment_request_data(booking) for booking in bookings]
+    api_url = getattr(settings, 'FINANCE_API_URL', '')
+    if api_url:
+        for start in range(0, len(payloads), PAYMENT_REQUEST_BATCH):
+            _get_executor().submit(_post_payment_requests, api_url, payloads[start:start + PAYMENT_REQUEST_BATCH])
+    # 实际缴费确认通过财务处回调完成
     return {
         'success': True,
         'message': '缴费请求已发送到财务处',
-        'payment_data': payment_data
+        'payment_data': payloads
     }
+
+
+def send_payment_request_to_finance(booking):
+    """发送单个预约的缴费请求到财务处系统"""
+    result = send_payment_requests([booking])
+    return dict(result, payment_data=result['payment_data'][0])
@@ -0,0 +1,137 @@
+"""
+预约冲突检查性能基准测试
+使用方法：python manage.py bench_conflict_check [--sizes 10000 100000 1000000] [--lookups 2000]
+在独立的测试数据库中生成指定数量的预约记录，分别测量有/无复合索引时冲突检查查询的平均耗时。
+不会读写正式数据库。
+"""
+import random
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+
+
+class Command(BaseCommand):
+    help = '测量不同数据量下预约冲突检查的查询耗时（有/无复合索引对比）'
+
+    DEVICE_COUNT = 200
+    TIME_SLOTS = ['08:00-10:00', '10:00-12:00', '12:00-14:00', '14:00-16:00', '16:00-18:00', '18:00-20:00']
+    STATUSES = ['pending', 'manager_approved', 'cancelled', 'admin_rejected', 'teacher_pending', 'payment_pending']
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10000, 100000, 1000000],
+            help='预约记录数量（可指定多个）',
+        )
+        parser.add_argument(
+            '--lookups',
+            type=int,
+            default=2000,
+            help='每轮执行的冲突检查次数',
+        )
+
+    def handle(self, *args, **options):
+        sizes = sorted(options['sizes'])
+        lookups = options['lookups']
+
+        # 创建独立的测试数据库（SQLite下为内存数据库），避免污染正式数据
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._prepare_base_data()
+            results = []
+            inserted = 0
+            for size in sizes:
+                self._insert_bookings(inserted, size)
+                inserted = size
+                indexed = self._measure(lookups)
+                self._toggle_indexes(drop=True)
+                unindexed = self._measure(lookups)
+                self._toggle_indexes(drop=False)
+                results.append((size, indexed, unindexed))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f'冲突检查平均耗时（每轮 {lookups} 次查询）：')
+        self.stdout.write(f'{"预约数量":>10} {"有索引(ms)":>12} {"无索引(ms)":>12} {"加速比":>8}')
+        for size, indexed, unindexed in results:
+            speedup = unindexed / indexed if indexed else 0
+            self.stdout.write(f'{size:>10} {indexed:>12.3f} {unindexed:>12.3f} {speedup:>7.1f}x')
+        self.stdout.write(self.style.SUCCESS('基准测试完成'))
+
+    def _prepare_base_data(self):
+        self.applicants = UserInfo.objects.bulk_create([
+            UserInfo(user_code=f'BENCH{i:03d}', name=f'测试用户{i}', user_type=user_type,
+                     department='基准测试', phone='13800000000')
+            for i, user_type in enumerate(['student', 'teacher', 'external'] * 10)
+        ])
+        # bulk_create 不触发 Device.save() 中的台账记录
+        self.devices = Device.objects.bulk_create([
+            Device(device_code=f'BENCH{i:04d}', model=f'测试设备{i}') for i in range(self.DEVICE_COUNT)
+        ])
+        self.start_date = date(2020, 1, 1)
+
+    def _slot_for(self, n):
+        """第n条预约对应的（设备, 日期, 时段），保证互不重复，满足有效预约唯一约束"""
+        slot_index = n % len(self.TIME_SLOTS)
+        device_index = (n // len(self.TIME_SLOTS)) % self.DEVICE_COUNT
+        day_offset = n // (len(self.TIME_SLOTS) * self.DEVICE_COUNT)
+        return (
+            self.devices[device_index],
+            self.start_date + timedelta(days=day_offset),
+            self.TIME_SLOTS[slot_index],
+        )
+
+    def _insert_bookings(self, start, end):
+        self.stdout.write(f'正在生成预约记录 {start} → {end} ...')
+        batch = []
+        for n in range(start, end):
+            device, booking_date, time_slot = self._slot_for(n)
+            batch.append(Booking(
+                booking_code=f'BENCH{n:010d}',
+                applicant=self.applicants[n % len(self.applicants)],
+                device=device,
+                booking_date=booking_date,
+                time_slot=time_slot,
+                status=self.STATUSES[n % len(self.STATUSES)],
+            ))
+            if len(batch) >= 5000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Booking.objects.bulk_create(batch)
+        self.total = end
+        with connection.cursor() as cursor:
+            if connection.vendor in ('sqlite', 'postgresql'):
+                cursor.execute('ANALYZE')
+
+    def _measure(self, lookups):
+        """随机抽取（设备, 日期, 时段）执行与 booking_apply 相同的冲突检查，返回平均耗时（毫秒）"""
+        rng = random.Random(42)
+        samples = [self._slot_for(rng.randrange(self.total)) for _ in range(lookups)]
+        begin = time.perf_counter()
+        for device, booking_date, time_slot in samples:
+            Booking.objects.filter(
+                device=device,
+                booking_date=booking_date,
+                time_slot=time_slot,
+                status__in=Booking.ACTIVE_STATUSES
+            ).exists()
+        return (time.perf_counter() - begin) * 1000 / lookups
+
+    def _toggle_indexes(self, drop):
+        """删除/恢复冲突检查使用的复合索引和部分唯一索引（外键索引保留）"""
+        conflict_index = next(index for index in Booking._meta.indexes if index.name == 'booking_conflict_idx')
+        constraint = next(c for c in Booking._meta.constraints if c.name == 'unique_active_booking_slot')
+        with connection.schema_editor() as schema_editor:
+            if drop:
+                schema_editor.remove_index(Booking, conflict_index)
+                schema_editor.remove_constraint(Booking, constraint)
+            else:
+                schema_editor.add_index(Booking, conflict_index)
+                schema_editor.add_constraint(Booking, constraint)
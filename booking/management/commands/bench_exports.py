@@ -0,0 +1,133 @@
+"""
+预约台账导出性能基准测试
+使用方法：python manage.py bench_exports [--rows 20000] [--skip-legacy]
+在独立的测试数据库中生成指定数量的预约记录，分别测量三种导出方式每秒处理的行数：
+原Excel导出（完整Workbook + 逐个模型实例）、流式Excel导出（write_only）和流式CSV导出。
+原Excel导出每行都计算 ws.max_row，耗时随行数平方增长，行数较多时可用 --skip-legacy 跳过。
+不会读写正式数据库。
+"""
+import time
+from datetime import date, timedelta
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.http import QueryDict
+from openpyxl import Workbook
+from openpyxl.utils import get_column_letter
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+from jnu_lab_system.exports import csv_chunks, write_xlsx
+
+
+class _NullFile:
+    """丢弃写入内容的文件对象，只测量生成耗时"""
+
+    def write(self, data):
+        return len(data)
+
+    def flush(self):
+        pass
+
+
+class Command(BaseCommand):
+    help = '比较预约台账的Excel导出和流式CSV导出的速度（行/秒）'
+
+    DEVICE_COUNT = 200
+    TIME_SLOTS = ['08:00-10:00', '10:00-12:00', '12:00-14:00', '14:00-16:00', '16:00-18:00', '18:00-20:00']
+    STATUSES = ['pending', 'manager_approved', 'cancelled', 'admin_rejected', 'teacher_pending', 'payment_pending']
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=20000, help='预约记录数量')
+        parser.add_argument('--skip-legacy', action='store_true', help='不测量原Excel导出')
+
+    def handle(self, *args, **options):
+        rows = options['rows']
+
+        # 创建独立的测试数据库（SQLite下为内存数据库），避免污染正式数据
+        old_name = connection.creation.create_test_db(verbosity=0, autoclobber=True)
+        try:
+            self._prepare_data(rows)
+            results = []
+            if not options['skip_legacy']:
+                results.append(('原Excel导出', self._measure(self._legacy_xlsx)))
+            results.append(('流式Excel导出', self._measure(self._streaming_xlsx)))
+            results.append(('流式CSV导出', self._measure(self._streaming_csv)))
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        self.stdout.write(f'预约台账导出速度（{rows} 行）：')
+        self.stdout.write(f'{"方式":<12} {"耗时(s)":>10} {"行/秒":>12}')
+        for name, seconds in results:
+            self.stdout.write(f'{name:<12} {seconds:>10.2f} {rows / seconds:>12.0f}')
+        csv_seconds = results[-1][1]
+        for name, seconds in results[:-1]:
+            self.stdout.write(f'CSV相对{name}：{seconds / csv_seconds:.1f}x')
+        self.stdout.write(self.style.SUCCESS('基准测试完成'))
+
+    def _prepare_data(self, rows):
+        self.stdout.write(f'正在生成 {rows} 条预约记录 ...')
+        applicants = UserInfo.objects.bulk_create([
+            UserInfo(user_code=f'BENCH{i:03d}', name=f'测试用户{i}', user_type=user_type,
+                     department='基准测试', phone='13800000000')
+            for i, user_type in enumerate(['student', 'teacher', 'external'] * 10)
+        ])
+        devices = Device.objects.bulk_create([
+            Device(device_code=f'BENCH{i:04d}', model=f'测试设备{i}') for i in range(self.DEVICE_COUNT)
+        ])
+        start_date = date(2020, 1, 1)
+        batch = []
+        per_day = len(self.TIME_SLOTS) * self.DEVICE_COUNT
+        for n in range(rows):
+            batch.append(Booking(
+                booking_code=f'BENCH{n:010d}',
+                applicant=applicants[n % len(applicants)],
+                device=devices[(n // len(self.TIME_SLOTS)) % self.DEVICE_COUNT],
+                booking_date=start_date + timedelta(days=n // per_day),
+                time_slot=self.TIME_SLOTS[n % len(self.TIME_SLOTS)],
+                purpose='基准测试',
+                status=self.STATUSES[n % len(self.STATUSES)],
+            ))
+            if len(batch) >= 5000:
+                Booking.objects.bulk_create(batch)
+                batch = []
+        if batch:
+            Booking.objects.bulk_create(batch)
+
+    def _measure(self, export):
+        begin = time.perf_counter()
+        export()
+        return time.perf_counter() - begin
+
+    def _legacy_xlsx(self):
+        """原 export_booking_ledger_csv 的实现：完整Workbook、逐个模型实例、逐格设置格式"""
+        wb = Workbook()
+        ws = wb.active
+        ws.append(['预约编号', '申请人编号', '申请人姓名', '申请人类型', '设备编号', '设备型号',
+                   '预约日期', '预约时段', '借用用途', '指导教师编号', '审批状态', '创建时间', '更新时间'])
+        for booking in Booking.objects.select_related('applicant', 'device').order_by('-create_time'):
+            create_time = booking.create_time.replace(tzinfo=None) if booking.create_time else None
+            update_time = booking.update_time.replace(tzinfo=None) if booking.update_time else None
+            ws.append([
+                booking.booking_code, booking.applicant.user_code, booking.applicant.name,
+                booking.applicant.get_user_type_display(), booking.device.device_code, booking.device.model,
+                booking.booking_date, booking.time_slot, booking.purpose or '-',
+                booking.teacher.user_code if booking.teacher else '-',
+                booking.get_status_display(), create_time, update_time,
+            ])
+            current_row = ws.max_row
+            ws.cell(row=current_row, column=7).number_format = 'yyyy-mm-dd'
+            ws.cell(row=current_row, column=12).number_format = 'yyyy-mm-dd hh:mm:ss'
+            ws.cell(row=current_row, column=13).number_format = 'yyyy-mm-dd hh:mm:ss'
+        for column in ws.columns:
+            max_length = max(len(str(cell.value)) for cell in column)
+            ws.column_dimensions[get_column_letter(column[0].column)].width = min(max_length + 2, 50)
+        wb.save(_NullFile())
+
+    def _streaming_xlsx(self):
+        from ledger.exports import booking_ledger_table
+        write_xlsx(booking_ledger_table(QueryDict()), _NullFile())
+
+    def _streaming_csv(self):
+        from ledger.exports import booking_ledger_table
+        for _ in csv_chunks(booking_ledger_table(QueryDict())):
+            pass
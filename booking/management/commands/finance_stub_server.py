@@ -0,0 +1,173 @@
+"""
+财务处模拟服务（本地联调和压测缴费确认回调）
+使用方法：
+  python manage.py finance_stub_server [--port 8001] [--callback-url URL] [--batch-size 100] [--interval 0.5]
+      启动模拟的财务处接口：接收缴费请求（设置 FINANCE_API_URL=http://127.0.0.1:8001/api/payment，系统按批发送），
+      每隔 interval 秒把收到的请求按批（{"confirmations": [...]}）回调为缴费成功。
+  python manage.py finance_stub_server --flood 10000 [--batch-size 100] [--concurrency 8] [--duplicate-ratio 0.1]
+      不启动服务，直接向回调地址并发推送缴费确认（含一定比例的重复交易，模拟财务处重试），
+      输出每秒处理的确认条数。确认针对当前数据库中待缴费的预约，会把它们改为全部审批通过，请在测试环境中运行。
+"""
+import json
+import queue
+import random
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib import request as urllib_request
+from urllib.error import HTTPError
+from django.core.management.base import BaseCommand
+from booking.models import Booking
+
+
+def post_json(url, payload, timeout=30):
+    """POST JSON，返回 (HTTP状态码, 响应JSON)"""
+    req = urllib_request.Request(
+        url, data=json.dumps(payload).encode('utf-8'), headers={'Content-Type': 'application/json'}, method='POST'
+    )
+    try:
+        with urllib_request.urlopen(req, timeout=timeout) as response:
+            status, body = response.status, response.read()
+    except HTTPError as e:
+        status, body = e.code, e.read()
+    try:
+        return status, json.loads(body or b'{}')
+    except ValueError:
+        return status, {}
+
+
+class Command(BaseCommand):
+    help = '模拟财务处：接收缴费请求并批量回调缴费确认，或向回调接口压测推送确认'
+
+    # 回调返回 409（预约状态被并发修改）时的重试次数
+    MAX_RETRIES = 3
+
+    def add_arguments(self, parser):
+        parser.add_argument('--port', type=int, default=8001, help='模拟服务监听端口')
+        parser.add_argument(
+            '--callback-url', default='http://127.0.0.1:8000/booking/finance/callback/', help='缴费确认回调地址'
+        )
+        parser.add_argument('--batch-size', type=int, default=100, help='每次回调包含的确认条数')
+        parser.add_argument('--interval', type=float, default=0.5, help='模拟服务回调的间隔（秒）')
+        parser.add_argument('--flood', type=int, default=0, help='压测：推送的确认条数（不启动服务）')
+        parser.add_argument('--concurrency', type=int, default=8, help='压测：并发回调数')
+        parser.add_argument('--duplicate-ratio', type=float, default=0.1, help='压测：重复推送的交易比例')
+
+    def handle(self, *args, **options):
+        if options['flood']:
+            self._flood(options)
+        else:
+            self._serve(options)
+
+    # ---------------------- 模拟服务 ----------------------
+
+    def _serve(self, options):
+        pending = queue.Queue()
+        stdout = self.stdout
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                try:
+                    data = json.loads(self.rfile.read(length) or b'{}')
+                except json.JSONDecodeError:
+                    data = {}
+                # 系统按批发送：{"requests": [...]}；也接受单条请求
+                requests = data.get('requests', [data]) if isinstance(data, dict) else []
+                if self.path.rstrip('/') != '/api/payment' or not requests or not all(
+                    isinstance(item, dict) and item.get('booking_code') for item in requests
+                ):
+                    self._reply(400, {'success': False, 'error': '无效的缴费请求'})
+                    return
+                transaction_ids = []
+                for item in requests:
+                    transaction_id = f'STUB-{uuid.uuid4().hex}'
+                    pending.put({'transaction_id': transaction_id, 'booking_code': item['booking_code'],
+                                 'payment_status': 'paid'})
+                    transaction_ids.append(transaction_id)
+                self._reply(200, {'success': True, 'transaction_ids': transaction_ids})
+
+            def _reply(self, status, payload):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        stop = threading.Event()
+
+        def deliver():
+            while not stop.wait(options['interval']):
+                batch = []
+                while len(batch) < options['batch_size'] and not pending.empty():
+                    batch.append(pending.get())
+                if batch:
+                    status, payload = self._post_with_retry(options['callback_url'], batch)
+                    stdout.write(f'回调 {len(batch)} 条确认：HTTP {status}，成功 {payload.get("succeeded", 0)} 条')
+
+        server = ThreadingHTTPServer(('127.0.0.1', options['port']), Handler)
+        worker = threading.Thread(target=deliver, daemon=True)
+        worker.start()
+        self.stdout.write(f'模拟财务处已启动：http://127.0.0.1:{options["port"]}/api/payment（Ctrl+C 退出）')
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            stop.set()
+            server.server_close()
+
+    def _post_with_retry(self, url, batch):
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                status, payload = post_json(url, {'confirmations': batch})
+            except OSError as e:
+                status, payload = 0, {'error': str(e)}
+            # 回调是幂等的：状态冲突或网络错误时原样重试，已处理的交易只返回首次的结果
+            if status == 200 or attempt == self.MAX_RETRIES:
+                return status, payload
+            time.sleep(0.05 * (attempt + 1))
+
+    # ---------------------- 压测 ----------------------
+
+    def _flood(self, options):
+        total = options['flood']
+        batch_size = max(options['batch_size'], 1)
+        codes = list(Booking.objects.filter(status='payment_pending').values_list('booking_code', flat=True)[:total])
+        if not codes:
+            self.stdout.write(self.style.WARNING('没有待缴费的预约，确认将全部返回"预约不存在"'))
+            codes = [f'STUB{i:08d}' for i in range(total)]
+
+        run = uuid.uuid4().hex[:8]
+        confirmations = [
+            {'transaction_id': f'STUB-{run}-{i}', 'booking_code': codes[i % len(codes)], 'payment_status': 'paid'}
+            for i in range(total)
+        ]
+        # 重复推送部分交易（财务处重试），应只返回首次处理的结果
+        duplicates = random.sample(confirmations, int(total * options['duplicate_ratio']))
+        confirmations.extend(dict(confirmation) for confirmation in duplicates)
+        random.shuffle(confirmations)
+        batches = [confirmations[i:i + batch_size] for i in range(0, len(confirmations), batch_size)]
+
+        started = time.perf_counter()
+        with ThreadPoolExecutor(max_workers=max(options['concurrency'], 1)) as executor:
+            responses = list(executor.map(lambda batch: self._post_with_retry(options['callback_url'], batch), batches))
+        elapsed = time.perf_counter() - started
+
+        failed_batches = sum(1 for status, _ in responses if status != 200)
+        results = [result for status, payload in responses if status == 200 for result in payload.get('results', [])]
+        succeeded = sum(1 for result in results if result.get('success'))
+        replayed = sum(1 for result in results if result.get('duplicate'))
+        self.stdout.write(
+            f'推送 {len(confirmations)} 条确认（{len(batches)} 次回调，每次 {batch_size} 条，并发 {options["concurrency"]}）'
+        )
+        self.stdout.write(f'成功 {succeeded} 条，重复交易 {replayed} 条，失败的回调 {failed_batches} 次')
+        self.stdout.write(self.style.SUCCESS(
+            f'耗时 {elapsed:.2f} 秒，{len(confirmations) / elapsed if elapsed else 0:.0f} 条/秒'
+        ))
@@ -0,0 +1,34 @@
+"""
+重建每日设备预约统计
+使用方法：python manage.py rebuild_rollups [--start 2025-01-01] [--end 2025-12-31]
+不指定日期时重建全部统计；统计表平时由信号增量维护，只在导入历史数据、
+直接修改数据库或怀疑统计不一致时需要执行。
+"""
+from datetime import datetime
+from django.core.management.base import BaseCommand, CommandError
+from booking.rollups import rebuild_daily_stats
+
+
+def parse_date(value):
+    try:
+        return datetime.strptime(value, '%Y-%m-%d').date()
+    except ValueError:
+        raise CommandError(f'日期格式错误：{value}，应为 YYYY-MM-DD')
+
+
+class Command(BaseCommand):
+    help = '根据预约记录重建每日设备预约统计（DailyDeviceStats）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--start', type=parse_date, help='开始日期（YYYY-MM-DD）')
+        parser.add_argument('--end', type=parse_date, help='结束日期（YYYY-MM-DD）')
+
+    def handle(self, *args, **options):
+        start_date = options['start']
+        end_date = options['end']
+        if start_date and end_date and start_date > end_date:
+            raise CommandError('开始日期不能晚于结束日期')
+
+        written = rebuild_daily_stats(start_date, end_date)
+        scope = f'{start_date or "最早"} 至 {end_date or "最晚"}'
+        self.stdout.write(self.style.SUCCESS(f'已重建 {scope} 的每日设备统计，共 {written} 行'))
@@ -0,0 +1,28 @@
+"""
+校正审批队列计数
+使用方法：python manage.py reconcile_queue_counters [--dry-run]
+计数平时由信号和批量审批代码增量维护；直接修改数据库、update() 未调用 track_bookings()
+或申请人类型变化等情况可能产生偏差，建议由定时任务每小时运行一次。
+"""
+from django.core.management.base import BaseCommand
+from booking.queue_counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = '按当前预约和用户数据校正审批队列计数（ApprovalQueueCounter）'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='只列出有偏差的计数，不修改')
+
+    def handle(self, *args, **options):
+        dry_run = options['dry_run']
+        drift = reconcile_counters(dry_run=dry_run)
+        for (queue, teacher_id), stored, actual in drift:
+            scope = f'{queue}（教师ID {teacher_id}）' if teacher_id else queue
+            self.stdout.write(f'{scope}：计数 {"无" if stored is None else stored}，实际 {actual}')
+        if not drift:
+            self.stdout.write(self.style.SUCCESS('审批队列计数与数据一致'))
+        elif dry_run:
+            self.stdout.write(self.style.WARNING(f'{len(drift)} 个计数有偏差（未修改）'))
+        else:
+            self.stdout.write(self.style.SUCCESS(f'已校正 {len(drift)} 个计数'))
@@ -3,29 +3,48 @@ from django.core.management.base import BaseCommand
 from django.utils import timezone
 from datetime import datetime, timedelta
 from booking.models import Booking
+from booking.state_machine import TransitionConflict, transition
 from devices.models import Device
 
 class Command(BaseCommand):
     help = '处理过期预约：自动取消过期未使用的预约。设备状态不再自动更新，时段可用性由预约情况决定。'
+
+    # 过期预约被并发修改时的重试次数
+    MAX_RETRIES = 3
     
     def handle(self, *args, **options):
         now = timezone.now()
         today = now.date()
         
         # 处理过期未使用的预约：自动取消
-        expired_bookings = Booking.objects.filter(
+        expired = Booking.objects.filter(
             booking_date__lt=today,
             status__in=['manager_approved', 'payment_pending']
         )
-        
+        expected = dict(expired.values_list('id', 'booking_code'))
+
+        # 预约状态机：按原状态分组条件更新，一次处理全部过期预约；
+        # 期间有预约被其他操作修改（TransitionConflict）时重新读取（.all() 不复用上次的查询结果）仍需取消的预约再试，
+        # 不因一条冲突放弃全部
+        expired_bookings = []
+        for attempt in range(self.MAX_RETRIES + 1):
+            try:
+                expired_bookings = transition(expired.all(), 'cancelled')
+                break
+            except TransitionConflict:
+                if attempt == self.MAX_RETRIES:
+                    self.stderr.write(self.style.ERROR('过期预约被并发修改，多次重试仍未完成，请稍后重新运行'))
+                    return
         for booking in expired_bookings:
-            booking.status = 'cancelled'
-            booking.save()
             self.stdout.write(
                 self.style.WARNING(
                     f'预约 {booking.booking_code} 已过期，自动取消'
                 )
             )
+        cancelled_ids = {booking.id for booking in expired_bookings}
+        for booking_id, booking_code in expected.items():
+            if booking_id not in cancelled_ids:
+                self.stdout.write(f'预约 {booking_code} 状态已被其他操作修改，跳过')
         
         self.stdout.write(self.style.SUCCESS('过期预约处理完成'))
         self.stdout.write(self.style.SUCCESS('注意：设备状态不再自动更新，时段可用性由预约情况决定'))
@@ -0,0 +1,25 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:55
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0004_remove_booking_teacher_id_booking_finance_confirmed_and_more'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='BookingCodeSequence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('day', models.DateField(unique=True, verbose_name='日期')),
+                ('last_value', models.PositiveIntegerField(default=0, verbose_name='已分配的最大序号')),
+            ],
+            options={
+                'verbose_name': '预约编号序列',
+                'verbose_name_plural': '预约编号序列',
+            },
+        ),
+    ]
@@ -0,0 +1,46 @@
+# Generated by Django 5.2.9 on 2026-10-18 02:56
+
+from django.db import migrations, models
+
+
+def cancel_duplicate_active_bookings(apps, schema_editor):
+    """添加唯一约束前，撤销同一设备同一时段的重复有效预约（保留最早提交的一条）"""
+    Booking = apps.get_model('booking', 'Booking')
+    active_statuses = ['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending']
+    seen = set()
+    duplicate_ids = []
+    for booking_id, device_id, booking_date, time_slot in Booking.objects.filter(
+        status__in=active_statuses
+    ).order_by('id').values_list('id', 'device_id', 'booking_date', 'time_slot').iterator():
+        key = (device_id, booking_date, time_slot)
+        if key in seen:
+            duplicate_ids.append(booking_id)
+        else:
+            seen.add(key)
+    if duplicate_ids:
+        Booking.objects.filter(id__in=duplicate_ids).update(status='cancelled')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0005_booking_code_sequence'),
+        ('devices', '0003_alter_device_status'),
+        ('user', '0003_remove_userinfo_advisor_userinfo_advisors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['device', 'booking_date', 'time_slot', 'status'], name='booking_conflict_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['applicant', '-create_time'], name='booking_applicant_ctime_idx'),
+        ),
+        migrations.RunPython(cancel_duplicate_active_bookings, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name='booking',
+            constraint=models.UniqueConstraint(condition=models.Q(('status__in', ['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending'])), fields=('device', 'booking_date', 'time_slot'), name='unique_active_booking_slot'),
+        ),
+    ]
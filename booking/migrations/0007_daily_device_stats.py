@@ -0,0 +1,80 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:14
+
+import django.db.models.deletion
+from decimal import Decimal
+from django.db import migrations, models
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, When
+
+
+def backfill_daily_stats(apps, schema_editor):
+    """按已有预约生成每日设备统计（与 booking.rollups.rebuild_daily_stats 口径一致）"""
+    Booking = apps.get_model('booking', 'Booking')
+    DailyDeviceStats = apps.get_model('booking', 'DailyDeviceStats')
+    approved = Q(status='manager_approved')
+    rows = Booking.objects.values('booking_date', 'device_id', 'applicant__user_type').annotate(
+        total=Count('id'),
+        approved=Count('id', filter=approved),
+        in_progress=Count('id', filter=Q(status__in=['admin_approved', 'payment_pending'])),
+        pending=Count('id', filter=Q(status__in=['teacher_pending', 'pending'])),
+        rejected=Count('id', filter=Q(status__in=['teacher_rejected', 'admin_rejected', 'manager_rejected'])),
+        cancelled=Count('id', filter=Q(status='cancelled')),
+        revenue=Sum(
+            Case(
+                When(applicant__user_type='external', then=F('device__price_external')),
+                default=Decimal('0'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            filter=approved,
+        ),
+    ).order_by()
+    DailyDeviceStats.objects.bulk_create([
+        DailyDeviceStats(
+            date=row['booking_date'],
+            device_id=row['device_id'],
+            user_type=row['applicant__user_type'],
+            total_count=row['total'],
+            approved_count=row['approved'],
+            in_progress_count=row['in_progress'],
+            pending_count=row['pending'],
+            rejected_count=row['rejected'],
+            cancelled_count=row['cancelled'],
+            usage_hours=row['approved'] * 2,
+            revenue=row['revenue'] or Decimal('0'),
+        )
+        for row in rows.iterator()
+    ], batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0006_booking_conflict_indexes'),
+        ('devices', '0003_alter_device_status'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='DailyDeviceStats',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('date', models.DateField(verbose_name='日期')),
+                ('user_type', models.CharField(choices=[('student', '校内学生'), ('teacher', '校内教师'), ('external', '校外人员')], max_length=10, verbose_name='申请人类型')),
+                ('total_count', models.PositiveIntegerField(default=0, verbose_name='预约总数')),
+                ('approved_count', models.PositiveIntegerField(default=0, verbose_name='全部审批通过')),
+                ('in_progress_count', models.PositiveIntegerField(default=0, verbose_name='审批中（待负责人审批/待缴费）')),
+                ('pending_count', models.PositiveIntegerField(default=0, verbose_name='待审批（待指导教师/管理员审批）')),
+                ('rejected_count', models.PositiveIntegerField(default=0, verbose_name='已拒绝')),
+                ('cancelled_count', models.PositiveIntegerField(default=0, verbose_name='已撤销')),
+                ('usage_hours', models.PositiveIntegerField(default=0, verbose_name='使用时长（小时）')),
+                ('revenue', models.DecimalField(decimal_places=2, default=0, max_digits=12, verbose_name='校外收入（元）')),
+                ('device', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='devices.device', verbose_name='设备')),
+            ],
+            options={
+                'verbose_name': '每日设备预约统计',
+                'verbose_name_plural': '每日设备预约统计',
+                'indexes': [models.Index(fields=['date'], name='daily_stats_date_idx')],
+                'constraints': [models.UniqueConstraint(fields=('date', 'device', 'user_type'), name='unique_daily_device_stats')],
+            },
+        ),
+        migrations.RunPython(backfill_daily_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,19 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:41
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0007_daily_device_stats'),
+        ('devices', '0003_alter_device_status'),
+        ('user', '0003_remove_userinfo_advisor_userinfo_advisors'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='booking',
+            index=models.Index(fields=['-create_time', '-id'], name='booking_ctime_id_idx'),
+        ),
+    ]
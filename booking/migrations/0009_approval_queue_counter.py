@@ -0,0 +1,52 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:58
+
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def backfill_queue_counters(apps, schema_editor):
+    """按已有数据生成审批队列计数（与 booking.queue_counters.actual_counts 口径一致）"""
+    Booking = apps.get_model('booking', 'Booking')
+    UserInfo = apps.get_model('user', 'UserInfo')
+    ApprovalQueueCounter = apps.get_model('booking', 'ApprovalQueueCounter')
+    counters = [
+        ApprovalQueueCounter(queue='teacher_pending', teacher_id=row['teacher_id'], count=row['total'])
+        for row in Booking.objects.filter(status='teacher_pending', teacher__isnull=False)
+        .values('teacher_id').annotate(total=Count('id')).order_by()
+    ]
+    counters += [
+        ApprovalQueueCounter(queue='pending', count=Booking.objects.filter(status='pending').count()),
+        ApprovalQueueCounter(queue='admin_approved', count=Booking.objects.filter(
+            status='admin_approved', applicant__user_type='external'
+        ).count()),
+        ApprovalQueueCounter(queue='registration', count=UserInfo.objects.filter(approval_status='pending').count()),
+    ]
+    ApprovalQueueCounter.objects.bulk_create(counters, batch_size=1000)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0008_keyset_pagination_indexes'),
+        ('user', '0003_remove_userinfo_advisor_userinfo_advisors'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ApprovalQueueCounter',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('queue', models.CharField(choices=[('teacher_pending', '待指导教师审批（按教师）'), ('pending', '待管理员审批'), ('admin_approved', '待负责人审批'), ('registration', '待审核注册')], max_length=20, verbose_name='审批队列')),
+                ('count', models.IntegerField(default=0, verbose_name='待处理数量')),
+                ('updated_at', models.DateTimeField(auto_now=True, verbose_name='更新时间')),
+                ('teacher', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, related_name='approval_queue_counters', to='user.userinfo', verbose_name='指导教师')),
+            ],
+            options={
+                'verbose_name': '审批队列计数',
+                'verbose_name_plural': '审批队列计数',
+                'constraints': [models.UniqueConstraint(condition=models.Q(('teacher__isnull', True)), fields=('queue',), name='unique_approval_queue'), models.UniqueConstraint(condition=models.Q(('teacher__isnull', False)), fields=('queue', 'teacher'), name='unique_teacher_approval_queue')],
+            },
+        ),
+        migrations.RunPython(backfill_queue_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,29 @@
+# Generated by Django 5.2.9 on 2026-10-18 04:09
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('booking', '0009_approval_queue_counter'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='FinanceCallback',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('transaction_id', models.CharField(max_length=64, unique=True, verbose_name='财务交易号')),
+                ('booking_code', models.CharField(max_length=20, verbose_name='预约编号')),
+                ('payment_status', models.CharField(max_length=20, verbose_name='回调缴费状态')),
+                ('claim_token', models.CharField(max_length=32, verbose_name='处理批次')),
+                ('response', models.JSONField(default=dict, verbose_name='处理结果')),
+                ('received_at', models.DateTimeField(auto_now_add=True, verbose_name='接收时间')),
+            ],
+            options={
+                'verbose_name': '财务回调记录',
+                'verbose_name_plural': '财务回调记录',
+            },
+        ),
+    ]
@@ -4,6 +4,9 @@ from user.models import UserInfo
 
 from devices.models import Device
 
+# 占用时段的有效状态（待审核或已通过的预约视为占用）
+ACTIVE_BOOKING_STATUSES = ['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending']
+
 # 预约申请模型
 class Booking(models.Model):
     # 审批状态（适配多级审批）
@@ -18,7 +21,8 @@ class Booking(models.Model):
         ('manager_rejected', '负责人已拒绝'),
         ('cancelled', '用户已撤销'),
     )
-    
+    ACTIVE_STATUSES = ACTIVE_BOOKING_STATUSES
+
     booking_code = models.CharField(max_length=20, unique=True, verbose_name='预约编号')
     applicant = models.ForeignKey(UserInfo, on_delete=models.CASCADE, verbose_name='申请人')
     device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name='预约设备')
@@ -40,6 +44,22 @@ class Booking(models.Model):
     class Meta:
         verbose_name = '预约申请'
         verbose_name_plural = '预约申请'
+        indexes = [
+            # 冲突检查热点：按（设备, 日期, 时段, 状态）过滤
+            models.Index(fields=['device', 'booking_date', 'time_slot', 'status'], name='booking_conflict_idx'),
+            # 我的预约：按申请人过滤、按创建时间倒序
+            models.Index(fields=['applicant', '-create_time'], name='booking_applicant_ctime_idx'),
+            # 预约台账游标分页：按 (创建时间, id) 倒序定位
+            models.Index(fields=['-create_time', '-id'], name='booking_ctime_id_idx'),
+        ]
+        constraints = [
+            # 同一设备同一时段只能有一条有效预约
+            models.UniqueConstraint(
+                fields=['device', 'booking_date', 'time_slot'],
+                condition=models.Q(status__in=ACTIVE_BOOKING_STATUSES),
+                name='unique_active_booking_slot',
+            ),
+        ]
 
 # 审批记录模型（记录每一步审批操作）
 class ApprovalRecord(models.Model):
@@ -56,4 +76,93 @@ class ApprovalRecord(models.Model):
 
     class Meta:
         verbose_name = '审批记录'
-        verbose_name_plural = '审批记录'
\ No newline at end of file
+        verbose_name_plural = '审批记录'
+
+# 预约编号序列（每天一行，原子递增分配序号）
+class BookingCodeSequence(models.Model):
+    day = models.DateField(unique=True, verbose_name='日期')
+    last_value = models.PositiveIntegerField(default=0, verbose_name='已分配的最大序号')
+
+    class Meta:
+        verbose_name = '预约编号序列'
+        verbose_name_plural = '预约编号序列'
+
+    def __str__(self):
+        return f"{self.day} - {self.last_value}"
+
+# 每日设备预约统计（按 日期 × 设备 × 申请人类型 汇总，由信号增量维护，供报表和看板读取）
+class DailyDeviceStats(models.Model):
+    date = models.DateField(verbose_name='日期')
+    device = models.ForeignKey(Device, on_delete=models.CASCADE, verbose_name='设备')
+    user_type = models.CharField(max_length=10, choices=UserInfo.USER_TYPE_CHOICES, verbose_name='申请人类型')
+    total_count = models.PositiveIntegerField(default=0, verbose_name='预约总数')
+    approved_count = models.PositiveIntegerField(default=0, verbose_name='全部审批通过')
+    in_progress_count = models.PositiveIntegerField(default=0, verbose_name='审批中（待负责人审批/待缴费）')
+    pending_count = models.PositiveIntegerField(default=0, verbose_name='待审批（待指导教师/管理员审批）')
+    rejected_count = models.PositiveIntegerField(default=0, verbose_name='已拒绝')
+    cancelled_count = models.PositiveIntegerField(default=0, verbose_name='已撤销')
+    usage_hours = models.PositiveIntegerField(default=0, verbose_name='使用时长（小时）')
+    revenue = models.DecimalField(max_digits=12, decimal_places=2, default=0, verbose_name='校外收入（元）')
+
+    class Meta:
+        verbose_name = '每日设备预约统计'
+        verbose_name_plural = '每日设备预约统计'
+        constraints = [
+            models.UniqueConstraint(fields=['date', 'device', 'user_type'], name='unique_daily_device_stats'),
+        ]
+        indexes = [
+            models.Index(fields=['date'], name='daily_stats_date_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.date} - {self.device_id} - {self.user_type}"
+
+
+# 审批队列计数（各首页显示的待处理数量，由 booking.queue_counters 维护）
+class ApprovalQueueCounter(models.Model):
+    QUEUE_CHOICES = (
+        ('teacher_pending', '待指导教师审批（按教师）'),
+        ('pending', '待管理员审批'),
+        ('admin_approved', '待负责人审批'),
+        ('registration', '待审核注册'),
+    )
+    queue = models.CharField(max_length=20, choices=QUEUE_CHOICES, verbose_name='审批队列')
+    teacher = models.ForeignKey(
+        UserInfo, on_delete=models.CASCADE, null=True, blank=True,
+        related_name='approval_queue_counters', verbose_name='指导教师'
+    )
+    count = models.IntegerField(default=0, verbose_name='待处理数量')
+    updated_at = models.DateTimeField(auto_now=True, verbose_name='更新时间')
+
+    class Meta:
+        verbose_name = '审批队列计数'
+        verbose_name_plural = '审批队列计数'
+        constraints = [
+            models.UniqueConstraint(
+                fields=['queue'], condition=models.Q(teacher__isnull=True), name='unique_approval_queue'
+            ),
+            models.UniqueConstraint(
+                fields=['queue', 'teacher'], condition=models.Q(teacher__isnull=False),
+                name='unique_teacher_approval_queue'
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.get_queue_display()} - {self.teacher_id or '全部'}：{self.count}"
+
+
+# 财务处缴费回调记录（幂等键：财务处交易号，同一交易重复回调时直接返回首次处理的结果，由 booking.finance_integration 维护）
+class FinanceCallback(models.Model):
+    transaction_id = models.CharField(max_length=64, unique=True, verbose_name='财务交易号')
+    booking_code = models.CharField(max_length=20, verbose_name='预约编号')
+    payment_status = models.CharField(max_length=20, verbose_name='回调缴费状态')
+    claim_token = models.CharField(max_length=32, verbose_name='处理批次')
+    response = models.JSONField(default=dict, verbose_name='处理结果')
+    received_at = models.DateTimeField(auto_now_add=True, verbose_name='接收时间')
+
+    class Meta:
+        verbose_name = '财务回调记录'
+        verbose_name_plural = '财务回调记录'
+
+    def __str__(self):
+        return f"{self.transaction_id} - {self.booking_code}：{self.payment_status}"
@@ -0,0 +1,73 @@
+"""设备时段占用索引：一次查询预约记录，在内存中按（设备, 日期, 时段）分桶"""
+from datetime import timedelta
+from .models import Booking
+
+
+class OccupancyIndex:
+    """设备×日期×时段占用索引
+
+    用法：
+        index = OccupancyIndex.build(devices, start_date, end_date)
+        booking = index.get(device.id, some_date, '08:00-10:00')
+
+    同一时段存在多条有效预约时，保留id最小的一条（与原先 .first() 的结果一致），
+    其余记录可通过 bookings_for() 获取。
+    """
+
+    def __init__(self, bookings=()):
+        self._buckets = {}
+        for booking in bookings:
+            key = (booking.device_id, booking.booking_date, booking.time_slot)
+            self._buckets.setdefault(key, []).append(booking)
+
+    @classmethod
+    def build(cls, devices=None, start_date=None, end_date=None, statuses=None, select_related=('applicant',)):
+        """查询指定设备和日期范围内的有效预约并建立索引（只执行一次SQL查询）
+
+        devices: 设备对象/设备ID列表或查询集，None表示所有设备
+        start_date/end_date: 日期范围（含两端），None表示不限
+        statuses: 视为占用的状态列表，默认 Booking.ACTIVE_STATUSES
+        """
+        bookings = Booking.objects.filter(
+            status__in=statuses or Booking.ACTIVE_STATUSES
+        )
+        if devices is not None:
+            device_ids = [getattr(device, 'pk', device) for device in devices]
+            if not device_ids:
+                return cls()
+            bookings = bookings.filter(device_id__in=device_ids)
+        if start_date is not None:
+            bookings = bookings.filter(booking_date__gte=start_date)
+        if end_date is not None:
+            bookings = bookings.filter(booking_date__lte=end_date)
+        if select_related:
+            bookings = bookings.select_related(*select_related)
+        return cls(bookings.order_by('id'))
+
+    @classmethod
+    def for_week(cls, devices=None, start_date=None, days=7, **kwargs):
+        """从 start_date 开始连续 days 天的占用索引"""
+        return cls.build(devices, start_date, start_date + timedelta(days=days - 1), **kwargs)
+
+    def get(self, device_id, booking_date, time_slot):
+        """返回占用该时段的预约（无则返回None）"""
+        bucket = self._buckets.get((device_id, booking_date, time_slot))
+        return bucket[0] if bucket else None
+
+    def bookings_for(self, device_id, booking_date, time_slot):
+        """返回占用该时段的全部有效预约"""
+        return list(self._buckets.get((device_id, booking_date, time_slot), ()))
+
+    def is_occupied(self, device_id, booking_date, time_slot):
+        """该时段是否已被占用"""
+        return (device_id, booking_date, time_slot) in self._buckets
+
+    def occupied_slots(self, device_id, booking_date):
+        """设备在某日已被占用的时段集合"""
+        return {
+            slot for (d_id, b_date, slot) in self._buckets
+            if d_id == device_id and b_date == booking_date
+        }
+
+    def __len__(self):
+        return sum(len(bucket) for bucket in self._buckets.values())
@@ -0,0 +1,204 @@
+"""
+审批队列计数（ApprovalQueueCounter）
+
+首页和用户管理页显示的待处理数量不再每次 COUNT，而是读取计数表：
+- teacher_pending：每位指导教师待审批的学生预约；
+- pending：待管理员审批的预约；
+- admin_approved：待负责人审批的校外人员预约；
+- registration：待审核的用户注册。
+
+预约/用户保存、删除时由信号按状态变化增减计数；update() 批量修改状态的代码调用 track_bookings()。
+计数与数据在同一事务中修改并清除缓存，事务提交后再次清除；读取时优先使用缓存（事务中修改过的计数提交前不写入缓存）。
+直接修改数据库等情况可能导致计数偏差，由 python manage.py reconcile_queue_counters 定期校正。
+"""
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q
+from django.utils import timezone
+from user.models import UserInfo
+from .models import ApprovalQueueCounter, Booking
+
+TEACHER_QUEUE = 'teacher_pending'
+ADMIN_QUEUE = 'pending'
+MANAGER_QUEUE = 'admin_approved'
+REGISTRATION_QUEUE = 'registration'
+
+QUEUE_CACHE_TIMEOUT = 3600
+QUEUE_CACHE_PREFIX = 'booking:queue_counter'
+
+
+def booking_queues(status, teacher_id, user_type):
+    """一条预约所在的审批队列：[(队列, 教师ID)]"""
+    if status == 'teacher_pending':
+        return [(TEACHER_QUEUE, teacher_id)] if teacher_id else []
+    if status == 'pending':
+        return [(ADMIN_QUEUE, None)]
+    if status == 'admin_approved' and user_type == 'external':
+        return [(MANAGER_QUEUE, None)]
+    return []
+
+
+def registration_queues(approval_status):
+    return [(REGISTRATION_QUEUE, None)] if approval_status == 'pending' else []
+
+
+def _cache_key(key):
+    queue, teacher_id = key
+    return f'{QUEUE_CACHE_PREFIX}:{queue}:{teacher_id or 0}'
+
+
+def _counter(key):
+    queue, teacher_id = key
+    return ApprovalQueueCounter.objects.filter(queue=queue, teacher_id=teacher_id)
+
+
+def actual_counts(keys=None):
+    """按当前数据统计各队列的数量（keys 为 None 时统计全部，包含数量为0的全局队列）"""
+    teacher_ids = None
+    queues = {TEACHER_QUEUE, ADMIN_QUEUE, MANAGER_QUEUE, REGISTRATION_QUEUE}
+    if keys is not None:
+        keys = list(keys)
+        queues = {queue for queue, _ in keys}
+        teacher_ids = [teacher_id for queue, teacher_id in keys if queue == TEACHER_QUEUE]
+
+    counts = {}
+    if TEACHER_QUEUE in queues:
+        bookings = Booking.objects.filter(status='teacher_pending', teacher__isnull=False)
+        if teacher_ids is not None:
+            bookings = bookings.filter(teacher_id__in=teacher_ids)
+            counts.update({(TEACHER_QUEUE, teacher_id): 0 for teacher_id in teacher_ids})
+        for row in bookings.values('teacher_id').annotate(total=Count('id')).order_by():
+            counts[(TEACHER_QUEUE, row['teacher_id'])] = row['total']
+    if ADMIN_QUEUE in queues:
+        counts[(ADMIN_QUEUE, None)] = Booking.objects.filter(status='pending').count()
+    if MANAGER_QUEUE in queues:
+        counts[(MANAGER_QUEUE, None)] = Booking.objects.filter(
+            status='admin_approved', applicant__user_type='external'
+        ).count()
+    if REGISTRATION_QUEUE in queues:
+        counts[(REGISTRATION_QUEUE, None)] = UserInfo.objects.filter(approval_status='pending').count()
+    return counts
+
+
+def _create_counters(keys):
+    """计数行不存在时按当前数据创建（并发创建时以已存在的行为准），返回统计结果"""
+    counts = actual_counts(keys)
+    for key, total in counts.items():
+        queue, teacher_id = key
+        try:
+            with transaction.atomic():
+                ApprovalQueueCounter.objects.create(queue=queue, teacher_id=teacher_id, count=total)
+        except IntegrityError:
+            pass
+    return counts
+
+
+def _dirty_keys():
+    """当前事务中修改过的计数：事务结束前读到的是未提交的值，不写入缓存"""
+    connection = transaction.get_connection()
+    if not connection.in_atomic_block:
+        # 上一个事务已提交或回滚
+        connection.queue_counters_dirty = set()
+    elif not hasattr(connection, 'queue_counters_dirty'):
+        connection.queue_counters_dirty = set()
+    return connection.queue_counters_dirty
+
+
+def _clear_cache(keys):
+    keys = list(keys)
+    dirty = _dirty_keys()
+    dirty.update(keys)
+    cache_keys = [_cache_key(key) for key in keys]
+    cache.delete_many(cache_keys)
+
+    def committed():
+        dirty.difference_update(keys)
+        cache.delete_many(cache_keys)
+    transaction.on_commit(committed)
+
+
+def apply_deltas(deltas):
+    """按 {(队列, 教师ID): 增量} 修改计数（调用方修改数据之后、同一事务中调用）"""
+    deltas = {key: delta for key, delta in deltas.items() if delta}
+    if not deltas:
+        return
+    now = timezone.now()
+    missing = [
+        key for key, delta in deltas.items()
+        if not _counter(key).update(count=F('count') + delta, updated_at=now)
+    ]
+    if missing:
+        # 新计数行直接按当前数据统计，已包含本次变化
+        _create_counters(missing)
+    _clear_cache(deltas)
+
+
+def track_bookings(changes):
+    """update() 批量修改预约状态后调用：changes 为 [(原状态, 新状态, 教师ID, 申请人类型)]"""
+    deltas = {}
+    for old_status, new_status, teacher_id, user_type in changes:
+        for key in booking_queues(old_status, teacher_id, user_type):
+            deltas[key] = deltas.get(key, 0) - 1
+        for key in booking_queues(new_status, teacher_id, user_type):
+            deltas[key] = deltas.get(key, 0) + 1
+    apply_deltas(deltas)
+
+
+def queue_counts(keys):
+    """读取计数：{(队列, 教师ID): 数量}，优先使用缓存"""
+    keys = list(dict.fromkeys(keys))
+    cache_keys = {key: _cache_key(key) for key in keys}
+    cached = cache.get_many(list(cache_keys.values()))
+    counts = {key: cached[cache_key] for key, cache_key in cache_keys.items() if cache_key in cached}
+    missing = [key for key in keys if key not in counts]
+    if missing:
+        for key in missing:
+            counts[key] = None
+        teacher_ids = [teacher_id for queue, teacher_id in missing if queue == TEACHER_QUEUE]
+        rows = ApprovalQueueCounter.objects.filter(
+            Q(teacher__isnull=True) | Q(teacher_id__in=teacher_ids), queue__in={queue for queue, _ in missing}
+        )
+        for queue, teacher_id, total in rows.values_list('queue', 'teacher_id', 'count'):
+            if counts.get((queue, teacher_id), 0) is None:
+                counts[(queue, teacher_id)] = total
+        uncreated = [key for key in missing if counts[key] is None]
+        if uncreated:
+            counts.update(_create_counters(uncreated))
+        dirty = _dirty_keys()
+        cache.set_many(
+            {cache_keys[key]: counts[key] for key in missing if key not in dirty}, QUEUE_CACHE_TIMEOUT
+        )
+    return {key: max(counts[key], 0) for key in keys}
+
+
+def queue_count(queue, teacher=None):
+    """单个队列的待处理数量，teacher 为 UserInfo 或其ID（仅 teacher_pending 队列）"""
+    teacher_id = getattr(teacher, 'pk', teacher)
+    key = (queue, teacher_id if queue == TEACHER_QUEUE else None)
+    return queue_counts([key])[key]
+
+
+def reconcile_counters(dry_run=False):
+    """按当前数据校正全部计数，返回有偏差的队列：[((队列, 教师ID), 计数值, 实际值)]"""
+    with transaction.atomic():
+        stored = {
+            (queue, teacher_id): total
+            for queue, teacher_id, total in ApprovalQueueCounter.objects.select_for_update()
+            .values_list('queue', 'teacher_id', 'count')
+        }
+        actual = actual_counts()
+        for key in stored:
+            actual.setdefault(key, 0)
+        drift = [(key, stored.get(key), total) for key, total in actual.items() if stored.get(key) != total]
+        if dry_run or not drift:
+            return drift
+
+        now = timezone.now()
+        for key, old, total in drift:
+            if old is None:
+                queue, teacher_id = key
+                ApprovalQueueCounter.objects.create(queue=queue, teacher_id=teacher_id, count=total)
+            else:
+                _counter(key).update(count=total, updated_at=now)
+        _clear_cache([key for key, _, _ in drift])
+    return drift
@@ -0,0 +1,92 @@
+"""预约占位服务：在同一个事务中完成冲突检查、取消可覆盖的校外预约和插入新预约
+
+并发提交同一设备同一时段时保证只有一个请求成功：
+- PostgreSQL/MySQL 等支持行锁的数据库：用 select_for_update() 锁住设备行，
+  同一设备的预约请求在数据库层面排队；
+- SQLite 不支持行锁：进程内用互斥锁串行化写路径，跨进程仍由数据库写锁
+  和“有效预约唯一约束”兜底。
+"""
+import threading
+from contextlib import nullcontext
+from decimal import Decimal
+from django.db import IntegrityError, connection, transaction
+from devices.models import Device
+from .availability import DayAvailability
+from .models import Booking
+from .preemption import PreemptionSummary, external_conflicts, preempt_external_bookings
+from .state_machine import check_initial_status
+from .utils import generate_booking_code
+
+# SQLite 下的串行写路径
+_sqlite_write_lock = threading.Lock()
+
+
+class SlotUnavailable(Exception):
+    """该时段已被占用（或在并发提交中被其他请求抢先）"""
+
+
+class Reservation:
+    """占位结果：新建的预约和被覆盖取消的校外预约"""
+
+    def __init__(self, booking, preempted=None):
+        self.booking = booking
+        self.preempted = preempted or PreemptionSummary()
+
+
+def _serialized_write_path():
+    """数据库不支持行锁时返回进程内互斥锁，否则返回空上下文"""
+    if connection.features.has_select_for_update:
+        return nullcontext()
+    return _sqlite_write_lock
+
+
+def _slot_taken(device, booking_date, time_slot):
+    """（设备, 日期, 时段）上是否已有有效预约（违反 unique_active_booking_slot 的唯一原因）"""
+    return Booking.objects.filter(
+        device=device, booking_date=booking_date, time_slot=time_slot, status__in=Booking.ACTIVE_STATUSES
+    ).exists()
+
+
+def reserve_slot(applicant, device, booking_date, time_slot, purpose=None, teacher=None,
+                 status='pending', payment_amount=Decimal('0')):
+    """原子地占用（设备, 日期, 时段）并创建预约
+
+    校内人员可覆盖只被校外人员占用的时段（被覆盖的预约自动取消并退款95%）。
+    自动覆盖不是审批操作，不写审批记录（提交申请的用户不是审批人）。
+    时段不可用时抛出 SlotUnavailable，事务整体回滚，不会留下半取消的记录；
+    status 不是新建预约允许的状态时抛出 InvalidTransition。
+    """
+    check_initial_status(status)
+    with _serialized_write_path():
+        try:
+            with transaction.atomic():
+                if connection.features.has_select_for_update:
+                    # 锁住设备行，同一设备的预约请求排队执行检查和插入
+                    Device.objects.select_for_update().filter(pk=device.pk).first()
+
+                availability = DayAvailability.for_device(device, booking_date)
+                if not availability.is_available(time_slot, applicant.user_type):
+                    raise SlotUnavailable(time_slot)
+
+                preempted = None
+                if availability.is_occupied(time_slot):
+                    preempted = preempt_external_bookings(external_conflicts(device, booking_date, time_slot))
+
+                booking = Booking.objects.create(
+                    booking_code=generate_booking_code(),
+                    applicant=applicant,
+                    device=device,
+                    booking_date=booking_date,
+                    time_slot=time_slot,
+                    purpose=purpose,
+                    teacher=teacher,
+                    status=status,
+                    payment_amount=payment_amount
+                )
+        except IntegrityError:
+            # 有效预约唯一约束：跨进程并发时后到者在插入时失败；
+            # 其他完整性错误（如预约编号重复）不是时段冲突，原样抛出
+            if _slot_taken(device, booking_date, time_slot):
+                raise SlotUnavailable(time_slot)
+            raise
+    return Reservation(booking, preempted)
@@ -0,0 +1,172 @@
+"""
+每日设备预约统计（DailyDeviceStats）
+
+按（日期, 设备, 申请人类型）汇总各状态的预约数、使用时长和校外收入。
+预约变化时由信号只重新汇总受影响的（日期, 设备）单元格，报表和看板读取汇总表，
+一年的统计最多读取 365 × 设备数 × 3 行，与预约总数无关。
+历史数据或汇总表损坏时用 python manage.py rebuild_rollups 重建。
+"""
+from datetime import timedelta
+from decimal import Decimal
+from django.db import transaction
+from django.db.models import Case, Count, DecimalField, F, Q, Sum, Value, When
+from user.models import UserInfo
+from .models import Booking, DailyDeviceStats
+
+# 状态分组（报表中的 通过 / 拒绝 / 待处理 口径与此一致）
+APPROVED_STATUS = 'manager_approved'
+IN_PROGRESS_STATUSES = ['admin_approved', 'payment_pending']
+PENDING_STATUSES = ['teacher_pending', 'pending']
+REJECTED_STATUSES = ['teacher_rejected', 'admin_rejected', 'manager_rejected']
+CANCELLED_STATUS = 'cancelled'
+
+# 每个通过的预约按2小时计入使用时长
+HOURS_PER_BOOKING = 2
+
+USER_TYPES = [code for code, _ in UserInfo.USER_TYPE_CHOICES]
+COUNT_FIELDS = [
+    'total_count', 'approved_count', 'in_progress_count',
+    'pending_count', 'rejected_count', 'cancelled_count',
+]
+UPDATE_FIELDS = COUNT_FIELDS + ['usage_hours', 'revenue']
+
+
+def _aggregate(bookings):
+    """按（日期, 设备, 申请人类型）分组汇总（1次查询）"""
+    approved = Q(status=APPROVED_STATUS)
+    return bookings.values('booking_date', 'device_id', 'applicant__user_type').annotate(
+        total_count=Count('id'),
+        approved_count=Count('id', filter=approved),
+        in_progress_count=Count('id', filter=Q(status__in=IN_PROGRESS_STATUSES)),
+        pending_count=Count('id', filter=Q(status__in=PENDING_STATUSES)),
+        rejected_count=Count('id', filter=Q(status__in=REJECTED_STATUSES)),
+        cancelled_count=Count('id', filter=Q(status=CANCELLED_STATUS)),
+        revenue=Sum(
+            Case(
+                When(applicant__user_type='external', then=F('device__price_external')),
+                default=Decimal('0'),
+                output_field=DecimalField(max_digits=12, decimal_places=2),
+            ),
+            filter=approved,
+        ),
+    ).order_by()
+
+
+def _to_stats(row):
+    return DailyDeviceStats(
+        date=row['booking_date'],
+        device_id=row['device_id'],
+        user_type=row['applicant__user_type'],
+        usage_hours=row['approved_count'] * HOURS_PER_BOOKING,
+        revenue=row['revenue'] or Decimal('0'),
+        **{field: row[field] for field in COUNT_FIELDS},
+    )
+
+
+def refresh_daily_stats(dates, device_ids=None):
+    """重新汇总这些日期（及设备）的统计
+
+    dates: 受影响的预约日期
+    device_ids: 受影响的设备ID；为None时重新汇总这些日期的所有设备
+    固定 2 次查询（汇总 + 写入），device_ids 为None时另加 1 次清零。
+    """
+    dates = sorted({day for day in dates if day is not None})
+    if not dates:
+        return
+    bookings = Booking.objects.filter(booking_date__in=dates)
+    if device_ids is not None:
+        device_ids = sorted({device_id for device_id in device_ids if device_id is not None})
+        if not device_ids:
+            return
+        bookings = bookings.filter(device_id__in=device_ids)
+
+    rows = {}
+    if device_ids is not None:
+        # 没有预约了的单元格写入0
+        for day in dates:
+            for device_id in device_ids:
+                for user_type in USER_TYPES:
+                    rows[day, device_id, user_type] = DailyDeviceStats(
+                        date=day, device_id=device_id, user_type=user_type
+                    )
+    else:
+        DailyDeviceStats.objects.filter(date__in=dates).update(
+            usage_hours=0, revenue=Decimal('0'), **{field: 0 for field in COUNT_FIELDS}
+        )
+    for row in _aggregate(bookings):
+        stats = _to_stats(row)
+        rows[stats.date, stats.device_id, stats.user_type] = stats
+
+    if rows:
+        DailyDeviceStats.objects.bulk_create(
+            rows.values(),
+            update_conflicts=True,
+            unique_fields=['date', 'device', 'user_type'],
+            update_fields=UPDATE_FIELDS,
+        )
+
+
+def reprice_device(device):
+    """设备校外价格变化后，按新价格重算该设备的校外收入（1次更新）"""
+    DailyDeviceStats.objects.filter(device=device, user_type='external').update(
+        revenue=F('approved_count') * device.price_external
+    )
+
+
+def reprice_devices(devices):
+    """批量修改设备校外价格后，按各自的新价格重算校外收入（1次更新）"""
+    devices = list(devices)
+    if not devices:
+        return
+    DailyDeviceStats.objects.filter(device__in=[device.pk for device in devices], user_type='external').update(
+        revenue=F('approved_count') * Case(
+            *[When(device_id=device.pk, then=Value(device.price_external)) for device in devices],
+            output_field=DecimalField(max_digits=10, decimal_places=2),
+        )
+    )
+
+
+def refresh_applicant(applicant_id):
+    """申请人的用户类型变化后，重新汇总其预约所在的单元格"""
+    cells = Booking.objects.filter(applicant_id=applicant_id).values_list('booking_date', 'device_id').distinct()
+    by_date = {}
+    for day, device_id in cells:
+        by_date.setdefault(day, set()).add(device_id)
+    for day, device_ids in by_date.items():
+        refresh_daily_stats([day], device_ids)
+
+
+def rebuild_daily_stats(start_date=None, end_date=None, chunk_days=31):
+    """重建统计表（可限定日期范围），按 chunk_days 天分段处理，返回写入的行数"""
+    if start_date is None and end_date is None:
+        DailyDeviceStats.objects.all().delete()
+    bounds = Booking.objects.order_by('booking_date').values_list('booking_date', flat=True)
+    start_date = start_date or bounds.first()
+    end_date = end_date or bounds.last()
+    if start_date is None or end_date is None or start_date > end_date:
+        # 范围内没有预约：只清空
+        stale = DailyDeviceStats.objects.all()
+        if start_date is not None:
+            stale = stale.filter(date__gte=start_date)
+        if end_date is not None:
+            stale = stale.filter(date__lte=end_date)
+        stale.delete()
+        return 0
+
+    written = 0
+    chunk_start = start_date
+    while chunk_start <= end_date:
+        chunk_end = min(chunk_start + timedelta(days=chunk_days - 1), end_date)
+        with transaction.atomic():
+            DailyDeviceStats.objects.filter(date__gte=chunk_start, date__lte=chunk_end).delete()
+            rows = [
+                _to_stats(row)
+                for row in _aggregate(Booking.objects.filter(
+                    booking_date__gte=chunk_start, booking_date__lte=chunk_end
+                ))
+            ]
+            DailyDeviceStats.objects.bulk_create(rows, batch_size=1000)
+        written += len(rows)
+        chunk_start = chunk_end + timedelta(days=1)
+    return written
+
@@ -0,0 +1,144 @@
+"""预约相关信号处理"""
+from django.db.models.signals import post_init, post_save, post_delete
+from django.dispatch import Signal, receiver
+from devices.models import Device
+from user.models import UserInfo
+from .models import Booking
+from .availability import invalidate_availability
+from .rollups import refresh_daily_stats, reprice_device, refresh_applicant
+from .queue_counters import apply_deltas, booking_queues, registration_queues
+
+# 预约数据发生变化（包括 update() 批量更新，不会触发 post_save）。
+# 参数 dates：受影响的预约日期列表；device_ids（可选）：受影响的设备ID列表，不提供表示不确定。
+# 缓存了预约统计结果的模块监听此信号失效缓存。
+bookings_changed = Signal()
+
+
+@receiver(post_init, sender=Booking)
+def remember_booking_cell(sender, instance, **kwargs):
+    """记录加载时的预约日期和设备，修改日期/设备后旧单元格也要重新汇总"""
+    # 读 __dict__，only()/defer() 加载的实例不会因此多查询
+    instance._loaded_cell = (instance.__dict__.get('booking_date'), instance.__dict__.get('device_id'))
+
+
+@receiver(post_save, sender=Booking)
+@receiver(post_delete, sender=Booking)
+def booking_changed(sender, instance, origin=None, **kwargs):
+    """预约新增、状态变化或删除时，通知该日期的预约数据已变化"""
+    if isinstance(origin, Device) or getattr(origin, 'model', None) is Device:
+        # 删除设备时其统计行随之级联删除，不再重新汇总
+        return
+    old_date, old_device_id = getattr(instance, '_loaded_cell', (None, None))
+    bookings_changed.send(
+        sender=Booking,
+        dates=list({instance.booking_date, old_date} - {None}),
+        device_ids=list({instance.device_id, old_device_id} - {None}),
+    )
+    instance._loaded_cell = (instance.booking_date, instance.device_id)
+
+
+@receiver(bookings_changed)
+def invalidate_availability_cache(sender, dates, **kwargs):
+    """使这些日期的占用矩阵缓存失效"""
+    invalidate_availability(*dates)
+
+
+@receiver(bookings_changed)
+def refresh_rollups(sender, dates, device_ids=None, **kwargs):
+    """重新汇总受影响的每日设备统计"""
+    refresh_daily_stats(dates, device_ids)
+
+
+@receiver(post_init, sender=Device)
+def remember_device_price(sender, instance, **kwargs):
+    instance._loaded_price_external = instance.__dict__.get('price_external')
+
+
+@receiver(post_save, sender=Device)
+def device_price_changed(sender, instance, created, **kwargs):
+    """设备校外价格变化时，重算统计中的校外收入"""
+    old_price = instance._loaded_price_external
+    if not created and old_price is not None and old_price != instance.price_external:
+        reprice_device(instance)
+    instance._loaded_price_external = instance.price_external
+
+
+@receiver(post_init, sender=UserInfo)
+def remember_user_type(sender, instance, **kwargs):
+    instance._loaded_user_type = instance.__dict__.get('user_type')
+
+
+@receiver(post_save, sender=UserInfo)
+def user_type_changed(sender, instance, created, **kwargs):
+    """用户类型变化时，其预约改记到新的用户类型下"""
+    if not created and instance._loaded_user_type not in (None, instance.user_type):
+        refresh_applicant(instance.pk)
+    instance._loaded_user_type = instance.user_type
+
+
+# ---------------------- 审批队列计数 ----------------------
+
+@receiver(post_init, sender=Booking)
+def remember_booking_queue(sender, instance, **kwargs):
+    instance._loaded_queue = (instance.__dict__.get('status'), instance.__dict__.get('teacher_id'))
+
+
+def remember_booking_state(instance):
+    """update() 修改预约后同步实例记录的原值，之后再 save() 时不会重复通知和计数"""
+    instance._loaded_cell = (instance.booking_date, instance.device_id)
+    instance._loaded_queue = (instance.status, instance.teacher_id)
+
+
+def _booking_user_type(instance, *statuses):
+    # 只有待负责人审批队列与申请人类型有关，其他状态变化不加载申请人
+    if 'admin_approved' in statuses:
+        return instance.applicant.user_type
+    return None
+
+
+@receiver(post_save, sender=Booking)
+def booking_queue_changed(sender, instance, created, raw=False, **kwargs):
+    """预约状态或指导教师变化时修改审批队列计数"""
+    old_status, old_teacher_id = (None, None) if created else instance._loaded_queue
+    if raw or (not created and old_status is None):
+        # 未加载状态字段（only()/defer()）时保存不会修改状态
+        return
+    if (old_status, old_teacher_id) != (instance.status, instance.teacher_id):
+        user_type = _booking_user_type(instance, old_status, instance.status)
+        deltas = {}
+        for key in booking_queues(old_status, old_teacher_id, user_type):
+            deltas[key] = deltas.get(key, 0) - 1
+        for key in booking_queues(instance.status, instance.teacher_id, user_type):
+            deltas[key] = deltas.get(key, 0) + 1
+        apply_deltas(deltas)
+    instance._loaded_queue = (instance.status, instance.teacher_id)
+
+
+@receiver(post_delete, sender=Booking)
+def booking_queue_deleted(sender, instance, **kwargs):
+    queues = booking_queues(instance.status, instance.teacher_id, _booking_user_type(instance, instance.status))
+    apply_deltas({key: -1 for key in queues})
+
+
+@receiver(post_init, sender=UserInfo)
+def remember_approval_status(sender, instance, **kwargs):
+    instance._loaded_approval_status = instance.__dict__.get('approval_status')
+
+
+@receiver(post_save, sender=UserInfo)
+def registration_queue_changed(sender, instance, created, raw=False, **kwargs):
+    """注册审核状态变化时修改待审核注册计数"""
+    old_status = None if created else instance._loaded_approval_status
+    if raw or (not created and old_status is None):
+        return
+    if old_status != instance.approval_status:
+        deltas = {key: -1 for key in registration_queues(old_status)}
+        for key in registration_queues(instance.approval_status):
+            deltas[key] = deltas.get(key, 0) + 1
+        apply_deltas(deltas)
+    instance._loaded_approval_status = instance.approval_status
+
+
+@receiver(post_delete, sender=UserInfo)
+def registration_queue_deleted(sender, instance, **kwargs):
+    apply_deltas({key: -1 for key in registration_queues(instance.approval_status)})
@@ -0,0 +1,199 @@
+"""
+预约状态机
+
+预约状态（Booking.APPROVAL_STATUS）只能按 ALLOWED_TRANSITIONS 变化，所有修改状态的代码都通过 transition()：
+
+- 条件更新：UPDATE ... SET status=<新状态> WHERE id IN (...) AND status=<原状态>，
+  不先读后写（save()），并发修改同一预约时只有一方成功，另一方得到 TransitionConflict；
+- 副作用集中处理：审批记录、借出台账在 side_effects() 代码块结束时各一次 bulk_create（与状态变化在同一事务中），
+  缴费请求在事务提交后合并为一批，由后台线程发送；update() 不触发 post_save 信号，审批队列计数和 bookings_changed 也在此统一处理。
+
+    with side_effects() as effects:
+        transition([booking], 'manager_approved')
+        effects.record_approval(booking, request.user, 'admin', 'approve')
+        effects.record_borrow(booking, request.user)
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import datetime, time as dt_time
+from django.db import transaction
+from django.utils import timezone
+from .models import ApprovalRecord, Booking
+from .queue_counters import track_bookings
+from .signals import bookings_changed, remember_booking_state
+
+# 原状态 -> 允许变为的状态
+ALLOWED_TRANSITIONS = {
+    'teacher_pending': ('pending', 'teacher_rejected', 'cancelled'),
+    'pending': ('admin_approved', 'manager_approved', 'admin_rejected', 'cancelled'),
+    'admin_approved': ('payment_pending', 'manager_rejected', 'cancelled'),
+    'payment_pending': ('manager_approved', 'cancelled'),
+    'manager_approved': ('cancelled',),
+    'teacher_rejected': (),
+    'admin_rejected': (),
+    'manager_rejected': (),
+    'cancelled': (),
+}
+
+# 新建预约的状态：学生待指导教师审批，其他人待管理员审批
+INITIAL_STATUSES = ('teacher_pending', 'pending')
+
+STATUS_LABELS = dict(Booking.APPROVAL_STATUS)
+
+
+class InvalidTransition(ValueError):
+    """不允许的状态变化"""
+
+
+class TransitionConflict(InvalidTransition):
+    """条件更新未命中：预约状态已被其他操作修改"""
+
+
+def can_transition(old_status, new_status):
+    return new_status in ALLOWED_TRANSITIONS.get(old_status, ())
+
+
+def check_transition(old_status, new_status):
+    if not can_transition(old_status, new_status):
+        raise InvalidTransition(
+            f'预约状态不能从「{STATUS_LABELS.get(old_status, old_status)}」变为「{STATUS_LABELS.get(new_status, new_status)}」'
+        )
+
+
+def check_initial_status(status):
+    if status not in INITIAL_STATUSES:
+        raise InvalidTransition(f'新建预约的状态不能为「{STATUS_LABELS.get(status, status)}」')
+
+
+# ---------------------- 副作用 ----------------------
+
+def expected_return_date(booking):
+    """预期归还时间：预约日期的时段结束时间"""
+    time_slot = booking.time_slot
+    end_time_str = time_slot.split('-')[1] if '-' in time_slot else '20:00'
+    end_hour, end_minute = map(int, end_time_str.split(':'))
+    # 与直接保存 naive 时间时 Django 的处理相同：按当前时区解释
+    return timezone.make_aware(datetime.combine(booking.booking_date, dt_time(end_hour, end_minute)))
+
+
+def borrow_ledger(booking, operator):
+    """预约审批通过时的借出台账记录（未保存），booking 需已加载 device 和 applicant"""
+    from ledger.models import DeviceLedger
+    # 设备状态不因预约而改变，时段可用性由预约情况判断
+    return DeviceLedger(
+        device=booking.device,
+        device_name=booking.device.model,
+        user=booking.applicant,
+        operation_type='borrow',
+        operation_date=timezone.now(),
+        expected_return_date=expected_return_date(booking),
+        status_after_operation=booking.device.status,
+        description=f'预约编号：{booking.booking_code}，用途：{booking.purpose or "无"}',
+        operator=operator,
+    )
+
+
+def send_payment_requests(bookings):
+    from . import finance_integration
+    finance_integration.send_payment_requests(bookings)
+
+
+class SideEffects:
+    """一批状态变化的副作用，flush() 时批量执行"""
+
+    def __init__(self):
+        self.approval_records = []
+        self.ledgers = []
+        self.payment_requests = []
+        self.changes = []  # [(原状态, 预约)]
+
+    def record_approval(self, booking, approver, approval_level, action, comment=''):
+        self.approval_records.append(ApprovalRecord(
+            booking=booking, approver=approver, approval_level=approval_level, action=action, comment=comment or ''
+        ))
+
+    def record_borrow(self, booking, operator):
+        self.ledgers.append(borrow_ledger(booking, operator))
+
+    def request_payment(self, booking):
+        self.payment_requests.append(booking)
+
+    def flush(self):
+        """写入审批记录和台账、修改审批队列计数、通知缓存失效（事务内）；缴费请求在提交后发送"""
+        from ledger.models import DeviceLedger
+        if self.approval_records:
+            ApprovalRecord.objects.bulk_create(self.approval_records)
+        if self.ledgers:
+            DeviceLedger.objects.bulk_create(self.ledgers)
+        if self.changes:
+            track_bookings([
+                (old_status, booking.status, booking.teacher_id,
+                 booking.applicant.user_type if 'admin_approved' in (old_status, booking.status) else None)
+                for old_status, booking in self.changes
+            ])
+            bookings_changed.send(
+                sender=Booking,
+                dates=list({booking.booking_date for _, booking in self.changes}),
+                device_ids=list({booking.device_id for _, booking in self.changes}),
+            )
+        if self.payment_requests:
+            payment_requests = list(self.payment_requests)
+            transaction.on_commit(lambda: send_payment_requests(payment_requests))
+
+
+_current = ContextVar('booking_side_effects', default=None)
+
+
+@contextmanager
+def side_effects():
+    """代码块在一个事务中执行，其中的状态变化和副作用在结束时批量处理（嵌套时由最外层处理）"""
+    effects = _current.get()
+    if effects is not None:
+        yield effects
+        return
+    effects = SideEffects()
+    token = _current.set(effects)
+    try:
+        with transaction.atomic():
+            yield effects
+            effects.flush()
+    finally:
+        _current.reset(token)
+
+
+# ---------------------- 状态变化 ----------------------
+
+def transition(bookings, new_status, **fields):
+    """把 bookings（已加载的预约）改为 new_status，同时更新 fields 中的字段
+
+    按原状态分组，每组一次条件 UPDATE；任一预约不允许变为新状态时不修改任何数据（InvalidTransition），
+    条件更新命中的行数不足（已被并发修改）时回滚整批（TransitionConflict）。
+    成功后同步实例的状态和字段（fields 中的表达式除外），返回 bookings。
+    申请人类型只在涉及待负责人审批状态时读取，批量处理时请 select_related('applicant')。
+    """
+    bookings = list(bookings)
+    for booking in bookings:
+        check_transition(booking.status, new_status)
+    if not bookings:
+        return bookings
+
+    groups = {}
+    for booking in bookings:
+        groups.setdefault(booking.status, []).append(booking)
+    now = timezone.now()
+    with side_effects() as effects:
+        for old_status, group in groups.items():
+            updated = Booking.objects.filter(id__in=[booking.id for booking in group], status=old_status).update(
+                status=new_status, update_time=now, **fields
+            )
+            if updated != len(group):
+                raise TransitionConflict('预约状态已被其他操作修改，请刷新后重试')
+            for booking in group:
+                booking.status = new_status
+                booking.update_time = now
+                for name, value in fields.items():
+                    if not hasattr(value, 'resolve_expression'):
+                        setattr(booking, name, value)
+                remember_booking_state(booking)
+                effects.changes.append((old_status, booking))
+    return bookings
@@ -1,3 +1,1001 @@
-from django.test import TestCase
+from django.test import TestCase, TransactionTestCase, Client, override_settings
+from django.contrib.auth.models import User, Group
+from django.urls import reverse
+from datetime import date, timedelta
+from decimal import Decimal
 
-# Create your tests here.
+from devices.models import Device
+from user.models import UserInfo
+from booking.models import Booking
+from booking.occupancy import OccupancyIndex
+
+
+class OccupancyIndexTestCase(TestCase):
+    """设备时段占用索引测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.device1 = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.device2 = Device.objects.create(device_code='DEV002', model='测试设备B')
+        self.day = date.today() + timedelta(days=1)
+
+        self.booking1 = Booking.objects.create(
+            booking_code='BOOK001', applicant=self.teacher, device=self.device1,
+            booking_date=self.day, time_slot='08:00-10:00', status='pending'
+        )
+        self.booking2 = Booking.objects.create(
+            booking_code='BOOK002', applicant=self.teacher, device=self.device1,
+            booking_date=self.day, time_slot='14:00-16:00', status='manager_approved'
+        )
+        # 已撤销的预约不占用时段
+        Booking.objects.create(
+            booking_code='BOOK003', applicant=self.teacher, device=self.device2,
+            booking_date=self.day, time_slot='10:00-12:00', status='cancelled'
+        )
+
+    def test_build_uses_single_query(self):
+        """测试建立索引只执行一次查询，之后的查找不访问数据库"""
+        with self.assertNumQueries(1):
+            index = OccupancyIndex.for_week([self.device1, self.device2], self.day)
+        with self.assertNumQueries(0):
+            booking = index.get(self.device1.id, self.day, '08:00-10:00')
+            self.assertEqual(booking.applicant.name, '张老师')
+
+    def test_lookup(self):
+        """测试按（设备, 日期, 时段）查找"""
+        index = OccupancyIndex.build([self.device1, self.device2], self.day, self.day)
+        self.assertEqual(index.get(self.device1.id, self.day, '08:00-10:00'), self.booking1)
+        self.assertEqual(index.bookings_for(self.device1.id, self.day, '14:00-16:00'), [self.booking2])
+        self.assertFalse(index.is_occupied(self.device2.id, self.day, '10:00-12:00'))
+        self.assertIsNone(index.get(self.device1.id, self.day + timedelta(days=1), '08:00-10:00'))
+        self.assertEqual(index.occupied_slots(self.device1.id, self.day), {'08:00-10:00', '14:00-16:00'})
+
+    def test_empty_device_list(self):
+        """测试设备列表为空时不查询数据库"""
+        with self.assertNumQueries(0):
+            index = OccupancyIndex.build([], self.day, self.day)
+        self.assertEqual(len(index), 0)
+
+
+class DeviceLedgerGridTestCase(TestCase):
+    """设备台账时段网格查询次数测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        admin_group = Group.objects.create(name='设备管理员')
+        self.admin_user = User.objects.create_user(username='admin', password='admin123')
+        self.admin_user.groups.add(admin_group)
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.client = Client()
+        self.client.force_login(self.admin_user)
+
+    def _create_devices(self, start, count):
+        for i in range(start, start + count):
+            device = Device.objects.create(
+                device_code=f'DEV{i:03d}', model=f'设备{i}', price_external=Decimal('100')
+            )
+            Booking.objects.create(
+                booking_code=f'BOOK{i:03d}', applicant=self.teacher, device=device,
+                booking_date=date.today(), time_slot='上午', status='manager_approved'
+            )
+
+    def _count_queries(self):
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse('ledger:device_ledger_list'))
+        self.assertEqual(response.status_code, 200)
+        return len(ctx.captured_queries), response
+
+    def test_query_count_independent_of_device_count(self):
+        """测试时段网格的查询次数不随设备数量增长"""
+        self._create_devices(1, 3)
+        # 预热：首个请求会把用户组等写入session/缓存，不计入比较
+        self._count_queries()
+        small_count, response = self._count_queries()
+        slot = response.context['device_time_status'][Device.objects.get(device_code='DEV001').id][0]['slots']['上午']
+        self.assertFalse(slot['available'])
+        self.assertEqual(slot['booked_by'], '张老师')
+
+        self._create_devices(4, 40)
+        large_count, response = self._count_queries()
+        self.assertEqual(small_count, large_count)
+        # 只为当前页（20台）设备构建网格
+        self.assertEqual(len(response.context['device_time_status']), 20)
+        self.assertEqual(response.context['total_count'], 43)
+
+
+class SlotAvailabilityTestCase(TestCase):
+    """时段可用性引擎测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.student_user = User.objects.create_user(username='S001', password='S001')
+        self.external_user = User.objects.create_user(username='E001', password='E001')
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student',
+            department='计算机学院', phone='13800138002', auth_user=self.student_user
+        )
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='外部公司', phone='13800138003', auth_user=self.external_user
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=2)
+        # 08:00-10:00 被教师占用，10:00-12:00 被校外人员占用
+        Booking.objects.create(
+            booking_code='BOOK001', applicant=self.teacher, device=self.device,
+            booking_date=self.day, time_slot='08:00-10:00', status='pending'
+        )
+        Booking.objects.create(
+            booking_code='BOOK002', applicant=self.external, device=self.device,
+            booking_date=self.day, time_slot='10:00-12:00', status='payment_pending',
+            payment_amount=Decimal('200')
+        )
+        self.client = Client()
+
+    def test_day_availability(self):
+        """测试单次聚合查询得到的时段占用情况"""
+        from booking.availability import DayAvailability, TIME_SLOTS
+        with self.assertNumQueries(1):
+            availability = DayAvailability.for_device(self.device, self.day)
+        self.assertEqual(sorted(availability.occupied_slots), ['08:00-10:00', '10:00-12:00'])
+        self.assertFalse(availability.can_override('08:00-10:00'))
+        self.assertTrue(availability.can_override('10:00-12:00'))
+        self.assertEqual(availability.available_slots('student'), [s for s in TIME_SLOTS if s != '08:00-10:00'])
+        self.assertEqual(availability.available_slots('external'), TIME_SLOTS[2:])
+
+    def test_get_available_time_slots(self):
+        """测试可用时段接口：校内人员可覆盖校外人员的预约"""
+        self.client.force_login(self.student_user)
+        response = self.client.get(reverse('get_available_time_slots'), {
+            'device_id': 'DEV001', 'date': self.day.strftime('%Y-%m-%d')
+        })
+        data = response.json()
+        self.assertIn('10:00-12:00', data['available_slots'])
+        self.assertNotIn('08:00-10:00', data['available_slots'])
+
+        self.client.force_login(self.external_user)
+        response = self.client.get(reverse('get_available_time_slots'), {
+            'device_id': 'DEV001', 'date': self.day.strftime('%Y-%m-%d')
+        })
+        self.assertNotIn('10:00-12:00', response.json()['available_slots'])
+
+    def test_check_availability(self):
+        """测试时段空闲检查接口"""
+        self.client.force_login(self.student_user)
+        url = reverse('check_availability')
+        params = {'device_id': 'DEV001', 'date': self.day.strftime('%Y-%m-%d')}
+        self.assertFalse(self.client.get(url, dict(params, time_slot='08:00-10:00')).json()['available'])
+        data = self.client.get(url, dict(params, time_slot='10:00-12:00')).json()
+        self.assertTrue(data['available'])
+        self.assertIn('warning', data)
+        self.assertTrue(self.client.get(url, dict(params, time_slot='14:00-16:00')).json()['available'])
+
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'booking-tests'}}
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BatchAvailabilityTestCase(TestCase):
+    """批量占用矩阵接口测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        from django.core.cache import cache
+        cache.clear()
+        self.user = User.objects.create_user(username='T001', password='T001')
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001', auth_user=self.user
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='外部公司', phone='13800138003'
+        )
+        self.devices = [
+            Device.objects.create(device_code=f'DEV{i:03d}', model=f'设备{i}') for i in range(1, 4)
+        ]
+        self.start = date.today() + timedelta(days=1)
+        self.booking = Booking.objects.create(
+            booking_code='BOOK001', applicant=self.teacher, device=self.devices[0],
+            booking_date=self.start, time_slot='10:00-12:00', status='pending'
+        )
+        Booking.objects.create(
+            booking_code='BOOK002', applicant=self.external, device=self.devices[1],
+            booking_date=self.start + timedelta(days=2), time_slot='08:00-10:00', status='pending'
+        )
+        self.client = Client()
+        self.client.force_login(self.user)
+        self.params = {
+            'device_codes': 'DEV001,DEV002,DEV003,DEV999',
+            'start_date': self.start.strftime('%Y-%m-%d'),
+            'end_date': (self.start + timedelta(days=6)).strftime('%Y-%m-%d'),
+        }
+
+    def test_matrix(self):
+        """测试位图矩阵内容"""
+        data = self.client.get(reverse('batch_availability'), self.params).json()
+        self.assertEqual(data['missing'], ['DEV999'])
+        self.assertEqual(data['devices']['DEV001']['occupied'], [0b10, 0, 0, 0, 0, 0, 0])
+        self.assertEqual(data['devices']['DEV001']['external_only'], [0] * 7)
+        self.assertEqual(data['devices']['DEV002']['occupied'][2], 0b1)
+        self.assertEqual(data['devices']['DEV002']['external_only'][2], 0b1)
+        self.assertEqual(data['devices']['DEV003']['occupied'], [0] * 7)
+
+    def test_cached_until_status_change(self):
+        """测试矩阵被缓存，预约状态变化后缓存失效"""
+        from booking.availability import get_occupancy_matrix
+        end = self.start + timedelta(days=6)
+        get_occupancy_matrix(self.devices, self.start, end)
+        with self.assertNumQueries(0):
+            matrix = get_occupancy_matrix(self.devices, self.start, end)
+        self.assertEqual(matrix[self.devices[0].id]['occupied'][0], 0b10)
+
+        self.booking.status = 'cancelled'
+        self.booking.save()
+        with self.assertNumQueries(1):
+            matrix = get_occupancy_matrix(self.devices, self.start, end)
+        self.assertEqual(matrix[self.devices[0].id]['occupied'][0], 0)
+
+    def test_invalid_range(self):
+        """测试日期范围校验"""
+        params = dict(self.params, end_date=(self.start + timedelta(days=40)).strftime('%Y-%m-%d'))
+        self.assertEqual(self.client.get(reverse('batch_availability'), params).status_code, 400)
+
+
+class BookingCodeAllocatorTestCase(TestCase):
+    """预约编号分配器测试"""
+
+    def test_sequential_codes(self):
+        """测试同一天的编号连续递增"""
+        from booking.utils import generate_booking_code, format_booking_code
+        today = date.today()
+        self.assertEqual(generate_booking_code(), format_booking_code(today, 1))
+        self.assertEqual(generate_booking_code(), format_booking_code(today, 2))
+
+    def test_constant_queries(self):
+        """测试已有序列时分配编号不随当天预约数量增长（不再扫描Booking表）"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from booking.utils import generate_booking_code
+        generate_booking_code()
+        with CaptureQueriesContext(connection) as ctx:
+            generate_booking_code()
+        sqls = [query['sql'] for query in ctx.captured_queries]
+        self.assertEqual(len([sql for sql in sqls if 'bookingcodesequence' in sql]), 2)
+        self.assertFalse([sql for sql in sqls if '"booking_booking"' in sql])
+
+    def test_reserve_block(self):
+        """测试批量预留编号"""
+        from booking.utils import reserve_booking_codes, generate_booking_code, format_booking_code
+        day = date(2026, 1, 1)
+        codes = reserve_booking_codes(3, day)
+        self.assertEqual(codes, [format_booking_code(day, i) for i in (1, 2, 3)])
+        self.assertEqual(reserve_booking_codes(2, day), [format_booking_code(day, i) for i in (4, 5)])
+        self.assertEqual(reserve_booking_codes(0, day), [])
+
+    def test_continues_after_existing_codes(self):
+        """测试当天已有旧方式生成的编号时，从其后继续分配"""
+        from booking.utils import generate_booking_code, format_booking_code
+        teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        today = date.today()
+        for serial, slot in ((1, '08:00-10:00'), (2, '10:00-12:00')):
+            Booking.objects.create(
+                booking_code=format_booking_code(today, serial), applicant=teacher, device=device,
+                booking_date=today, time_slot=slot
+            )
+        self.assertEqual(generate_booking_code(), format_booking_code(today, 3))
+
+
+class BookingConstraintTestCase(TestCase):
+    """预约唯一约束测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=1)
+        Booking.objects.create(
+            booking_code='BOOK001', applicant=self.teacher, device=self.device,
+            booking_date=self.day, time_slot='08:00-10:00', status='pending'
+        )
+
+    def test_duplicate_active_booking_rejected(self):
+        """测试同一时段不能存在两条有效预约"""
+        from django.db import IntegrityError, transaction
+        with self.assertRaises(IntegrityError):
+            with transaction.atomic():
+                Booking.objects.create(
+                    booking_code='BOOK002', applicant=self.teacher, device=self.device,
+                    booking_date=self.day, time_slot='08:00-10:00', status='teacher_pending'
+                )
+
+    def test_cancelled_booking_does_not_hold_slot(self):
+        """测试已撤销的预约不受唯一约束限制"""
+        Booking.objects.create(
+            booking_code='BOOK002', applicant=self.teacher, device=self.device,
+            booking_date=self.day, time_slot='08:00-10:00', status='cancelled'
+        )
+        Booking.objects.filter(booking_code='BOOK001').update(status='cancelled')
+        Booking.objects.create(
+            booking_code='BOOK003', applicant=self.teacher, device=self.device,
+            booking_date=self.day, time_slot='08:00-10:00', status='pending'
+        )
+        self.assertEqual(Booking.objects.filter(status='pending').count(), 1)
+
+
+class ReserveSlotTestCase(TestCase):
+    """预约占位服务测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=1)
+
+    def test_occupied_slot_rejected(self):
+        """测试校外人员不能预约已占用的时段"""
+        from booking.reservation import reserve_slot, SlotUnavailable
+        reserve_slot(self.teacher, self.device, self.day, '08:00-10:00')
+        with self.assertRaises(SlotUnavailable):
+            reserve_slot(self.external, self.device, self.day, '08:00-10:00')
+        self.assertEqual(Booking.objects.count(), 1)
+
+    def test_internal_preempts_external(self):
+        """测试校内人员覆盖校外人员预约：校外预约取消并退款95%"""
+        from booking.reservation import reserve_slot
+        external = reserve_slot(
+            self.external, self.device, self.day, '08:00-10:00',
+            payment_amount=Decimal('100.00')
+        ).booking
+        reservation = reserve_slot(self.teacher, self.device, self.day, '08:00-10:00')
+
+        self.assertEqual(reservation.preempted.booking_codes, [external.booking_code])
+        external.refresh_from_db()
+        self.assertEqual(external.status, 'cancelled')
+        self.assertEqual(external.payment_status, 'refunded')
+        self.assertEqual(external.refund_amount, Decimal('95.00'))
+        self.assertEqual(reservation.booking.status, 'pending')
+        # 自动覆盖不是审批操作，不把申请人记为审批人
+        from booking.models import ApprovalRecord
+        self.assertFalse(ApprovalRecord.objects.exists())
+
+    def test_other_integrity_errors_not_reported_as_slot_conflict(self):
+        """测试预约编号重复等其他完整性错误原样抛出，不当作时段已被占用"""
+        from unittest import mock
+        from django.db import IntegrityError
+        from booking.reservation import reserve_slot
+        first = reserve_slot(self.teacher, self.device, self.day, '08:00-10:00').booking
+        with mock.patch('booking.reservation.generate_booking_code', return_value=first.booking_code):
+            with self.assertRaises(IntegrityError):
+                reserve_slot(self.teacher, self.device, self.day, '10:00-12:00')
+        self.assertEqual(Booking.objects.count(), 1)
+
+
+class ConcurrentReservationTestCase(TransactionTestCase):
+    """并发提交同一时段的压力测试：只能有一个请求成功"""
+
+    THREADS = 8
+
+    def setUp(self):
+        """设置测试数据"""
+        self.applicants = [
+            UserInfo.objects.create(
+                user_code=f'T{i:03d}', name=f'教师{i}', user_type='teacher',
+                department='计算机学院', phone='13800138001'
+            )
+            for i in range(self.THREADS)
+        ]
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=1)
+
+    def test_exactly_one_winner(self):
+        """测试多个线程同时预约同一时段，只有一个成功"""
+        import threading
+        from django.db import connection
+        from booking.reservation import reserve_slot, SlotUnavailable
+
+        barrier = threading.Barrier(self.THREADS)
+        results = []
+
+        def submit(applicant):
+            try:
+                barrier.wait()
+                reserve_slot(applicant, self.device, self.day, '08:00-10:00')
+                results.append('won')
+            except SlotUnavailable:
+                results.append('lost')
+            finally:
+                connection.close()
+
+        threads = [threading.Thread(target=submit, args=(applicant,)) for applicant in self.applicants]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        self.assertEqual(results.count('won'), 1)
+        self.assertEqual(results.count('lost'), self.THREADS - 1)
+        self.assertEqual(
+            Booking.objects.filter(device=self.device, status__in=Booking.ACTIVE_STATUSES).count(), 1
+        )
+
+
+class PreemptionTestCase(TestCase):
+    """校内人员优先批量覆盖测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.operator = User.objects.create_user(username='admin', password='admin123')
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=1)
+        self.slots = ['08:00-10:00', '10:00-12:00', '12:00-14:00', '14:00-16:00']
+        for i, slot in enumerate(self.slots):
+            Booking.objects.create(
+                booking_code=f'BOOK00{i}', applicant=self.external, device=self.device,
+                booking_date=self.day, time_slot=slot, status='pending',
+                payment_amount=Decimal('33.33') if i % 2 == 0 else Decimal('0')
+            )
+        # 校内人员的预约不会被覆盖
+        Booking.objects.create(
+            booking_code='BOOK009', applicant=self.teacher, device=self.device,
+            booking_date=self.day, time_slot='16:00-18:00', status='pending'
+        )
+
+    def test_bulk_cancel_and_refund(self):
+        """测试一次更新取消全部校外预约，已缴费的退款95%，并批量写入审批记录"""
+        from booking.models import ApprovalRecord
+        from booking.preemption import preempt_external_bookings
+
+        # 查询被覆盖的预约 + 批量更新 + 批量插入审批记录 + 修改审批队列计数
+        # + 重新汇总该日设备统计（汇总 + 写入）（另有savepoint语句）
+        with self.assertNumQueries(8):
+            summary = preempt_external_bookings(
+                Booking.objects.filter(device=self.device, booking_date=self.day),
+                operator=self.operator
+            )
+
+        self.assertEqual(len(summary), 4)
+        self.assertEqual(summary.booking_codes, ['BOOK000', 'BOOK001', 'BOOK002', 'BOOK003'])
+        self.assertEqual(summary.refund_total, Decimal('63.32'))
+        self.assertEqual(Booking.objects.filter(status='cancelled').count(), 4)
+        self.assertEqual(Booking.objects.get(booking_code='BOOK009').status, 'pending')
+
+        paid = Booking.objects.get(booking_code='BOOK000')
+        self.assertEqual(paid.payment_status, 'refunded')
+        self.assertEqual(paid.refund_amount, Decimal('31.66'))
+        unpaid = Booking.objects.get(booking_code='BOOK001')
+        self.assertEqual(unpaid.payment_status, 'unpaid')
+        self.assertEqual(unpaid.refund_amount, Decimal('0'))
+
+        self.assertEqual(
+            ApprovalRecord.objects.filter(approver=self.operator, action='reject').count(), 4
+        )
+
+    def test_nothing_to_preempt(self):
+        """测试没有校外预约时不执行更新"""
+        from booking.preemption import preempt_external_bookings
+        summary = preempt_external_bookings(
+            Booking.objects.filter(booking_code='BOOK009'), operator=self.operator
+        )
+        self.assertFalse(summary)
+        self.assertEqual(summary.refund_total, Decimal('0'))
+
+
+class DailyDeviceStatsTestCase(TestCase):
+    """每日设备预约统计测试"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student',
+            department='计算机学院', phone='13800138000'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A', price_external=Decimal('150'))
+        self.device2 = Device.objects.create(device_code='DEV002', model='测试设备B', price_external=Decimal('80'))
+        self.day = date(2025, 3, 10)
+
+    def book(self, code, applicant, status, device=None, day=None, slot='08:00-10:00'):
+        return Booking.objects.create(
+            booking_code=code, applicant=applicant, device=device or self.device,
+            booking_date=day or self.day, time_slot=slot, status=status
+        )
+
+    def stats(self, user_type, device=None, day=None):
+        from booking.models import DailyDeviceStats
+        return DailyDeviceStats.objects.get(date=day or self.day, device=device or self.device, user_type=user_type)
+
+    def snapshot(self):
+        from booking.models import DailyDeviceStats
+        return sorted(
+            DailyDeviceStats.objects.filter(total_count__gt=0).values_list(
+                'date', 'device_id', 'user_type', 'total_count', 'approved_count', 'in_progress_count',
+                'pending_count', 'rejected_count', 'cancelled_count', 'usage_hours', 'revenue'
+            )
+        )
+
+    def test_maintained_on_booking_changes(self):
+        """测试新增、状态变化、改期和删除预约时统计随之更新"""
+        booking = self.book('BOOK001', self.external, 'pending')
+        self.book('BOOK002', self.student, 'manager_approved', slot='10:00-12:00')
+        self.assertEqual(self.stats('external').pending_count, 1)
+        self.assertEqual(self.stats('student').usage_hours, 2)
+
+        booking.status = 'manager_approved'
+        booking.save()
+        stats = self.stats('external')
+        self.assertEqual((stats.total_count, stats.pending_count, stats.approved_count), (1, 0, 1))
+        self.assertEqual(stats.revenue, Decimal('150'))
+
+        # 改期：原日期的统计清零
+        new_day = self.day + timedelta(days=1)
+        booking.booking_date = new_day
+        booking.save()
+        self.assertEqual(self.stats('external').total_count, 0)
+        self.assertEqual(self.stats('external', day=new_day).approved_count, 1)
+
+        booking.delete()
+        self.assertEqual(self.stats('external', day=new_day).total_count, 0)
+
+    def test_bulk_update_paths(self):
+        """测试批量覆盖、设备调价和用户类型变化后统计正确"""
+        from booking.preemption import preempt_external_bookings
+        self.book('BOOK001', self.external, 'manager_approved')
+        self.book('BOOK002', self.external, 'pending', slot='10:00-12:00')
+
+        preempt_external_bookings(Booking.objects.filter(booking_code='BOOK002'))
+        self.assertEqual(self.stats('external').cancelled_count, 1)
+
+        self.device.price_external = Decimal('200')
+        self.device.save()
+        self.assertEqual(self.stats('external').revenue, Decimal('200'))
+
+        self.external.user_type = 'teacher'
+        self.external.save()
+        self.assertEqual(self.stats('external').total_count, 0)
+        self.assertEqual(self.stats('teacher').approved_count, 1)
+        self.assertEqual(self.stats('teacher').revenue, Decimal('0'))
+
+    def test_rebuild_rollups_command(self):
+        """测试重建命令与增量维护的结果一致"""
+        from io import StringIO
+        from django.core.management import call_command
+        from booking.models import DailyDeviceStats
+        self.book('BOOK001', self.external, 'manager_approved')
+        self.book('BOOK002', self.student, 'teacher_rejected', slot='10:00-12:00')
+        self.book('BOOK003', self.student, 'payment_pending', device=self.device2)
+        self.book('BOOK004', self.external, 'cancelled', day=date(2025, 4, 2))
+        expected = self.snapshot()
+
+        DailyDeviceStats.objects.all().delete()
+        out = StringIO()
+        call_command('rebuild_rollups', stdout=out)
+        self.assertIn('共 4 行', out.getvalue())
+        self.assertEqual(self.snapshot(), expected)
+
+        # 限定日期范围时只重建该范围
+        DailyDeviceStats.objects.filter(date=date(2025, 4, 2)).delete()
+        call_command('rebuild_rollups', '--start', '2025-04-01', '--end', '2025-04-30', stdout=StringIO())
+        self.assertEqual(self.snapshot(), expected)
+
+
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'queue-counter-tests'}})
+class ApprovalQueueCounterTestCase(TestCase):
+    """审批队列计数测试：随状态变化增减、从缓存读取、批量审批后一致、可校正"""
+
+    def setUp(self):
+        """设置测试数据"""
+        from django.core.cache import cache
+        cache.clear()
+        self.addCleanup(cache.clear)
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher', department='计算机学院', phone='13800138001'
+        )
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student', department='计算机学院', phone='13800138000'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external', department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date(2025, 3, 10)
+
+    def book(self, code, applicant, status, day_offset=0):
+        return Booking.objects.create(
+            booking_code=code, applicant=applicant, device=self.device, teacher=self.teacher,
+            booking_date=self.day + timedelta(days=day_offset), time_slot='08:00-10:00', status=status
+        )
+
+    def counts(self):
+        from booking.queue_counters import queue_counts
+        keys = [('teacher_pending', self.teacher.id), ('pending', None), ('admin_approved', None), ('registration', None)]
+        return [queue_counts(keys)[key] for key in keys]
+
+    def actual(self):
+        return [
+            Booking.objects.filter(status='teacher_pending', teacher=self.teacher).count(),
+            Booking.objects.filter(status='pending').count(),
+            Booking.objects.filter(status='admin_approved', applicant__user_type='external').count(),
+            UserInfo.objects.filter(approval_status='pending').count(),
+        ]
+
+    def test_follow_status_transitions(self):
+        """测试预约、注册状态变化时计数随之变化，并与实际数量一致"""
+        first = self.book('BOOK001', self.student, 'teacher_pending')
+        second = self.book('BOOK002', self.student, 'teacher_pending', day_offset=1)
+        external = self.book('BOOK003', self.external, 'pending', day_offset=2)
+        self.assertEqual(self.counts(), [2, 1, 0, 0])
+
+        first.status = 'pending'
+        first.save()
+        external.status = 'admin_approved'
+        external.save()
+        second.delete()
+        UserInfo.objects.create(
+            user_code='T002', name='新老师', user_type='teacher', department='计算机学院',
+            phone='13800138003', approval_status='pending'
+        )
+        self.assertEqual(self.counts(), [0, 1, 1, 1])
+        self.assertEqual(self.counts(), self.actual())
+
+    def test_served_from_cache(self):
+        """测试计数从缓存读取，数据变化提交后缓存失效，事务中修改过的计数提交前不缓存"""
+        from booking.queue_counters import queue_count
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book('BOOK001', self.student, 'pending')
+        self.assertEqual(queue_count('pending'), 1)
+        with self.assertNumQueries(0):
+            self.assertEqual(queue_count('pending'), 1)
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.book('BOOK002', self.student, 'pending', day_offset=1)
+            # 提交前读到未提交的值，不写入缓存
+            self.assertEqual(queue_count('pending'), 2)
+            with self.assertNumQueries(1):
+                queue_count('pending')
+        self.assertEqual(queue_count('pending'), 2)
+        with self.assertNumQueries(0):
+            queue_count('pending')
+
+    def test_bulk_paths_and_rollback(self):
+        """测试批量审批、覆盖校外预约后计数一致，事务回滚时计数也回滚"""
+        from django.contrib.auth.models import User
+        from django.db import transaction
+        from labadmin.approvals import bulk_approve
+        from booking.preemption import preempt_external_bookings
+
+        admin = User.objects.create_user(username='admin01', password='test123456')
+        teacher_bookings = [self.book(f'BOOK00{i}', self.student, 'teacher_pending', day_offset=i) for i in range(3)]
+        external = [self.book(f'BOOK01{i}', self.external, 'pending', day_offset=10 + i) for i in range(3)]
+
+        bulk_approve([b.id for b in teacher_bookings], 'approve', admin, 'teacher', teacher=self.teacher)
+        bulk_approve([b.id for b in external], 'approve', admin, 'admin')
+        self.assertEqual(self.counts(), [0, 3, 3, 0])
+        preempt_external_bookings(Booking.objects.filter(id=external[0].id), operator=admin)
+        self.assertEqual(self.counts(), self.actual())
+
+        try:
+            with transaction.atomic():
+                bulk_approve([b.id for b in external], 'reject', admin, 'manager')
+                raise RuntimeError('回滚')
+        except RuntimeError:
+            pass
+        from booking.models import ApprovalQueueCounter
+        self.assertEqual(ApprovalQueueCounter.objects.get(queue='admin_approved').count, 2)
+
+    def test_reconcile_command(self):
+        """测试校正命令修正直接修改数据库造成的偏差"""
+        from io import StringIO
+        from django.core.management import call_command
+        self.book('BOOK001', self.student, 'pending')
+        self.assertEqual(self.counts(), [0, 1, 0, 0])
+        Booking.objects.update(status='teacher_pending')  # 不触发信号
+
+        out = StringIO()
+        call_command('reconcile_queue_counters', '--dry-run', stdout=out)
+        self.assertIn('有偏差', out.getvalue())
+        with self.captureOnCommitCallbacks(execute=True):
+            call_command('reconcile_queue_counters', stdout=StringIO())
+        self.assertEqual(self.counts(), [1, 0, 0, 0])
+        out = StringIO()
+        call_command('reconcile_queue_counters', stdout=out)
+        self.assertIn('一致', out.getvalue())
+
+
+class BookingStateMachineTestCase(TestCase):
+    """预约状态机测试：校验状态变化、条件更新、副作用批量执行"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.operator = User.objects.create_user(username='admin01', password='test123456')
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student', department='计算机学院', phone='13800138000'
+        )
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external', department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=3)
+
+    def book(self, code, applicant, status, day_offset=0, **fields):
+        return Booking.objects.create(
+            booking_code=code, applicant=applicant, device=self.device,
+            booking_date=self.day + timedelta(days=day_offset), time_slot='08:00-10:00', status=status, **fields
+        )
+
+    def test_transition_table(self):
+        """测试每个状态都有定义，终态不能再变化"""
+        from booking.state_machine import ALLOWED_TRANSITIONS, can_transition
+        statuses = {code for code, _ in Booking.APPROVAL_STATUS}
+        self.assertEqual(set(ALLOWED_TRANSITIONS), statuses)
+        for targets in ALLOWED_TRANSITIONS.values():
+            self.assertTrue(set(targets) <= statuses)
+        self.assertTrue(can_transition('pending', 'manager_approved'))
+        self.assertFalse(can_transition('cancelled', 'pending'))
+        self.assertFalse(can_transition('teacher_pending', 'manager_approved'))
+
+    def test_invalid_and_conflicting_transitions(self):
+        """测试不允许的变化不修改数据，并发修改时整批回滚"""
+        from booking.state_machine import InvalidTransition, TransitionConflict, transition
+        first = self.book('BOOK001', self.student, 'pending')
+        second = self.book('BOOK002', self.student, 'pending', day_offset=1)
+        rejected = self.book('BOOK003', self.student, 'admin_rejected', day_offset=2)
+
+        with self.assertRaises(InvalidTransition):
+            transition([first, rejected], 'manager_approved')
+        self.assertEqual(Booking.objects.get(id=first.id).status, 'pending')
+
+        # 另一个请求已处理 second，手里的实例仍是旧状态
+        Booking.objects.filter(id=second.id).update(status='admin_rejected')
+        with self.assertRaises(TransitionConflict):
+            transition([first, second], 'manager_approved')
+        self.assertEqual(Booking.objects.get(id=first.id).status, 'pending')
+
+        transition([first], 'manager_approved')
+        self.assertEqual(first.status, 'manager_approved')
+        self.assertEqual(Booking.objects.get(id=first.id).status, 'manager_approved')
+
+    def test_side_effects_batched(self):
+        """测试审批记录、借出台账批量写入，缴费请求在事务提交后发送"""
+        from unittest import mock
+        from booking.models import ApprovalRecord
+        from booking.state_machine import side_effects, transition
+        from ledger.models import DeviceLedger
+        internal = [self.book(f'BOOK00{i}', self.student, 'pending', day_offset=i) for i in range(3)]
+        external = self.book('BOOK010', self.external, 'admin_approved', day_offset=10, payment_amount=Decimal('50'))
+
+        with mock.patch('booking.finance_integration.send_payment_requests') as send:
+            with self.captureOnCommitCallbacks(execute=True):
+                with side_effects() as effects:
+                    transition(internal, 'manager_approved')
+                    transition([external], 'payment_pending')
+                    for booking in internal:
+                        effects.record_approval(booking, self.operator, 'admin', 'approve')
+                        effects.record_borrow(booking, self.operator)
+                    effects.request_payment(external)
+                    self.assertEqual(ApprovalRecord.objects.count(), 0)
+                send.assert_not_called()
+            send.assert_called_once_with([external])
+
+        self.assertEqual(ApprovalRecord.objects.count(), 3)
+        self.assertEqual(DeviceLedger.objects.filter(operation_type='borrow').count(), 3)
+        self.assertEqual(Booking.objects.filter(status='manager_approved').count(), 3)
+
+    def test_payment_requests_sent_in_background_batches(self):
+        """测试配置财务处接口后，缴费请求合并为一次 POST 交给后台线程发送，不在当前请求中逐条发送"""
+        import json
+        from unittest import mock
+        from django.test import override_settings
+        from booking import finance_integration
+        bookings = [
+            self.book(f'BOOK00{i}', self.external, 'payment_pending', day_offset=i, payment_amount=Decimal('50'))
+            for i in range(3)
+        ]
+        executor = mock.Mock()
+        with override_settings(FINANCE_API_URL='http://finance.example/api/payment'), \
+                mock.patch.object(finance_integration, '_get_executor', return_value=executor), \
+                mock.patch.object(finance_integration.urllib_request, 'urlopen') as urlopen:
+            finance_integration.send_payment_requests(bookings)
+            urlopen.assert_not_called()
+            executor.submit.assert_called_once()
+            # 在后台线程中执行：一次 POST 包含全部请求
+            func, *args = executor.submit.call_args.args
+            func(*args)
+        urlopen.assert_called_once()
+        payload = json.loads(urlopen.call_args.args[0].data)
+        self.assertEqual([item['booking_code'] for item in payload['requests']], ['BOOK000', 'BOOK001', 'BOOK002'])
+
+    def test_views_use_state_machine(self):
+        """测试撤销预约和财务回调通过状态机修改状态"""
+        import json
+        auth_user = User.objects.create_user(username='E001', password='test123456')
+        self.external.auth_user = auth_user
+        self.external.save()
+        paid = self.book('BOOK001', self.external, 'payment_pending', payment_amount=Decimal('100'))
+        waiting = self.book('BOOK002', self.external, 'payment_pending', day_offset=1, payment_amount=Decimal('100'))
+
+        response = self.client.post(reverse('finance_payment_callback'), json.dumps({
+            'booking_code': paid.booking_code, 'payment_status': 'paid'
+        }), content_type='application/json')
+        self.assertTrue(response.json()['success'])
+        paid.refresh_from_db()
+        self.assertEqual((paid.status, paid.payment_status, paid.finance_confirmed), ('manager_approved', 'paid', True))
+
+        self.client.post(reverse('user_login'), {'username': 'E001', 'password': 'test123456', 'role': 'user'})
+        self.client.post(reverse('cancel_booking', args=[waiting.id]))
+        waiting.refresh_from_db()
+        self.assertEqual((waiting.status, waiting.payment_status), ('cancelled', 'refunded'))
+        self.assertEqual(waiting.refund_amount, Decimal('95.00'))
+
+    def test_expire_command_retries_after_conflict(self):
+        """测试处理过期预约时一条被并发修改，其余仍被取消，被修改的预约报告为跳过"""
+        from io import StringIO
+        from unittest import mock
+        from django.core.management import call_command
+        from booking import state_machine
+        past = date.today() - timedelta(days=3)
+        stale = self.book('BOOK001', self.external, 'payment_pending', day_offset=(past - self.day).days)
+        expired = self.book('BOOK002', self.external, 'manager_approved', day_offset=(past - self.day).days + 1)
+        real_transition = state_machine.transition
+
+        def racing_transition(bookings, new_status, **fields):
+            bookings = list(bookings)
+            if racing_transition.first:
+                # 读取之后、更新之前，另一个操作撤销了 stale
+                racing_transition.first = False
+                Booking.objects.filter(id=stale.id).update(status='cancelled', payment_status='refunded')
+            return real_transition(bookings, new_status, **fields)
+        racing_transition.first = True
+
+        out = StringIO()
+        with mock.patch('booking.management.commands.update_device_status.transition', racing_transition):
+            call_command('update_device_status', stdout=out)
+        stale.refresh_from_db()
+        expired.refresh_from_db()
+        self.assertEqual(expired.status, 'cancelled')
+        self.assertEqual(stale.payment_status, 'refunded')
+        self.assertIn('预约 BOOK002 已过期，自动取消', out.getvalue())
+        self.assertIn('预约 BOOK001 状态已被其他操作修改，跳过', out.getvalue())
+
+
+class FinanceCallbackTestCase(TestCase):
+    """财务处缴费回调测试：幂等键去重、批量确认、写入次数与条数无关"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external', department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='测试设备A')
+        self.day = date.today() + timedelta(days=3)
+
+    def book(self, code, status='payment_pending', day_offset=0, **fields):
+        return Booking.objects.create(
+            booking_code=code, applicant=self.external, device=self.device, payment_amount=Decimal('100'),
+            booking_date=self.day + timedelta(days=day_offset), time_slot='08:00-10:00', status=status, **fields
+        )
+
+    def callback(self, payload):
+        import json
+        return self.client.post(reverse('finance_payment_callback'), json.dumps(payload), content_type='application/json')
+
+    def test_retry_is_idempotent(self):
+        """测试同一交易号重复回调返回首次的结果，不再修改预约"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from booking.models import FinanceCallback
+        booking = self.book('BOOK001')
+        payload = {'transaction_id': 'TX001', 'booking_code': 'BOOK001', 'payment_status': 'paid'}
+
+        first = self.callback(payload).json()
+        self.assertTrue(first['success'])
+        self.assertNotIn('duplicate', first)
+        booking.refresh_from_db()
+        self.assertEqual((booking.status, booking.payment_status, booking.finance_confirmed),
+                         ('manager_approved', 'paid', True))
+
+        with CaptureQueriesContext(connection) as queries:
+            second = self.callback(payload).json()
+        self.assertTrue(second['duplicate'])
+        self.assertEqual(second['message'], first['message'])
+        self.assertFalse([q for q in queries if q['sql'].startswith('UPDATE "booking_booking"')])
+        self.assertEqual(FinanceCallback.objects.count(), 1)
+
+        # 旧版回调没有交易号：按预约编号和缴费状态去重；预约不存在仍返回404
+        legacy = self.callback({'booking_code': 'BOOK001', 'payment_status': 'paid'})
+        self.assertEqual(legacy.status_code, 200)
+        self.assertEqual(self.callback({'booking_code': 'NOPE', 'payment_status': 'paid'}).status_code, 404)
+        self.assertEqual(self.callback({'payment_status': 'paid'}).status_code, 400)
+
+    def test_batch_payload(self):
+        """测试一次回调确认多条：待缴费的通过，其他状态只记录缴费结果，逐条返回结果"""
+        pending = self.book('BOOK001')
+        approved = self.book('BOOK002', status='manager_approved', day_offset=1)
+        failed = self.book('BOOK003', day_offset=2)
+        approved_updated = approved.update_time
+
+        response = self.callback({'confirmations': [
+            {'transaction_id': 'TX001', 'booking_code': 'BOOK001', 'payment_status': 'paid'},
+            {'transaction_id': 'TX002', 'booking_code': 'BOOK002', 'payment_status': 'paid'},
+            {'transaction_id': 'TX003', 'booking_code': 'BOOK003', 'payment_status': 'failed'},
+            {'transaction_id': 'TX004', 'booking_code': 'NOPE', 'payment_status': 'paid'},
+            {'transaction_id': 'TX001', 'booking_code': 'BOOK001', 'payment_status': 'paid'},
+            {'transaction_id': 'TX005'},
+        ]}).json()
+        self.assertEqual((response['total'], response['succeeded'], response['failed']), (6, 3, 3))
+        results = response['results']
+        self.assertEqual([r['success'] for r in results], [True, True, False, False, True, False])
+        self.assertEqual((results[2]['error'], results[3]['error']), ('缴费失败', '预约不存在'))
+        self.assertTrue(results[4]['duplicate'])
+
+        for booking in (pending, approved, failed):
+            booking.refresh_from_db()
+        self.assertEqual((pending.status, pending.payment_status), ('manager_approved', 'paid'))
+        self.assertEqual((approved.status, approved.payment_status, approved.finance_confirmed),
+                         ('manager_approved', 'paid', True))
+        self.assertGreater(approved.update_time, approved_updated)
+        self.assertEqual((failed.status, failed.payment_status), ('payment_pending', 'unpaid'))
+
+    def test_query_count_independent_of_batch_size(self):
+        """测试批量确认的查询次数与条数无关，待缴费的预约一次条件 UPDATE"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        for i in range(60):
+            self.book(f'BOOK{i:03d}', day_offset=i)
+
+        def confirm(start, count):
+            with CaptureQueriesContext(connection) as queries:
+                response = self.callback({'confirmations': [
+                    {'transaction_id': f'TX{i}', 'booking_code': f'BOOK{i:03d}', 'payment_status': 'paid'}
+                    for i in range(start, start + count)
+                ]})
+            self.assertEqual(response.json()['succeeded'], count)
+            return queries
+
+        small = confirm(0, 5)
+        large = confirm(5, 55)
+        # 预约统计汇总（bookings_changed 的接收者）按日期分批写入，不计入比较
+        def callback_queries(queries):
+            return [q for q in queries if 'booking_dailydevicestats' not in q['sql']]
+        self.assertEqual(len(callback_queries(large)), len(callback_queries(small)))
+        updates = [q for q in large if q['sql'].startswith('UPDATE "booking_booking"')]
+        self.assertEqual(len(updates), 1)
+        self.assertEqual(Booking.objects.filter(status='manager_approved', finance_confirmed=True).count(), 60)
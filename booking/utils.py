@@ -1,11 +1,48 @@
 import datetime
-from .models import Booking
+from django.db import IntegrityError, transaction
+from django.db.models import F
+from .models import Booking, BookingCodeSequence
+
+
+def booking_code_prefix(day):
+    """预约编号前缀：BOOK + 年月日"""
+    return f"BOOK{day.strftime('%Y%m%d')}"
+
+
+def format_booking_code(day, serial):
+    """预约编号格式：BOOK + 年月日 + 序号（至少3位，如 BOOK20260101001）"""
+    return f"{booking_code_prefix(day)}{str(serial).zfill(3)}"
+
+
+def allocate_booking_codes(count=1, day=None):
+    """原子地分配 count 个连续的预约编号（常数时间，并发安全）
+
+    先执行 UPDATE ... SET last_value = last_value + count 取得行锁（SQLite下为写锁），
+    再读取结果，避免“先读后写”造成的编号重复。可用于批量导入时一次预留一段编号。
+    """
+    if count < 1:
+        return []
+    day = day or datetime.date.today()
+    with transaction.atomic():
+        updated = BookingCodeSequence.objects.filter(day=day).update(last_value=F('last_value') + count)
+        if not updated:
+            # 当天第一次分配：从已存在的当天编号之后开始（兼容旧的计数方式生成的编号）
+            existing = Booking.objects.filter(booking_code__startswith=booking_code_prefix(day)).count()
+            try:
+                with transaction.atomic():
+                    BookingCodeSequence.objects.create(day=day, last_value=existing + count)
+            except IntegrityError:
+                # 其他请求已创建当天的序列，改为递增
+                BookingCodeSequence.objects.filter(day=day).update(last_value=F('last_value') + count)
+        last_value = BookingCodeSequence.objects.filter(day=day).values_list('last_value', flat=True).get()
+    return [format_booking_code(day, serial) for serial in range(last_value - count + 1, last_value + 1)]
+
+
+def reserve_booking_codes(count, day=None):
+    """为批量导入预留一段连续的预约编号"""
+    return allocate_booking_codes(count, day)
+
 
 def generate_booking_code():
     """生成预约编号：BOOK + 年月日 + 序号（如 BOOK20260101001）"""
-    today = datetime.date.today().strftime("%Y%m%d")
-    # 统计今日已生成的预约数
-    count = Booking.objects.filter(booking_code__startswith=f"BOOK{today}").count() + 1
-    # 补零到3位
-    serial_num = str(count).zfill(3)
-    return f"BOOK{today}{serial_num}"
\ No newline at end of file
+    return allocate_booking_codes(1)[0]
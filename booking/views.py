@@ -5,11 +5,18 @@ from django.contrib import messages
 from user.models import UserInfo
 from devices.models import Device
 from .models import Booking, ApprovalRecord
-from .utils import generate_booking_code
+from .reservation import reserve_slot, SlotUnavailable
+from .state_machine import InvalidTransition, transition
+from .availability import DayAvailability, TIME_SLOTS, get_occupancy_matrix
 from django.http import JsonResponse
 from django.urls import reverse
 from datetime import date, timedelta, datetime
 from decimal import Decimal
+from jnu_lab_system.identity import get_current_user_info
+
+# 批量占用查询的上限
+MAX_BATCH_DEVICES = 100
+MAX_BATCH_DAYS = 31
 
 # 1. 设备预约申请页面
 @login_required
@@ -18,7 +25,7 @@ def booking_apply(request):
     """设备预约申请视图"""
     # 获取当前登录用户的信息
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
     except UserInfo.DoesNotExist:
         messages.error(request, '未找到你的个人信息，请联系管理员！')
         return redirect('user_home')
@@ -92,39 +99,6 @@ def booking_apply(request):
                 'student_advisors': student_advisors
             })
         
-        # 检查设备冲突（校内人员优先规则）
-        conflict_bookings = Booking.objects.filter(
-            device=device,
-            booking_date=booking_date,
-            time_slot=time_slot,
-            status__in=['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending']
-        )
-        
-        # 如果新预约是校内人员，检查是否有校外人员预约
-        if user_info.user_type in ['student', 'teacher']:
-            external_conflicts = conflict_bookings.filter(applicant__user_type='external')
-            if external_conflicts.exists():
-                # 校内人员优先：自动取消校外人员预约
-                for conflict in external_conflicts:
-                    conflict.status = 'cancelled'
-                    # 计算退款（95%）
-                    if conflict.payment_amount > 0:
-                        conflict.refund_amount = conflict.payment_amount * Decimal('0.95')
-                        conflict.payment_status = 'refunded'
-                    conflict.save()
-                    messages.warning(request, f'由于校内人员优先规则，已自动取消校外人员预约：{conflict.booking_code}')
-        
-        # 检查是否仍有冲突（校内人员之间或校外人员之间）
-        remaining_conflicts = conflict_bookings.exclude(status='cancelled')
-        if remaining_conflicts.exists():
-            messages.error(request, '该时段已被预约，请选择其他时段！')
-            student_advisors = user_info.advisors.all() if user_info.user_type == 'student' else []
-            return render(request, 'user/booking_apply.html', {
-                'user_info': user_info,
-                'devices': devices,
-                'student_advisors': student_advisors
-            })
-        
         # 学生用户必须填写指导教师，且必须在教师的学生列表中
         teacher = None
         if user_info.user_type == 'student':
@@ -171,21 +145,28 @@ def booking_apply(request):
         if user_info.user_type == 'external':
             payment_amount = device.price_external
         
-        # 生成预约编号
-        booking_code = generate_booking_code()
-        
-        # 创建预约申请
-        booking = Booking.objects.create(
-            booking_code=booking_code,
-            applicant=user_info,
-            device=device,
-            booking_date=booking_date,
-            time_slot=time_slot,
-            purpose=purpose,
-            teacher=teacher,
-            status=initial_status,
-            payment_amount=payment_amount
-        )
+        # 在同一事务中完成冲突检查（校内人员优先规则）、覆盖校外预约和创建预约，
+        # 并发提交同一时段时只有一个请求成功
+        try:
+            reservation = reserve_slot(
+                user_info, device, booking_date, time_slot,
+                purpose=purpose,
+                teacher=teacher,
+                status=initial_status,
+                payment_amount=payment_amount
+            )
+        except SlotUnavailable:
+            messages.error(request, '该时段已被预约，请选择其他时段！')
+            student_advisors = user_info.advisors.all() if user_info.user_type == 'student' else []
+            return render(request, 'user/booking_apply.html', {
+                'user_info': user_info,
+                'devices': devices,
+                'student_advisors': student_advisors
+            })
+        if reservation.preempted:
+            codes = '、'.join(reservation.preempted.booking_codes)
+            messages.warning(request, f'由于校内人员优先规则，已自动取消校外人员预约：{codes}')
+        booking_code = reservation.booking.booking_code
         
         if user_info.user_type == 'student':
             messages.success(request, f'预约申请提交成功！预约编号：{booking_code}，已提交给指导教师审批。')
@@ -213,7 +194,7 @@ def my_booking(request):
     """我的预约记录页面"""
     # 获取当前用户信息
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
     except UserInfo.DoesNotExist:
         messages.error(request, '未找到你的个人信息，请联系管理员！')
         return redirect('user_home')
@@ -241,7 +222,7 @@ def cancel_booking(request, booking_id):
     
     # 校验是否是本人的预约
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
         if booking.applicant != user_info:
             messages.error(request, '你无权撤销他人的预约申请！')
             return redirect('my_booking')
@@ -273,23 +254,27 @@ def cancel_booking(request, booking_id):
     
     # 计算退款（校外人员付费预约）
     refund_amount = Decimal('0')
+    refund_fields = {}
     if booking.applicant.user_type == 'external' and booking.payment_amount > 0:
         if booking.status == 'manager_approved' or booking.status == 'payment_pending':
             # 已批准或待缴费的付费预约，退95%
             refund_amount = booking.payment_amount * Decimal('0.95')
-            booking.refund_amount = refund_amount
-            booking.payment_status = 'refunded'
-            messages.success(request, f'预约已撤销，将退还95%费用：{refund_amount}元（原费用：{booking.payment_amount}元）')
+            refund_fields = {'refund_amount': refund_amount, 'payment_status': 'refunded'}
+            message = f'预约已撤销，将退还95%费用：{refund_amount}元（原费用：{booking.payment_amount}元）'
         else:
             # 未缴费的预约，无需退款
-            messages.success(request, '预约已撤销（未缴费，无需退款）')
+            message = '预约已撤销（未缴费，无需退款）'
     else:
         # 校内人员或未付费的预约
-        messages.success(request, '预约已成功撤销！')
+        message = '预约已成功撤销！'
     
-    # 更新状态为已撤销
-    booking.status = 'cancelled'
-    booking.save()
+    # 更新状态为已撤销（条件更新：预约状态在此期间被审批修改时撤销失败）
+    try:
+        transition([booking], 'cancelled', **refund_fields)
+    except InvalidTransition as e:
+        messages.error(request, str(e))
+        return redirect('my_booking')
+    messages.success(request, message)
     
     return redirect('my_booking')
 @login_required
@@ -301,8 +286,8 @@ def device_booking_detail(request, device_id):
     bookings = Booking.objects.filter(device=device).order_by('-create_time')
     
     # 检查用户是否是管理员或负责人
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     can_view_booking_details = is_admin or is_manager
     
     context = {
@@ -355,32 +340,25 @@ def check_availability(request):
             'reason': f'设备状态为"{device.get_status_display()}"，所有时段都不可预约'
         })
 
-    # 检查该时段是否已有预约（考虑校内人员优先规则）
-    # 关键：只检查该具体日期和具体时段的预约，而不是整个日期
-    existing_bookings = Booking.objects.filter(
-        device=device,                  # 使用设备对象
-        booking_date=booking_date,      # 使用转换后的日期对象
-        time_slot=time_slot,            # 预约时段
-        status__in=['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending']  # 待审核或已通过的预约视为占用
-    )
-    
     # 获取请求用户信息（如果已登录）
     user_type = None
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
         user_type = user_info.user_type
     except (UserInfo.DoesNotExist, AttributeError):
         pass
     
-    if existing_bookings.exists():
-        # 如果新预约是校内人员，检查是否有校外人员预约（校内人员优先）
-        if user_type in ['student', 'teacher']:
-            external_conflicts = existing_bookings.filter(applicant__user_type='external')
-            if external_conflicts.exists():
-                return JsonResponse({
-                    'available': True,  # 校内人员可以预约，会自动取消校外人员预约
-                    'warning': '该时段有校外人员预约，根据校内人员优先规则，您的预约将自动生效'
-                })
+    # 检查该时段是否已有预约（考虑校内人员优先规则）
+    # 关键：只检查该具体日期和具体时段的预约，而不是整个日期
+    availability = DayAvailability.for_device(device, booking_date)
+    
+    if availability.is_occupied(time_slot):
+        # 如果新预约是校内人员，且该时段只有校外人员预约（校内人员优先）
+        if availability.is_available(time_slot, user_type):
+            return JsonResponse({
+                'available': True,  # 校内人员可以预约，会自动取消校外人员预约
+                'warning': '该时段有校外人员预约，根据校内人员优先规则，您的预约将自动生效'
+            })
         
         # 其他情况：有冲突
         return JsonResponse({
@@ -436,55 +414,75 @@ def get_available_time_slots(request):
     # 获取请求用户信息（如果已登录）
     user_type = None
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
         user_type = user_info.user_type
     except (UserInfo.DoesNotExist, AttributeError):
         pass
     
-    # 所有可能的时段
-    all_time_slots = [
-        '08:00-10:00',
-        '10:00-12:00',
-        '12:00-14:00',
-        '14:00-16:00',
-        '16:00-18:00',
-        '18:00-20:00',
-    ]
-    
-    # 查询该日期已占用的时段（只查询该设备、该日期、有效状态的预约）
-    # 注意：只查询该具体日期，不锁定其他日期
-    existing_bookings = Booking.objects.filter(
-        device=device,
-        booking_date=booking_date,  # 使用转换后的日期对象
-        status__in=['teacher_pending', 'pending', 'admin_approved', 'manager_approved', 'payment_pending']
-    ).exclude(status='cancelled')  # 排除已撤销的预约
-    
-    # 过滤可用时段（考虑校内人员优先规则）
-    # 关键：只锁定被占用的具体时段，而不是整个日期
-    # 每个时段独立判断，互不影响
-    available_slots = []
-    for slot in all_time_slots:
-        # 检查该时段是否被占用
-        slot_bookings = existing_bookings.filter(time_slot=slot)
-        
-        if slot_bookings.exists():
-            # 该时段已被占用，检查是否可以覆盖（校内人员优先规则）
-            if user_type in ['student', 'teacher']:
-                # 校内人员：检查是否有校外人员预约该时段
-                external_conflicts = slot_bookings.filter(applicant__user_type='external')
-                if external_conflicts.exists():
-                    # 该时段被校外人员占用，校内人员可以覆盖
-                    available_slots.append(slot)
-                # else: 该时段被校内人员占用，不可用（不添加到可用列表）
-            # else: 校外人员：如果时段已被占用，都不可用（不添加到可用列表）
-        else:
-            # 该时段未被占用，可用
-            available_slots.append(slot)
+    # 查询该日期各时段的占用情况（单条聚合查询，只查询该设备、该日期、有效状态的预约）
+    # 关键：只锁定被占用的具体时段，而不是整个日期，每个时段独立判断
+    availability = DayAvailability.for_device(device, booking_date)
     
-    # 获取已占用的时段列表（用于调试显示）
-    occupied_slots = list(set(existing_bookings.values_list('time_slot', flat=True)))
+    # 过滤可用时段（考虑校内人员优先规则：校内人员可覆盖只被校外人员占用的时段）
+    available_slots = availability.available_slots(user_type)
     
     return JsonResponse({
         'available_slots': available_slots,
-        'occupied_slots': occupied_slots
-    })
\ No newline at end of file
+        'occupied_slots': availability.occupied_slots
+    })
+
+@login_required
+def batch_availability(request):
+    """批量查询多台设备在一段日期内的时段占用情况（位图矩阵）
+
+    参数：device_codes=DEV001,DEV002（也可重复传参）、start_date、end_date（YYYY-MM-DD）
+    返回：每台设备每天一个整数位图，第i位对应 time_slots 中的第i个时段
+    """
+    device_codes = []
+    for value in request.GET.getlist('device_codes'):
+        device_codes.extend(code.strip() for code in value.split(',') if code.strip())
+    device_codes = list(dict.fromkeys(device_codes))  # 去重并保持顺序
+    start_date_str = request.GET.get('start_date')
+    end_date_str = request.GET.get('end_date')
+    
+    # 验证参数
+    if not device_codes or not start_date_str:
+        return JsonResponse({'error': '参数不完整'}, status=400)
+    if len(device_codes) > MAX_BATCH_DEVICES:
+        return JsonResponse({'error': f'一次最多查询{MAX_BATCH_DEVICES}台设备'}, status=400)
+    
+    # 验证并转换日期格式（未指定结束日期时默认查询7天）
+    try:
+        start_date = datetime.strptime(start_date_str, '%Y-%m-%d').date()
+        if end_date_str:
+            end_date = datetime.strptime(end_date_str, '%Y-%m-%d').date()
+        else:
+            end_date = start_date + timedelta(days=6)
+    except (ValueError, TypeError):
+        return JsonResponse({'error': '日期格式错误，应为YYYY-MM-DD'}, status=400)
+    if start_date > end_date:
+        return JsonResponse({'error': '起始日期不能晚于结束日期'}, status=400)
+    if (end_date - start_date).days + 1 > MAX_BATCH_DAYS:
+        return JsonResponse({'error': f'日期范围不能超过{MAX_BATCH_DAYS}天'}, status=400)
+    
+    devices = list(Device.objects.filter(device_code__in=device_codes))
+    found_codes = {device.device_code for device in devices}
+    matrix = get_occupancy_matrix(devices, start_date, end_date)
+    
+    result = {}
+    for device in devices:
+        result[device.device_code] = {
+            'status': device.status,
+            # 维修中/已报废的设备所有时段都不可预约
+            'bookable': device.status not in ['maintenance', 'discarded'],
+            'occupied': matrix[device.id]['occupied'],
+            'external_only': matrix[device.id]['external_only'],
+        }
+    
+    return JsonResponse({
+        'start_date': start_date.strftime('%Y-%m-%d'),
+        'end_date': end_date.strftime('%Y-%m-%d'),
+        'time_slots': TIME_SLOTS,
+        'devices': result,
+        'missing': [code for code in device_codes if code not in found_codes],
+    })
@@ -0,0 +1,146 @@
+"""
+设备变更审计
+设备新增、状态变更、删除时写入设备台账（DeviceLedger），由信号完成，Device.save()/delete() 不再有额外查询：
+
+- 加载设备时（post_init）记录被审计字段的原值，保存时与当前值比较，不需要重新查询旧记录；
+- 操作员取自当前请求的用户（jnu_lab_system.actor），不再查询"第一个管理员"；
+- 在 audit_batch() 中的台账记录先暂存，代码块结束时一次 bulk_create；
+  bulk_update_devices() 用 bulk_update 批量更新设备并批量写入状态变更记录；bulk_update 不触发信号，
+  搜索索引和预约统计的校外收入也在其中同步。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+from django.db import transaction
+from django.db.models.signals import post_init, post_save, post_delete
+from django.utils import timezone
+from jnu_lab_system.actor import current_actor
+from .models import Device
+
+# 与原值比较的字段
+AUDITED_FIELDS = ('status',)
+
+_pending = ContextVar('pending_device_ledgers', default=None)
+
+
+def _loaded_values(instance):
+    # 读 __dict__，only()/defer() 加载的实例不会因此多查询
+    return {field: instance.__dict__.get(field) for field in AUDITED_FIELDS}
+
+
+def remember_original(sender, instance, **kwargs):
+    instance._audit_original = _loaded_values(instance)
+
+
+def _ledger(device, operation_type, status_after_operation, description, keep_device=True):
+    from ledger.models import DeviceLedger
+    return DeviceLedger(
+        device=device if keep_device else None,
+        device_name=device.model,
+        operation_type=operation_type,
+        operation_date=timezone.now(),
+        status_after_operation=status_after_operation,
+        description=description,
+        operator=current_actor(),
+    )
+
+
+def _write(ledgers):
+    from ledger.models import DeviceLedger
+    if not ledgers:
+        return
+    pending = _pending.get()
+    if pending is not None:
+        pending.extend(ledgers)
+    elif len(ledgers) == 1:
+        ledgers[0].save()
+    else:
+        DeviceLedger.objects.bulk_create(ledgers)
+
+
+def _status_change(device):
+    """设备状态与加载时不同则返回状态变更记录，并把当前值记为新的原值"""
+    original = getattr(device, '_audit_original', {}).get('status')
+    device._audit_original = _loaded_values(device)
+    if original and original != device.status:
+        return _ledger(device, 'other', device.status, f'设备状态变更：{original} → {device.status}')
+    return None
+
+
+def record_device_saved(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    if created:
+        instance._audit_original = _loaded_values(instance)
+        _write([_ledger(
+            instance, 'other', instance.status, f'新增设备：{instance.device_code} - {instance.model}'
+        )])
+        return
+    ledger = _status_change(instance)
+    if ledger is not None:
+        _write([ledger])
+
+
+def record_device_deleted(sender, instance, **kwargs):
+    # 设备已删除，台账只保留名称快照，设备编号写在描述中（ledger.exports.operation_device_code 从中提取）
+    _write([_ledger(
+        instance, 'discard', 'discarded', f'删除设备：{instance.device_code} - {instance.model}', keep_device=False
+    )])
+
+
+@contextmanager
+def audit_batch():
+    """代码块内产生的设备台账记录在结束时一次写入（嵌套时由最外层写入）"""
+    if _pending.get() is not None:
+        yield
+        return
+    from ledger.models import DeviceLedger
+    pending = []
+    token = _pending.set(pending)
+    try:
+        with transaction.atomic():
+            yield
+            _pending.reset(token)
+            token = None
+            DeviceLedger.objects.bulk_create(pending)
+    finally:
+        if token is not None:
+            _pending.reset(token)
+
+
+def bulk_update_devices(devices, fields, batch_size=500):
+    """批量更新设备并记录状态变更：一次 bulk_update + 一次 bulk_create
+
+    devices 应是从数据库加载的实例（原值在加载时记录）。
+    bulk_update 不发送 post_save 信号，由这里代替信号处理：修改了被搜索的列时批量更新搜索索引，
+    修改了校外价格时批量重算预约统计的校外收入。
+    """
+    devices = list(devices)
+    if not devices:
+        return 0
+    fields = list(fields)
+    with audit_batch():
+        if 'updated_at' not in fields:
+            now = timezone.now()
+            for device in devices:
+                device.updated_at = now
+            fields.append('updated_at')
+        updated = Device.objects.bulk_update(devices, fields, batch_size=batch_size)
+        if 'status' in fields:
+            _write([ledger for ledger in map(_status_change, devices) if ledger is not None])
+        _sync_dependents(devices, fields)
+    return updated
+
+
+def _sync_dependents(devices, fields):
+    """bulk_update 之后同步搜索索引和预约统计（模块内导入，避免设备模块加载时依赖预约/搜索模块）"""
+    from booking.rollups import reprice_devices
+    from search.index import INDEXES, index_instances
+    if set(fields) & set(INDEXES[Device].fields):
+        index_instances(Device, devices)
+    if 'price_external' in fields:
+        reprice_devices(devices)
+
+
+post_init.connect(remember_original, sender=Device, dispatch_uid='device_audit_init')
+post_save.connect(record_device_saved, sender=Device, dispatch_uid='device_audit_save')
+post_delete.connect(record_device_deleted, sender=Device, dispatch_uid='device_audit_delete')
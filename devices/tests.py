@@ -1,3 +1,107 @@
+from django.contrib.auth.models import User, Group
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from devices.audit import audit_batch, bulk_update_devices
+from devices.models import Device
+from jnu_lab_system.actor import acting_as
+from ledger.models import DeviceLedger
+
+
+class DeviceAuditTestCase(TestCase):
+    """设备变更审计测试：原值在加载时记录、操作员取自当前请求、批量操作批量写台账"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.admin = User.objects.create_user(username='admin01', password='test123456')
+        self.admin.groups.add(Group.objects.create(name='设备管理员'))
+        # 其他工作人员账号不应被当作操作员
+        User.objects.create_user(username='staff', password='test123456', is_staff=True)
+        self.devices = [Device.objects.create(device_code=f'DEV00{i}', model=f'型号{i}') for i in range(3)]
+
+    def test_save_records_changes_without_extra_queries(self):
+        """测试保存设备只执行更新语句，状态变化时多一条台账记录"""
+        device = Device.objects.get(pk=self.devices[0].pk)
+        device.price_external = 100
+        # 设备更新 + 预约统计重新定价（预约模块的信号），不再查询旧记录和操作员
+        with self.assertNumQueries(2):
+            device.save()
+        self.assertEqual(DeviceLedger.objects.filter(device=device).count(), 1)
+
+        # 价格未变化时不再重新定价
+        device.status = 'maintenance'
+        with acting_as(self.admin), self.assertNumQueries(2):
+            device.save()
+        ledger = DeviceLedger.objects.filter(device=device).latest('id')
+        self.assertEqual(ledger.description, '设备状态变更：available → maintenance')
+        self.assertEqual(ledger.operator, self.admin)
+
+        # 原值随保存更新，再次保存只有一条更新语句，不重复记录
+        with self.assertNumQueries(1):
+            device.save()
+        self.assertEqual(DeviceLedger.objects.filter(device=device).count(), 2)
+
+    def test_bulk_update_syncs_search_index_and_rollups(self):
+        """测试批量修改被搜索的列和校外价格后，搜索索引和预约统计随之更新"""
+        from datetime import date
+        from decimal import Decimal
+        from booking.models import Booking, DailyDeviceStats
+        from search.index import search
+        from user.models import UserInfo
+        external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external', department='校外单位', phone='13800138002'
+        )
+        Booking.objects.create(
+            booking_code='BOOK001', applicant=external, device=self.devices[0], booking_date=date(2025, 3, 10),
+            time_slot='08:00-10:00', status='manager_approved'
+        )
+        devices = list(Device.objects.order_by('device_code'))
+        for device in devices:
+            device.model = f'Spectrometer {device.device_code}'
+            device.price_external = Decimal('120')
+        bulk_update_devices(devices, ['model', 'price_external'])
+
+        found = search(Device.objects.all(), 'spectrometer').values_list('device_code', flat=True)
+        self.assertEqual(sorted(found), ['DEV000', 'DEV001', 'DEV002'])
+        self.assertEqual(search(Device.objects.all(), '型号1').count(), 0)
+        stats = DailyDeviceStats.objects.get(device=devices[0], user_type='external')
+        self.assertEqual(stats.revenue, Decimal('120'))
+
+    def test_operator_from_request(self):
+        """测试通过页面操作时操作员为当前登录用户，命令等无请求场景操作员为空"""
+        self.assertIsNone(DeviceLedger.objects.get(device=self.devices[0]).operator)
+
+        self.client.force_login(self.admin)
+        self.client.get(reverse('device_manage'), {'status_action': 'maintenance', 'pk': self.devices[1].pk})
+        ledger = DeviceLedger.objects.filter(device=self.devices[1]).latest('id')
+        self.assertEqual(ledger.status_after_operation, 'maintenance')
+        self.assertEqual(ledger.operator, self.admin)
+
+        self.client.get(reverse('device_delete', args=[self.devices[2].pk]))
+        ledger = DeviceLedger.objects.get(operation_type='discard')
+        self.assertIsNone(ledger.device)
+        self.assertEqual(ledger.description, '删除设备：DEV002 - 型号2')
+        self.assertEqual(ledger.operator, self.admin)
+
+    def test_bulk_update_writes_ledgers_in_batch(self):
+        """测试批量修改状态：一次 bulk_update、一次 bulk_create，只记录状态确实变化的设备"""
+        devices = list(Device.objects.order_by('device_code'))
+        devices[0].status = 'maintenance'
+        devices[1].status = 'discarded'
+        # 保存点 + 更新 + 台账 + 释放保存点
+        with acting_as(self.admin), self.assertNumQueries(4):
+            self.assertEqual(bulk_update_devices(devices, ['status']), 3)
+        ledgers = DeviceLedger.objects.filter(description__startswith='设备状态变更').order_by('device__device_code')
+        self.assertEqual([ledger.status_after_operation for ledger in ledgers], ['maintenance', 'discarded'])
+        self.assertTrue(all(ledger.operator == self.admin for ledger in ledgers))
+        self.assertEqual(Device.objects.get(pk=devices[1].pk).status, 'discarded')
+
+        # audit_batch 中逐个新增设备，台账记录最后一次写入
+        with CaptureQueriesContext(connection) as queries:
+            with audit_batch():
+                for i in range(4):
+                    Device.objects.create(device_code=f'NEW00{i}', model='新设备')
+        self.assertEqual(len([q for q in queries if 'INSERT INTO "ledger_deviceledger"' in q['sql']]), 1)
+        self.assertEqual(DeviceLedger.objects.filter(description__startswith='新增设备：NEW').count(), 4)
@@ -6,32 +6,16 @@ from .models import Device
 from .forms import DeviceForm
 from ledger.models import DeviceLedger
 from django.utils import timezone
+from jnu_lab_system.identity import get_current_user_info
+from search.index import search
 
 def get_user_role_context(request):
     """辅助函数：获取用户角色信息"""
-    # 多角色支持：如果使用了角色特定的session，从那里获取用户
-    from jnu_lab_system.multi_role_session import get_role_from_path, get_user_from_role_session
-    
-    role = get_role_from_path(request.path)
-    current_user = request.user
-    
-    # 如果路径匹配某个角色，尝试从角色特定的session中获取用户
-    if role:
-        role_user = get_user_from_role_session(request, role)
-        if role_user:
-            current_user = role_user
-    
-    # 确保用户已登录
-    if not current_user.is_authenticated:
-        return {
-            'is_admin': False,
-            'is_manager': False,
-        }
-    is_admin = current_user.groups.filter(name='设备管理员').exists()
-    is_manager = current_user.groups.filter(name='实验室负责人').exists()
+    # 多角色支持：MultiRoleSessionMiddleware 已按URL路径切换 request.user，
+    # request.roles 对应当前用户，用户组每个session只查询一次
     return {
-        'is_admin': is_admin,
-        'is_manager': is_manager,
+        'is_admin': request.roles.is_admin,
+        'is_manager': request.roles.is_manager,
     }
 
 @login_required
@@ -42,14 +26,13 @@ def device_manage(request):
     注意：管理员和负责人都可以访问设备管理，但会根据角色显示不同的界面
     """
     # 权限检查：必须是管理员或负责人
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     if not is_admin and not is_manager and not request.user.is_superuser:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             messages.error(request, '您没有权限访问设备管理页面！')
             return redirect('user_home')
         except:
@@ -61,11 +44,7 @@ def device_manage(request):
     keyword = request.GET.get('keyword', '')
     if keyword:
         # 按设备编号/型号/厂商模糊搜索（增强搜索体验）
-        devices = Device.objects.filter(
-            Q(device_code__icontains=keyword) | 
-            Q(model__icontains=keyword) |
-            Q(manufacturer__icontains=keyword)
-        )
+        devices = search(Device.objects.all(), keyword, ['device_code', 'model', 'manufacturer'])
     else:
         # 无搜索时显示所有设备，按编号排序
         devices = Device.objects.all().order_by('device_code')
@@ -173,8 +152,8 @@ def device_delete(request, pk):
     对应路径：/labadmin/device/delete/<int:pk>/
     """
     # 权限检查：必须是管理员或负责人
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     if not is_admin and not is_manager and not request.user.is_superuser:
         messages.error(request, '您没有权限删除设备！')
         return redirect('user_login')
@@ -204,8 +183,8 @@ def device_detail(request, pk):
     功能：1. 展示设备详情 2. 处理设备编辑提交
     """
     # 权限检查：必须是管理员或负责人
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     if not is_admin and not is_manager and not request.user.is_superuser:
         messages.error(request, '您没有权限访问设备详情页面！')
         return redirect('user_login')
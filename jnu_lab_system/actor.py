@@ -0,0 +1,47 @@
+"""
+当前操作用户
+请求期间由 CurrentActorMiddleware 记录当前请求，模型层的审计记录（如设备台账）通过 current_actor()
+取得操作员，不需要把 request 逐层传下去，也不需要查询数据库猜测操作员。
+管理命令、后台任务等没有请求的场景可以用 acting_as(user) 指定操作员，否则操作员为空（显示为"系统"）。
+"""
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+_current_request = ContextVar('current_request', default=None)
+_current_actor = ContextVar('current_actor', default=None)
+
+
+def current_actor():
+    """当前操作用户（auth.User），未登录或不在请求中时返回 None"""
+    actor = _current_actor.get()
+    if actor is not None:
+        return actor
+    request = _current_request.get()
+    user = getattr(request, 'user', None)
+    if user is not None and user.is_authenticated:
+        return user
+    return None
+
+
+@contextmanager
+def acting_as(user):
+    """在代码块内以 user 作为操作员"""
+    token = _current_actor.set(user)
+    try:
+        yield user
+    finally:
+        _current_actor.reset(token)
+
+
+class CurrentActorMiddleware:
+    """记录当前请求（必须在多角色会话中间件之后，request.user 已是当前角色的用户）"""
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+
+    def __call__(self, request):
+        token = _current_request.set(request)
+        try:
+            return self.get_response(request)
+        finally:
+            _current_request.reset(token)
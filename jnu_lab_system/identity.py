@@ -0,0 +1,136 @@
+"""
+请求级身份对象
+同一请求内只加载一次 User、UserInfo 和用户组标记，由多角色中间件、
+上下文处理器和各视图共享；可选按（session, 用户ID）短时缓存，跨请求复用。
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from user.models import UserInfo
+from jnu_lab_system.roles import Roles, load_group_names
+
+IDENTITY_CACHE_PREFIX = 'identity'
+
+
+def _cache_timeout():
+    """身份缓存时间（秒），0 表示不缓存（默认）"""
+    return getattr(settings, 'IDENTITY_CACHE_TIMEOUT', 0)
+
+
+def _version_key(user_id):
+    return f'{IDENTITY_CACHE_PREFIX}:version:{user_id}'
+
+
+def invalidate_identity(user_id):
+    """用户或其用户信息变化时调用，使该用户的所有身份缓存失效"""
+    if user_id is None:
+        return
+    key = _version_key(user_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def identity_cache_key(request, user_id):
+    """身份缓存键：session + 用户ID + 用户版本号；未启用缓存或没有session时返回None"""
+    if not _cache_timeout() or user_id is None:
+        return None
+    session = getattr(request, 'session', None)
+    session_key = session.session_key if session is not None else None
+    if not session_key:
+        return None
+    version = cache.get(_version_key(user_id), 0)
+    return f'{IDENTITY_CACHE_PREFIX}:{session_key}:{user_id}:{version}'
+
+
+def cache_get(key):
+    if key is None:
+        return {}
+    return cache.get(key) or {}
+
+
+def cache_update(key, **values):
+    """合并写入身份缓存"""
+    if key is None:
+        return
+    entry = cache.get(key) or {}
+    entry.update(values)
+    cache.set(key, entry, _cache_timeout())
+
+
+class RequestIdentity:
+    """当前请求的身份：用户、用户信息及角色标记（均在首次访问时加载）"""
+
+    def __init__(self, request, user):
+        self._request = request
+        self.user = user
+        self.role = getattr(request, '_current_role', None)
+        self.is_authenticated = bool(user and user.is_authenticated)
+        self._cache_key = identity_cache_key(request, user.pk) if self.is_authenticated else None
+
+    @cached_property
+    def user_info(self):
+        """当前用户的 UserInfo（管理员/负责人等没有 UserInfo 的账户为 None）"""
+        if not self.is_authenticated:
+            return None
+        entry = cache_get(self._cache_key)
+        if 'user_info' in entry:
+            return entry['user_info']
+        user_info = UserInfo.objects.filter(auth_user_id=self.user.pk).first()
+        cache_update(self._cache_key, user_info=user_info)
+        return user_info
+
+    @cached_property
+    def roles(self):
+        """当前用户的角色标记（用户组在session内缓存）"""
+        if not self.is_authenticated:
+            return Roles()
+        return Roles(self.user, load_group_names(self._request, self.user))
+
+    @property
+    def group_names(self):
+        return self.roles.group_names
+
+    @property
+    def is_admin(self):
+        return self.roles.is_admin
+
+    @property
+    def is_manager(self):
+        return self.roles.is_manager
+
+    @property
+    def user_type(self):
+        return self.user_info.user_type if self.user_info else None
+
+    @property
+    def is_teacher(self):
+        return self.user_type == 'teacher'
+
+    @property
+    def is_student(self):
+        return self.user_type == 'student'
+
+    @property
+    def is_external(self):
+        return self.user_type == 'external'
+
+
+def get_identity(request):
+    """获取当前请求的身份对象（同一请求、同一用户只创建一次）"""
+    identity = getattr(request, '_identity', None)
+    user = getattr(request, 'user', None)
+    # 请求过程中切换了用户（如登录/退出）时重新创建
+    if identity is None or identity.user is not user:
+        identity = RequestIdentity(request, user)
+        request._identity = identity
+    return identity
+
+
+def get_current_user_info(request):
+    """当前用户的 UserInfo，不存在时抛出 UserInfo.DoesNotExist（与 UserInfo.objects.get 一致）"""
+    user_info = get_identity(request).user_info
+    if user_info is None:
+        raise UserInfo.DoesNotExist('当前用户没有关联的用户信息')
+    return user_info
@@ -1,6 +1,5 @@
 """访问控制中间件：工作人员只能在局域网访问"""
 from django.http import HttpResponseForbidden
-from django.contrib.auth.models import Group
 from ipaddress import ip_address, ip_network
 
 # 局域网IP段（根据实际网络配置修改）
@@ -45,10 +44,7 @@ class StaffAccessControlMiddleware:
         
         # 检查用户是否是工作人员（管理员或负责人）
         if request.user.is_authenticated:
-            is_admin = request.user.groups.filter(name='设备管理员').exists()
-            is_manager = request.user.groups.filter(name='实验室负责人').exists()
-            
-            if is_admin or is_manager:
+            if request.roles.is_admin or request.roles.is_manager:
                 # 工作人员只能从局域网访问
                 client_ip = get_client_ip(request)
                 if not is_lan_ip(client_ip):
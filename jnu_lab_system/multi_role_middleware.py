@@ -7,6 +7,7 @@ from django.contrib.auth import get_user
 from django.contrib.auth.models import AnonymousUser
 from django.utils.functional import SimpleLazyObject
 from jnu_lab_system.multi_role_session import get_user_from_role_session, get_role_from_path
+from jnu_lab_system.roles import RequestRoles
 
 
 class MultiRoleSessionMiddleware:
@@ -43,5 +44,8 @@ class MultiRoleSessionMiddleware:
             request._using_role_session = False
             request._current_role = None
         
+        # 角色标记：用户组每个session只查询一次，视图中使用 request.roles.is_admin 等
+        request.roles = RequestRoles(request)
+        
         response = self.get_response(request)
         return response
@@ -29,7 +29,7 @@ def get_role_from_path(path):
     return None
 
 def get_user_from_role_session(request, role=None):
-    """从角色特定的session中获取用户"""
+    """从角色特定的session中获取用户（同一请求内只加载一次）"""
     if role is None:
         role = get_role_from_path(request.path)
     
@@ -40,21 +40,48 @@ def get_user_from_role_session(request, role=None):
     role_session_key = ROLE_SESSION_PREFIXES[role]
     user_id = request.session.get(role_session_key)
     
-    if user_id:
-        User = get_user_model()
-        try:
-            user = User.objects.get(pk=user_id)
-            # 设置backend，确保用户可以被正确认证
-            backend_key = f"{role_session_key}_backend"
-            backend = request.session.get(backend_key, 'django.contrib.auth.backends.ModelBackend')
-            user.backend = backend
-            # 标记用户为已认证（模拟Django的认证系统）
-            user._state.adding = False
-            return user
-        except User.DoesNotExist:
-            return None
+    if not user_id:
+        return None
     
-    return None
+    # 同一请求内中间件、上下文处理器、视图共享同一个用户对象
+    role_users = request.__dict__.setdefault('_role_users', {})
+    if role in role_users:
+        return role_users[role]
+    
+    user = _load_role_user(request, user_id)
+    if user is not None:
+        # 设置backend，确保用户可以被正确认证
+        backend_key = f"{role_session_key}_backend"
+        backend = request.session.get(backend_key, 'django.contrib.auth.backends.ModelBackend')
+        user.backend = backend
+        # 标记用户为已认证（模拟Django的认证系统）
+        user._state.adding = False
+    role_users[role] = user
+    return user
+
+def _load_role_user(request, user_id):
+    """加载角色用户：优先复用标准登录的用户和身份缓存，最后才查询数据库"""
+    from django.contrib.auth.middleware import get_user as get_cached_user
+    from jnu_lab_system.identity import cache_get, cache_update, identity_cache_key
+    
+    # 角色用户与标准登录是同一账户时，复用 AuthenticationMiddleware 加载的用户
+    if str(request.session.get(SESSION_KEY)) == str(user_id):
+        auth_user = get_cached_user(request)
+        if auth_user.is_authenticated and auth_user.pk == user_id:
+            return auth_user
+    
+    cache_key = identity_cache_key(request, user_id)
+    user = cache_get(cache_key).get('user')
+    if user is not None:
+        return user
+    
+    User = get_user_model()
+    try:
+        user = User.objects.get(pk=user_id)
+    except User.DoesNotExist:
+        return None
+    cache_update(cache_key, user=user)
+    return user
 
 def set_role_session_user(request, user, role=None):
     """在角色特定的session中设置用户"""
@@ -0,0 +1,141 @@
+"""
+角色解析
+每个用户的用户组在一个session内只查询一次，结果保存在session中，
+并用缓存中的版本号校验；用户组成员变化时换用新的版本号，下次请求重新加载。
+版本号是随机生成的，缓存重启或被清除后重新生成的版本号不会与session中保存的相同。
+进程内缓存（LocMemCache）在多进程之间不共享，其他进程看不到版本号的变化，
+因此session中的角色只在 ROLES_LOCAL_CACHE_TTL 秒内复用。
+视图中通过 request.roles.is_admin / request.roles.is_manager 判断角色，
+不再逐个执行 groups.filter(name=...).exists()。
+"""
+import time
+import uuid
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.core.cache.backends.locmem import LocMemCache
+
+ROLES_CACHE_PREFIX = 'roles'
+ROLES_SESSION_KEY = '_cached_roles'
+
+# 组名
+ADMIN_GROUP = '设备管理员'
+MANAGER_GROUP = '实验室负责人'
+
+
+def _version_key(user_id):
+    return f'{ROLES_CACHE_PREFIX}:version:{user_id}'
+
+
+def _current_version(user_id):
+    """用户组版本号；缓存不可用（如开发环境的DummyCache）时返回None，此时不在session中复用"""
+    key = _version_key(user_id)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        version = cache.get(key)
+    return version
+
+
+def _reuse_timeout():
+    """session中的角色可复用的秒数：共享缓存不限（None），进程内缓存为 ROLES_LOCAL_CACHE_TTL"""
+    if isinstance(caches['default'], LocMemCache):
+        return getattr(settings, 'ROLES_LOCAL_CACHE_TTL', 60)
+    return None
+
+
+def invalidate_roles(*user_ids):
+    """用户组成员变化时调用，使这些用户保存在session中的角色失效"""
+    for user_id in set(user_ids):
+        if user_id is None:
+            continue
+        cache.set(_version_key(user_id), uuid.uuid4().hex, None)
+
+
+def load_group_names(request, user):
+    """加载用户所属的用户组名称（同一session、同一版本号内只查询一次）"""
+    if user is None or not user.is_authenticated:
+        return frozenset()
+
+    session = getattr(request, 'session', None)
+    version = _current_version(user.pk)
+    user_key = str(user.pk)
+    if session is not None and version is not None:
+        stored = session.get(ROLES_SESSION_KEY, {}).get(user_key)
+        timeout = _reuse_timeout()
+        if stored and stored.get('version') == version and (
+            timeout is None or time.time() - stored.get('loaded_at', 0) < timeout
+        ):
+            return frozenset(stored['groups'])
+
+    group_names = frozenset(user.groups.values_list('name', flat=True))
+    if session is not None and version is not None:
+        # 同一浏览器可能同时登录多个角色的账户，按用户ID分别保存
+        cached_roles = dict(session.get(ROLES_SESSION_KEY, {}))
+        cached_roles[user_key] = {'version': version, 'groups': sorted(group_names), 'loaded_at': time.time()}
+        session[ROLES_SESSION_KEY] = cached_roles
+    return group_names
+
+
+class Roles:
+    """用户的角色标记"""
+
+    def __init__(self, user=None, group_names=()):
+        self.group_names = frozenset(group_names)
+        self.is_superuser = bool(user is not None and getattr(user, 'is_superuser', False))
+
+    @property
+    def is_admin(self):
+        """设备管理员"""
+        return ADMIN_GROUP in self.group_names
+
+    @property
+    def is_manager(self):
+        """实验室负责人"""
+        return MANAGER_GROUP in self.group_names
+
+    @property
+    def is_staff_member(self):
+        """实验室工作人员（设备管理员、实验室负责人或超级管理员）"""
+        return self.is_admin or self.is_manager or self.is_superuser
+
+    def __contains__(self, group_name):
+        return group_name in self.group_names
+
+
+def get_user_roles(request, user):
+    """任意用户的角色（如登录时刚认证的用户），用户组会缓存到当前session"""
+    return Roles(user, load_group_names(request, user))
+
+
+class RequestRoles:
+    """request.roles：始终对应当前的 request.user（登录/切换角色后自动更新）"""
+
+    def __init__(self, request):
+        self._request = request
+
+    def _roles(self):
+        from jnu_lab_system.identity import get_identity
+        return get_identity(self._request).roles
+
+    @property
+    def group_names(self):
+        return self._roles().group_names
+
+    @property
+    def is_admin(self):
+        return self._roles().is_admin
+
+    @property
+    def is_manager(self):
+        return self._roles().is_manager
+
+    @property
+    def is_superuser(self):
+        return self._roles().is_superuser
+
+    @property
+    def is_staff_member(self):
+        return self._roles().is_staff_member
+
+    def __contains__(self, group_name):
+        return group_name in self._roles()
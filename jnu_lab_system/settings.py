@@ -54,6 +54,7 @@ INSTALLED_APPS = [
     'ledger',
     'manager',
     'labadmin',
+    'search',
 ]
 
 MIDDLEWARE = [
@@ -63,6 +64,7 @@ MIDDLEWARE = [
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
     "jnu_lab_system.multi_role_middleware.MultiRoleSessionMiddleware",  # 多角色会话支持（必须在AuthenticationMiddleware之后）
+    "jnu_lab_system.actor.CurrentActorMiddleware",  # 记录当前操作用户（设备台账等审计记录使用）
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "jnu_lab_system.middleware.StaffAccessControlMiddleware",  # 工作人员访问控制（已禁用，保留功能）
@@ -137,6 +139,10 @@ USE_TZ = True
 
 STATIC_URL = "static/"
 
+# 生成的文件（后台导出任务的结果文件保存在 MEDIA_ROOT/exports/ 下，只能通过下载视图获取）
+MEDIA_URL = "media/"
+MEDIA_ROOT = BASE_DIR / "media"
+
 # 开发环境禁用缓存，确保代码更新后立即生效
 if DEBUG:
     CACHES = {
@@ -158,6 +164,21 @@ if DEBUG:
     SESSION_COOKIE_SECURE = False  # 开发环境不需要HTTPS
     SESSION_ENGINE = 'django.contrib.sessions.backends.db'  # 使用数据库存储session，确保每个用户独立
 
+# 请求身份（User/UserInfo）按 session 短时缓存的秒数，0 表示只在单个请求内复用
+IDENTITY_CACHE_TIMEOUT = 0
+# 使用进程内缓存（LocMemCache）时，session中保存的用户组最多复用的秒数（其他进程的用户组变化不能及时通知到本进程）
+ROLES_LOCAL_CACHE_TTL = 60
+
+# 后台导出任务
+# thread：在Web进程的线程池中执行；command：只排队，由 python manage.py run_export_jobs 执行
+EXPORT_JOB_RUNNER = 'thread'
+EXPORT_JOB_WORKERS = 2
+# 导出文件保留天数，过期后由 python manage.py cleanup_export_jobs 删除
+EXPORT_JOB_TTL_DAYS = 7
+
+# 财务处缴费接口地址，为空时只模拟发送；本地联调可指向 python manage.py finance_stub_server
+FINANCE_API_URL = os.environ.get('FINANCE_API_URL', '')
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.2/ref/settings/#default-auto-field
 
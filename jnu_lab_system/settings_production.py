@@ -0,0 +1,132 @@
+"""
+生产环境配置
+使用方法：export DJANGO_SETTINGS_MODULE=jnu_lab_system.settings_production
+
+在开发配置的基础上关闭DEBUG，启用真实缓存、cached_db会话和模板缓存，
+各项均可通过环境变量切换：
+
+    DJANGO_SECRET_KEY          生产环境密钥（必须设置，未设置时启动报错）
+    DJANGO_ALLOWED_HOSTS       允许的主机名，逗号分隔
+    DJANGO_CACHE_BACKEND       file（默认）/ redis（设置了 REDIS_URL 时默认）/ locmem / dummy
+    DJANGO_CACHE_LOCATION      file：缓存目录；redis：连接地址（默认取 REDIS_URL）
+    REDIS_URL                  配置后默认使用Redis缓存，如 redis://127.0.0.1:6379/1
+    DJANGO_CACHE_TIMEOUT       缓存默认过期时间（秒），默认300
+    DJANGO_CACHE_MAX_ENTRIES   file：最多缓存的条目数，默认10000
+    DJANGO_SESSION_ENGINE      cached_db（默认；locmem/dummy 缓存时默认 db）/ cache / db
+    DJANGO_TEMPLATE_CACHE      是否启用模板缓存加载器，默认 1
+    IDENTITY_CACHE_TIMEOUT     请求身份短时缓存（秒），默认60，0为关闭
+    ROLES_LOCAL_CACHE_TTL      locmem缓存时session中的用户组最多复用的秒数，默认60
+    DJANGO_MEDIA_ROOT          导出文件保存目录，默认 <项目目录>/media
+    EXPORT_JOB_RUNNER          后台导出执行方式：thread（默认）/ command
+    EXPORT_JOB_WORKERS         thread 方式下每个进程的导出线程数，默认2
+"""
+import os
+
+from django.core.exceptions import ImproperlyConfigured
+
+from .settings import *  # noqa: F401,F403
+from .settings import BASE_DIR, TEMPLATES
+
+
+def env_bool(name, default):
+    value = os.environ.get(name)
+    if value is None:
+        return default
+    return value.strip().lower() in ('1', 'true', 'yes', 'on')
+
+
+def env_list(name, default):
+    value = os.environ.get(name)
+    if not value:
+        return default
+    return [item.strip() for item in value.split(',') if item.strip()]
+
+
+DEBUG = env_bool('DJANGO_DEBUG', False)
+
+SECRET_KEY = os.environ.get('DJANGO_SECRET_KEY')
+if not SECRET_KEY:
+    raise ImproperlyConfigured('生产配置必须通过环境变量 DJANGO_SECRET_KEY 设置密钥')
+
+ALLOWED_HOSTS = env_list('DJANGO_ALLOWED_HOSTS', ['127.0.0.1', 'localhost'])
+
+
+# ---------------------- 缓存 ----------------------
+REDIS_URL = os.environ.get('REDIS_URL', '')
+# 没有Redis时默认使用文件缓存：多个worker进程共享同一缓存，会话、计数和各类缓存失效对所有进程生效
+CACHE_BACKEND = os.environ.get('DJANGO_CACHE_BACKEND', 'redis' if REDIS_URL else 'file').lower()
+CACHE_TIMEOUT = int(os.environ.get('DJANGO_CACHE_TIMEOUT', 300))
+
+if CACHE_BACKEND == 'redis':
+    # Django内置Redis后端，需要安装 redis（已在requirements.txt中）
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', REDIS_URL or 'redis://127.0.0.1:6379/1'),
+            'TIMEOUT': CACHE_TIMEOUT,
+            'KEY_PREFIX': 'jnu_lab',
+        }
+    }
+elif CACHE_BACKEND == 'file':
+    # 没有Redis时的默认缓存：多进程部署（如gunicorn多worker）时各进程共享同一缓存目录
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
+            'LOCATION': os.environ.get('DJANGO_CACHE_LOCATION', str(BASE_DIR / 'cache')),
+            'TIMEOUT': CACHE_TIMEOUT,
+            # 默认300个文件，超出时随机删除三分之一（包括会话、版本号），对本系统的缓存键数量过小
+            'OPTIONS': {'MAX_ENTRIES': int(os.environ.get('DJANGO_CACHE_MAX_ENTRIES', 10000))},
+        }
+    }
+elif CACHE_BACKEND == 'dummy':
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+        }
+    }
+else:
+    # 仅适用于单进程部署：进程内存缓存（多进程之间不共享，缓存失效只在本进程生效）
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+            'LOCATION': 'jnu_lab_system',
+            'TIMEOUT': CACHE_TIMEOUT,
+        }
+    }
+
+
+# ---------------------- 会话 ----------------------
+# cached_db：读会话走缓存，写会话同时写数据库，缓存丢失时不会掉登录。
+# 进程内缓存不在worker之间共享，一个进程中的退出登录不会让其他进程缓存的会话失效，因此默认只用数据库会话
+SESSION_ENGINE = 'django.contrib.sessions.backends.' + os.environ.get(
+    'DJANGO_SESSION_ENGINE', 'db' if CACHE_BACKEND in ('locmem', 'dummy') else 'cached_db'
+)
+SESSION_COOKIE_HTTPONLY = True
+SESSION_COOKIE_SAMESITE = 'Lax'
+SESSION_COOKIE_AGE = 86400
+SESSION_COOKIE_SECURE = env_bool('DJANGO_SECURE_COOKIES', False)
+CSRF_COOKIE_SECURE = SESSION_COOKIE_SECURE
+
+
+# ---------------------- 模板 ----------------------
+TEMPLATES[0]['OPTIONS']['debug'] = DEBUG
+if env_bool('DJANGO_TEMPLATE_CACHE', True):
+    # 模板编译结果缓存在进程内（使用自定义loaders时不能同时设置APP_DIRS）
+    TEMPLATES[0]['APP_DIRS'] = False
+    TEMPLATES[0]['OPTIONS']['loaders'] = [
+        ('django.template.loaders.cached.Loader', [
+            'django.template.loaders.filesystem.Loader',
+            'django.template.loaders.app_directories.Loader',
+        ]),
+    ]
+
+
+# ---------------------- 应用内缓存 ----------------------
+IDENTITY_CACHE_TIMEOUT = int(os.environ.get('IDENTITY_CACHE_TIMEOUT', 60))
+ROLES_LOCAL_CACHE_TTL = int(os.environ.get('ROLES_LOCAL_CACHE_TTL', 60))
+
+
+# ---------------------- 后台导出 ----------------------
+MEDIA_ROOT = os.environ.get('DJANGO_MEDIA_ROOT', str(BASE_DIR / 'media'))
+EXPORT_JOB_RUNNER = os.environ.get('EXPORT_JOB_RUNNER', 'thread')
+EXPORT_JOB_WORKERS = int(os.environ.get('EXPORT_JOB_WORKERS', 2))
@@ -1,3 +1,136 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.contrib.auth.models import User
+from django.db import connection
+from django.urls import reverse
 
-# Create your tests here.
+from user.models import UserInfo
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'identity-tests',
+    }
+}
+
+DUMMY_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    }
+}
+
+
+class RequestIdentityTestCase(TestCase):
+    """请求级身份对象测试：User/UserInfo 在一个请求内只加载一次"""
+
+    def setUp(self):
+        """设置测试数据并以普通用户角色登录"""
+        self.auth_user = User.objects.create_user(username='T001', password='test123456')
+        self.user_info = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001', auth_user=self.auth_user
+        )
+        self.client.post(reverse('user_login'), {
+            'username': 'T001', 'password': 'test123456', 'role': 'user'
+        })
+
+    def _count_table_queries(self, url):
+        """请求页面，返回（auth_user查询次数, user_userinfo查询次数）"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        sqls = [q['sql'] for q in ctx.captured_queries if q['sql'].startswith('SELECT')]
+        auth_queries = [sql for sql in sqls if 'FROM "auth_user"' in sql]
+        info_queries = [sql for sql in sqls if 'FROM "user_userinfo"' in sql and '"user_userinfo"."auth_user_id" =' in sql]
+        return len(auth_queries), len(info_queries)
+
+    def test_single_lookup_per_request(self):
+        """测试中间件、上下文处理器和视图共享同一个身份对象"""
+        auth_queries, info_queries = self._count_table_queries(reverse('user_profile'))
+        self.assertEqual(auth_queries, 1)
+        self.assertEqual(info_queries, 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES, IDENTITY_CACHE_TIMEOUT=60)
+    def test_cached_across_requests(self):
+        """测试启用短时缓存后，后续请求不再查询 UserInfo，修改用户信息后缓存失效"""
+        self._count_table_queries(reverse('user_profile'))
+        _, info_queries = self._count_table_queries(reverse('user_profile'))
+        self.assertEqual(info_queries, 0)
+
+        self.user_info.name = '张教授'
+        self.user_info.save()
+        _, info_queries = self._count_table_queries(reverse('user_profile'))
+        self.assertEqual(info_queries, 1)
+
+
+class RoleResolutionTestCase(TestCase):
+    """角色解析测试：用户组每个session只查询一次"""
+
+    def setUp(self):
+        """设置测试数据并以设备管理员角色登录"""
+        from django.contrib.auth.models import Group
+        self.admin_group = Group.objects.create(name='设备管理员')
+        self.manager_group = Group.objects.create(name='实验室负责人')
+        self.admin = User.objects.create_user(username='admin01', password='test123456')
+        self.admin.groups.add(self.admin_group)
+
+    def _login(self):
+        self.client.post(reverse('user_login'), {
+            'username': 'admin01', 'password': 'test123456', 'role': 'admin'
+        })
+
+    def _count_group_queries(self, url):
+        """请求页面，返回查询 auth_group 的次数"""
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return sum(1 for q in ctx.captured_queries if 'FROM "auth_group"' in q['sql'])
+
+    @override_settings(CACHES=DUMMY_CACHES)
+    def test_single_group_query_without_cache(self):
+        """测试未配置缓存时每个请求最多查询一次用户组（原先每个请求2次以上）"""
+        self._login()
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_groups_cached_in_session(self):
+        """测试用户组保存在session中，后续请求不再查询；成员变化后重新加载"""
+        self._login()
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 0)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 0)
+
+        self.admin.groups.add(self.manager_group)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 0)
+
+        # 通过用户组一侧移除成员同样使缓存失效
+        self.manager_group.user_set.remove(self.admin)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_cache_restart_does_not_reuse_roles(self):
+        """测试缓存清空后重新生成的版本号与session中保存的不同，用户组重新加载"""
+        from django.core.cache import cache
+        self._login()
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 0)
+        cache.clear()
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 0)
+
+    @override_settings(CACHES=LOCMEM_CACHES, ROLES_LOCAL_CACHE_TTL=0)
+    def test_local_cache_reuse_is_time_limited(self):
+        """测试进程内缓存时session中的角色只在 ROLES_LOCAL_CACHE_TTL 内复用"""
+        self._login()
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+        self.assertEqual(self._count_group_queries(reverse('admin_home')), 1)
+
+    @override_settings(CACHES=LOCMEM_CACHES)
+    def test_request_roles(self):
+        """测试 request.roles 的角色标记"""
+        self._login()
+        response = self.client.get(reverse('admin_home'))
+        roles = response.wsgi_request.roles
+        self.assertTrue(roles.is_admin)
+        self.assertFalse(roles.is_manager)
+        self.assertTrue(roles.is_staff_member)
+        self.assertIn('设备管理员', roles)
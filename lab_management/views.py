@@ -12,6 +12,7 @@ from django.views.decorators.csrf import csrf_protect
 from django.views.decorators.http import require_http_methods
 from user.models import UserInfo  # 导入你的用户信息模型
 from jnu_lab_system.multi_role_session import set_role_session_user, get_user_from_role_session, clear_role_session
+from jnu_lab_system.roles import get_user_roles
 
 @require_http_methods(["GET", "POST"])
 @csrf_protect
@@ -50,12 +51,12 @@ def user_login(request):
         
         elif role == 'admin':
             # 设备管理员：必须属于「设备管理员」组，或超级管理员
-            if not (user.groups.filter(name='设备管理员').exists() or user.is_superuser):
+            if not (get_user_roles(request, user).is_admin or user.is_superuser):
                 role_error = '该账号不是设备管理员！'
         
         elif role == 'manager':
             # 实验室负责人：必须属于「实验室负责人」组
-            if not user.groups.filter(name='实验室负责人').exists():
+            if not get_user_roles(request, user).is_manager:
                 role_error = '该账号不是实验室负责人！'
         
         else:
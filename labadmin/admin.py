@@ -1,3 +1,11 @@
 from django.contrib import admin
 
 # Register your models here.
+from .models import ExportJob
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = ('id', 'export_type', 'file_format', 'status', 'rows_written', 'requested_by', 'created_at', 'finished_at')
+    list_filter = ('export_type', 'status', 'file_format')
+    readonly_fields = ('created_at', 'started_at', 'finished_at')
@@ -0,0 +1,113 @@
+"""批量审批：指导教师 / 管理员 / 负责人一次处理多条预约申请
+
+一个事务内完成：锁定并读取待审批预约（1 次查询）→ 按申请人类型分组，每个目标状态一次条件 UPDATE（预约状态机）
+→ 审批记录、借出台账各一次 bulk_create → 修改审批队列计数、发送一次 bookings_changed。
+负责人批准后的缴费请求在事务提交后合并为一批，由后台线程发送到财务处。
+"""
+from django.db import connection
+from booking.models import Booking
+from booking.state_machine import side_effects, transition
+
+# 各审批级别处理的预约状态
+QUEUE_STATUS = {
+    'teacher': 'teacher_pending',
+    'admin': 'pending',
+    'manager': 'admin_approved',
+}
+
+# (审批级别, 操作) -> {申请人类型: 审批后的状态}；不在表中的申请人类型不能由该级别审批
+TRANSITIONS = {
+    ('teacher', 'approve'): {'student': 'pending', 'teacher': 'pending', 'external': 'pending'},
+    ('teacher', 'reject'): {'student': 'teacher_rejected', 'teacher': 'teacher_rejected', 'external': 'teacher_rejected'},
+    ('admin', 'approve'): {'student': 'manager_approved', 'teacher': 'manager_approved', 'external': 'admin_approved'},
+    ('admin', 'reject'): {'student': 'admin_rejected', 'teacher': 'admin_rejected', 'external': 'admin_rejected'},
+    ('manager', 'approve'): {'external': 'payment_pending'},
+    ('manager', 'reject'): {'external': 'manager_rejected'},
+}
+
+# 审批通过后直接借出（写借出台账）的状态
+BORROWED_STATUS = 'manager_approved'
+# 审批通过后需要缴费（向财务处发送缴费请求）的状态
+PAYMENT_STATUS = 'payment_pending'
+
+# 一次最多审批的预约数
+MAX_BATCH_SIZE = 1000
+
+
+def _parse_ids(booking_ids):
+    ids = []
+    for value in booking_ids:
+        try:
+            ids.append(int(value))
+        except (TypeError, ValueError):
+            continue
+    return list(dict.fromkeys(ids))
+
+
+def bulk_approve(booking_ids, action, approver, approval_level, comment='', comments=None, teacher=None):
+    """批量批准/拒绝预约
+
+    booking_ids: 预约ID列表；action: 'approve' / 'reject'；approval_level: 'teacher' / 'admin' / 'manager'
+    teacher: 指导教师审批时为当前教师（UserInfo），只能审批指定其为指导教师的预约
+    comment: 统一的审批备注；comments: {预约编号: 备注}，优先于 comment
+    返回每条预约的处理结果（按 booking_ids 的顺序）：
+    {'id', 'booking_code', 'success', 'status'（审批后的状态）, 'error'}
+    查询次数与预约数量无关。
+    """
+    if (approval_level, action) not in TRANSITIONS:
+        raise ValueError(f'不支持的审批操作：{approval_level} {action}')
+    if approval_level == 'teacher' and teacher is None:
+        raise ValueError('指导教师审批需要提供当前教师')
+    ids = _parse_ids(booking_ids)
+    if len(ids) > MAX_BATCH_SIZE:
+        raise ValueError(f'一次最多审批{MAX_BATCH_SIZE}条预约')
+    transitions = TRANSITIONS[(approval_level, action)]
+    queue_status = QUEUE_STATUS[approval_level]
+    comments = comments or {}
+    results = {booking_id: {'id': booking_id, 'booking_code': None, 'success': False, 'status': None,
+                            'error': '预约不存在'} for booking_id in ids}
+
+    with side_effects() as effects:
+        bookings = Booking.objects.filter(id__in=ids).select_related('applicant', 'device').order_by('id')
+        if connection.features.has_select_for_update:
+            of = ('self',) if connection.features.has_select_for_update_of else ()
+            bookings = bookings.select_for_update(of=of)
+        bookings = list(bookings) if ids else []
+
+        groups = {}  # 审批后的状态 -> [预约]
+        for booking in bookings:
+            result = results[booking.id]
+            result.update(booking_code=booking.booking_code, status=booking.status, error=None)
+            if teacher is not None and booking.teacher_id != teacher.id:
+                result['error'] = '该预约申请指定的指导教师不是您'
+            elif booking.status != queue_status:
+                result['error'] = f'预约状态为「{booking.get_status_display()}」，不在审批队列中'
+            elif booking.applicant.user_type not in transitions:
+                result['error'] = '该申请人类型的预约不由当前角色审批'
+            else:
+                groups.setdefault(transitions[booking.applicant.user_type], []).append(booking)
+
+        for new_status, group in groups.items():
+            transition(group, new_status)
+            for booking in group:
+                results[booking.id].update(success=True, status=new_status)
+                effects.record_approval(
+                    booking, approver, approval_level, action, comments.get(booking.booking_code) or comment
+                )
+                if new_status == BORROWED_STATUS:
+                    effects.record_borrow(booking, approver)
+                elif new_status == PAYMENT_STATUS:
+                    # 校外人员：负责人批准后需要缴费（实际缴费确认通过财务处回调完成）
+                    effects.request_payment(booking)
+
+    return [results[booking_id] for booking_id in ids]
+
+
+def summarize(results):
+    """批量审批结果统计"""
+    succeeded = [result for result in results if result['success']]
+    return {
+        'total': len(results),
+        'succeeded': len(succeeded),
+        'failed': len(results) - len(succeeded),
+    }
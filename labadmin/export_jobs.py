@@ -0,0 +1,219 @@
+"""
+后台导出任务
+台账、用户台账和报表导出在请求参数中带 background=1 时不再同步生成文件，而是：
+
+1. 保存一条 ExportJob（导出类型 + 筛选条件），立即返回 202 和状态查询地址；
+2. 事务提交后交给执行器生成文件：
+   - EXPORT_JOB_RUNNER = 'thread'：当前进程的线程池（EXPORT_JOB_WORKERS 个线程）；
+   - EXPORT_JOB_RUNNER = 'command'：只排队，由 python manage.py run_export_jobs 执行；
+3. 文件写入 MEDIA_ROOT/exports/，生成过程中定期更新已导出行数，页面轮询状态接口显示进度；
+4. 完成后通过下载视图（只允许任务申请人）获取文件，过期文件由 cleanup_export_jobs 清理。
+
+导出内容与同步导出完全相同：都由 ledger.exports / manager.exports / labadmin.reports 中的
+函数按保存下来的筛选条件生成。
+"""
+import functools
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from django.conf import settings
+from django.core.files import File
+from django.db import connection, transaction
+from django.http import JsonResponse
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.module_loading import import_string
+from jnu_lab_system.exports import ExportTable, csv_chunks, write_xlsx
+from jnu_lab_system.multi_role_session import get_role_from_path
+from .models import ExportJob
+
+logger = logging.getLogger(__name__)
+
+# 导出类型 -> 生成函数（接收筛选条件字典，返回 ExportTable 或带 write() 的报表导出对象）
+EXPORT_BUILDERS = {
+    'device_ledger': 'ledger.exports.device_ledger_table',
+    'operation_history': 'ledger.exports.operation_history_table',
+    'teacher_ledger': 'ledger.exports.teacher_ledger_table',
+    'student_ledger': 'ledger.exports.student_ledger_table',
+    'external_ledger': 'ledger.exports.external_ledger_table',
+    'booking_ledger': 'ledger.exports.booking_ledger_table',
+    'user_ledger': 'manager.exports.user_ledger_table',
+    'report': 'labadmin.reports.report_export',
+}
+
+# 不属于筛选条件的请求参数
+CONTROL_PARAMS = ('background', 'format')
+
+# 每写入多少行更新一次进度
+PROGRESS_EVERY = 1000
+
+# 各角色的状态查询/下载路由（多角色会话按URL前缀区分身份，轮询地址必须与发起导出的页面同一前缀）
+JOB_URL_NAMES = {
+    'admin': ('export_job_status', 'export_job_download'),
+    'manager': ('manager_export_job_status', 'manager_export_job_download'),
+    None: ('ledger:export_job_status', 'ledger:export_job_download'),
+}
+
+_executor = None
+
+
+def _get_executor():
+    global _executor
+    if _executor is None:
+        _executor = ThreadPoolExecutor(
+            max_workers=getattr(settings, 'EXPORT_JOB_WORKERS', 2),
+            thread_name_prefix='export-job',
+        )
+    return _executor
+
+
+def create_job(user, export_type, params, file_format='xlsx'):
+    """保存导出任务，事务提交后按 EXPORT_JOB_RUNNER 调度执行"""
+    if export_type == 'report':
+        # 报表是多段格式的工作簿，只提供Excel
+        file_format = 'xlsx'
+    job = ExportJob.objects.create(
+        export_type=export_type,
+        file_format=file_format if file_format in ('xlsx', 'csv') else 'xlsx',
+        params=params,
+        requested_by=user if user is not None and user.is_authenticated else None,
+    )
+    if getattr(settings, 'EXPORT_JOB_RUNNER', 'thread') == 'thread':
+        transaction.on_commit(lambda: _get_executor().submit(_run_in_thread, job.pk))
+    return job
+
+
+def _run_in_thread(job_id):
+    try:
+        run_job(job_id)
+    finally:
+        # 工作线程的数据库连接不会被请求周期回收，每个任务结束后关闭
+        connection.close()
+
+
+class _ProgressRows:
+    """包装行迭代器，统计写入行数并定期写回任务进度"""
+
+    def __init__(self, job_id, rows):
+        self.job_id = job_id
+        self.rows = rows
+        self.count = 0
+
+    def __iter__(self):
+        for row in self.rows:
+            self.count += 1
+            if self.count % PROGRESS_EVERY == 0:
+                ExportJob.objects.filter(pk=self.job_id).update(rows_written=self.count)
+            yield row
+
+
+def _write_file(job, fileobj):
+    """按任务参数生成导出内容写入 fileobj，返回 (下载文件名, 行数)"""
+    result = import_string(EXPORT_BUILDERS[job.export_type])(job.params)
+    if not isinstance(result, ExportTable):
+        return f'{result.filename}.xlsx', result.write(fileobj)
+
+    progress = _ProgressRows(job.pk, result.rows)
+    result.rows = iter(progress)
+    if job.file_format == 'csv':
+        for chunk in csv_chunks(result):
+            fileobj.write(chunk)
+    else:
+        write_xlsx(result, fileobj)
+    return f'{result.filename}.{job.file_format}', progress.count
+
+
+def run_job(job_id):
+    """执行一个排队中的任务；已被其他执行器领取的任务直接跳过，返回是否执行"""
+    claimed = ExportJob.objects.filter(pk=job_id, status='pending').update(
+        status='running', started_at=timezone.now()
+    )
+    if not claimed:
+        return False
+
+    job = ExportJob.objects.get(pk=job_id)
+    try:
+        with tempfile.TemporaryFile() as fileobj:
+            filename, rows = _write_file(job, fileobj)
+            fileobj.seek(0)
+            job.file.save(filename, File(fileobj), save=False)
+        job.filename = filename
+        job.rows_written = rows
+        job.status = 'success'
+    except Exception as e:
+        logger.exception('导出任务 %s 执行失败', job_id)
+        job.status = 'failed'
+        job.error = str(e)
+    job.finished_at = timezone.now()
+    job.save(update_fields=['file', 'filename', 'rows_written', 'status', 'error', 'finished_at'])
+    return True
+
+
+def run_pending_jobs(limit=None):
+    """按创建顺序执行排队中的任务，返回执行的任务数"""
+    job_ids = ExportJob.objects.filter(status='pending').order_by('created_at').values_list('id', flat=True)
+    if limit:
+        job_ids = job_ids[:limit]
+    return sum(1 for job_id in list(job_ids) if run_job(job_id))
+
+
+def expired_jobs():
+    """超过保留天数的任务"""
+    days = getattr(settings, 'EXPORT_JOB_TTL_DAYS', 7)
+    return ExportJob.objects.filter(created_at__lt=timezone.now() - timedelta(days=days))
+
+
+def delete_jobs(jobs):
+    """删除任务及其导出文件，返回删除的任务数"""
+    count = 0
+    for job in jobs.iterator():
+        if job.file:
+            job.file.delete(save=False)
+        job.delete()
+        count += 1
+    return count
+
+
+def job_urls(request, job):
+    """与当前页面同一角色前缀的状态查询和下载地址"""
+    status_name, download_name = JOB_URL_NAMES.get(get_role_from_path(request.path), JOB_URL_NAMES[None])
+    return reverse(status_name, args=[job.pk]), reverse(download_name, args=[job.pk])
+
+
+def job_status_data(request, job):
+    status_url, download_url = job_urls(request, job)
+    return {
+        'id': job.pk,
+        'export_type': job.export_type,
+        'export_type_display': job.get_export_type_display(),
+        'format': job.file_format,
+        'status': job.status,
+        'status_display': job.get_status_display(),
+        'rows_written': job.rows_written,
+        'error': job.error,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+        'status_url': status_url,
+        'download_url': download_url if job.status == 'success' else None,
+    }
+
+
+def background_export(export_type, params_from=None):
+    """导出视图装饰器：请求参数带 background=1 时创建后台任务并返回 202，否则照常同步导出
+
+    params_from(request, *args, **kwargs) 返回额外的任务参数（如报表ID）。
+    """
+    def decorator(view_func):
+        @functools.wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if request.GET.get('background') != '1':
+                return view_func(request, *args, **kwargs)
+            params = {key: value for key, value in request.GET.items() if key not in CONTROL_PARAMS}
+            if params_from is not None:
+                params.update(params_from(request, *args, **kwargs))
+            job = create_job(request.user, export_type, params, request.GET.get('format', 'xlsx'))
+            return JsonResponse(job_status_data(request, job), status=202)
+        return wrapper
+    return decorator
@@ -0,0 +1,39 @@
+"""
+清理过期导出任务的管理命令（删除超过 EXPORT_JOB_TTL_DAYS 天的任务及其导出文件）
+使用方法：python manage.py cleanup_export_jobs
+建议通过定时任务每天运行一次
+"""
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from labadmin.export_jobs import delete_jobs, expired_jobs
+
+
+class Command(BaseCommand):
+    help = '清理过期的后台导出任务和导出文件'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='仅显示将要删除的导出任务，不实际删除',
+        )
+
+    def handle(self, *args, **options):
+        dry_run = options.get('dry_run', False)
+
+        jobs = expired_jobs()
+        count = jobs.count()
+
+        if count == 0:
+            self.stdout.write(self.style.SUCCESS('没有需要清理的过期导出任务。'))
+            return
+
+        if dry_run:
+            self.stdout.write(self.style.WARNING(
+                f'将删除 {count} 个超过 {settings.EXPORT_JOB_TTL_DAYS} 天的导出任务：'
+            ))
+            for job in jobs:
+                self.stdout.write(f'  - {job} {job.file.name or "（无文件）"}')
+        else:
+            deleted_count = delete_jobs(jobs)
+            self.stdout.write(self.style.SUCCESS(f'已删除 {deleted_count} 个过期导出任务。'))
@@ -0,0 +1,35 @@
+"""
+执行排队中的后台导出任务
+使用方法：python manage.py run_export_jobs [--loop] [--interval 5]
+EXPORT_JOB_RUNNER = 'command' 时导出任务只排队，需要由本命令执行：
+不带 --loop 时执行完当前排队的任务后退出（可配合定时任务），带 --loop 时作为常驻进程轮询。
+多个进程同时运行时，每个任务只会被一个进程领取。
+"""
+import time
+from django.core.management.base import BaseCommand
+from labadmin.export_jobs import run_pending_jobs
+
+
+class Command(BaseCommand):
+    help = '执行排队中的后台导出任务'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--loop', action='store_true', help='持续轮询新任务，不退出')
+        parser.add_argument('--interval', type=float, default=5, help='轮询间隔（秒），默认5')
+
+    def handle(self, *args, **options):
+        if not options['loop']:
+            count = run_pending_jobs()
+            self.stdout.write(self.style.SUCCESS(f'已执行 {count} 个导出任务。'))
+            return
+
+        self.stdout.write(f'开始轮询导出任务（间隔 {options["interval"]} 秒），按 Ctrl+C 退出')
+        try:
+            while True:
+                count = run_pending_jobs()
+                if count:
+                    self.stdout.write(f'已执行 {count} 个导出任务。')
+                else:
+                    time.sleep(options['interval'])
+        except KeyboardInterrupt:
+            self.stdout.write(self.style.SUCCESS('已停止。'))
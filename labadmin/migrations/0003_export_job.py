@@ -0,0 +1,40 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:30
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('labadmin', '0002_alter_report_report_type'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ExportJob',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('export_type', models.CharField(choices=[('device_ledger', '设备台账'), ('operation_history', '设备操作历史'), ('teacher_ledger', '教师台账'), ('student_ledger', '学生台账'), ('external_ledger', '校外人员台账'), ('booking_ledger', '预约台账'), ('user_ledger', '用户台账'), ('report', '统计报表')], max_length=30, verbose_name='导出类型')),
+                ('file_format', models.CharField(choices=[('xlsx', 'Excel'), ('csv', 'CSV')], default='xlsx', max_length=10, verbose_name='文件格式')),
+                ('params', models.JSONField(default=dict, verbose_name='筛选条件')),
+                ('status', models.CharField(choices=[('pending', '排队中'), ('running', '生成中'), ('success', '已完成'), ('failed', '失败')], default='pending', max_length=10, verbose_name='状态')),
+                ('rows_written', models.PositiveIntegerField(default=0, verbose_name='已导出行数')),
+                ('file', models.FileField(blank=True, upload_to='exports/%Y/%m/', verbose_name='导出文件')),
+                ('filename', models.CharField(blank=True, max_length=200, verbose_name='下载文件名')),
+                ('error', models.TextField(blank=True, verbose_name='错误信息')),
+                ('created_at', models.DateTimeField(auto_now_add=True, verbose_name='创建时间')),
+                ('started_at', models.DateTimeField(blank=True, null=True, verbose_name='开始时间')),
+                ('finished_at', models.DateTimeField(blank=True, null=True, verbose_name='完成时间')),
+                ('requested_by', models.ForeignKey(blank=True, null=True, on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL, verbose_name='申请人')),
+            ],
+            options={
+                'verbose_name': '导出任务',
+                'verbose_name_plural': '导出任务',
+                'ordering': ['-created_at'],
+                'indexes': [models.Index(fields=['status', 'created_at'], name='labadmin_ex_status_f18c58_idx')],
+            },
+        ),
+    ]
@@ -60,3 +60,52 @@ class Report(models.Model):
     def set_report_data(self, data):
         """设置报表数据"""
         self.report_data = data
+
+
+class ExportJob(models.Model):
+    """后台导出任务：大批量台账/报表在后台线程或 run_export_jobs 命令中生成文件，页面轮询状态后下载"""
+    EXPORT_TYPE_CHOICES = (
+        ('device_ledger', '设备台账'),
+        ('operation_history', '设备操作历史'),
+        ('teacher_ledger', '教师台账'),
+        ('student_ledger', '学生台账'),
+        ('external_ledger', '校外人员台账'),
+        ('booking_ledger', '预约台账'),
+        ('user_ledger', '用户台账'),
+        ('report', '统计报表'),
+    )
+    FORMAT_CHOICES = (
+        ('xlsx', 'Excel'),
+        ('csv', 'CSV'),
+    )
+    STATUS_CHOICES = (
+        ('pending', '排队中'),
+        ('running', '生成中'),
+        ('success', '已完成'),
+        ('failed', '失败'),
+    )
+
+    export_type = models.CharField(max_length=30, choices=EXPORT_TYPE_CHOICES, verbose_name='导出类型')
+    file_format = models.CharField(max_length=10, choices=FORMAT_CHOICES, default='xlsx', verbose_name='文件格式')
+    params = models.JSONField(default=dict, verbose_name='筛选条件')
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default='pending', verbose_name='状态')
+    rows_written = models.PositiveIntegerField(default=0, verbose_name='已导出行数')
+    file = models.FileField(upload_to='exports/%Y/%m/', blank=True, verbose_name='导出文件')
+    filename = models.CharField(max_length=200, blank=True, verbose_name='下载文件名')
+    error = models.TextField(blank=True, verbose_name='错误信息')
+
+    requested_by = models.ForeignKey(User, on_delete=models.CASCADE, null=True, blank=True, verbose_name='申请人')
+    created_at = models.DateTimeField(auto_now_add=True, verbose_name='创建时间')
+    started_at = models.DateTimeField(null=True, blank=True, verbose_name='开始时间')
+    finished_at = models.DateTimeField(null=True, blank=True, verbose_name='完成时间')
+
+    class Meta:
+        verbose_name = '导出任务'
+        verbose_name_plural = '导出任务'
+        ordering = ['-created_at']
+        indexes = [
+            models.Index(fields=['status', 'created_at']),
+        ]
+
+    def __str__(self):
+        return f"{self.get_export_type_display()} - {self.get_status_display()} ({self.created_at:%Y-%m-%d %H:%M})"
@@ -0,0 +1,403 @@
+"""
+报表服务
+管理员报表页面、负责人报表页面、generate_reports 命令和Excel导出共用。
+
+- ReportEngine：读取每日设备统计表（booking.DailyDeviceStats）算出汇总、按设备、
+  按用户类型和按日期的统计，查询次数与设备数量、预约数量无关；
+- get_report_data：按（报表类型, 起止日期, 数据版本号）缓存统计结果，
+  统计范围内的预约变化或设备/用户信息变化时版本号递增，缓存自动失效。
+"""
+import hashlib
+import json
+import re
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from django.core.cache import cache
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import Count, Max, Sum
+from django.db.models.functions import Coalesce
+from django.http import HttpResponse
+from openpyxl import Workbook
+from openpyxl.styles import Font, Alignment
+from openpyxl.utils import get_column_letter
+from booking.models import Booking, DailyDeviceStats
+from booking.rollups import APPROVED_STATUS
+from devices.models import Device
+from .models import Report
+
+# 通过/拒绝/待处理的状态分组和使用时长（每个预约2小时）见 booking.rollups
+# 设备使用率计算：每天可用8小时
+AVAILABLE_HOURS_PER_DAY = 8
+
+
+class ReportEngine:
+    """某时间段的报表统计（共5次查询）
+
+    状态汇总、按设备和按日期的统计读取每日设备统计表（DailyDeviceStats），
+    一年最多 365 × 设备数 × 3 行；只有按用户类型的去重用户数需要查询已通过的预约。
+
+    用法：
+        report_data = ReportEngine(start_date, end_date).build()
+    """
+
+    def __init__(self, start_date, end_date):
+        self.start_date = start_date
+        self.end_date = end_date
+
+    @property
+    def daily_stats(self):
+        return DailyDeviceStats.objects.filter(date__gte=self.start_date, date__lte=self.end_date)
+
+    @property
+    def approved_bookings(self):
+        return Booking.objects.filter(
+            booking_date__gte=self.start_date,
+            booking_date__lte=self.end_date,
+            status=APPROVED_STATUS,
+        )
+
+    def summary_counts(self):
+        """状态汇总和校外总收入（1次查询）"""
+        return self.daily_stats.aggregate(
+            total_bookings=Coalesce(Sum('total_count'), 0),
+            approved_count=Coalesce(Sum('approved_count'), 0),
+            rejected_count=Coalesce(Sum('rejected_count'), 0),
+            pending_count=Coalesce(Sum('pending_count'), 0),
+            total_revenue=Sum('revenue'),
+        )
+
+    def device_rows(self):
+        """按设备分组的已通过预约数、使用时长和校外收入（1次查询），按预约数倒序"""
+        return list(self.daily_stats.values('device__device_code', 'device__model').annotate(
+            booking_count=Sum('approved_count'),
+            usage_hours=Sum('usage_hours'),
+            external_revenue=Sum('revenue'),
+            price=Max('device__price_external'),
+        ).filter(booking_count__gt=0).order_by('-booking_count', 'device__device_code'))
+
+    def user_type_stats(self):
+        """按用户类型统计（1次查询，用户数需要按申请人去重）"""
+        return list(self.approved_bookings.values('applicant__user_type').annotate(
+            booking_count=Count('id'),
+            user_count=Count('applicant', distinct=True)
+        ))
+
+    def date_stats(self):
+        """按日期统计，用于图表（1次查询）"""
+        return [
+            {'booking_date': row['date'], 'booking_count': row['booking_count']}
+            for row in self.daily_stats.values('date').annotate(
+                booking_count=Sum('approved_count')
+            ).filter(booking_count__gt=0).order_by('date')
+        ]
+
+    def build(self):
+        """生成报表数据（结构与原 generate_report_data 一致）"""
+        summary = self.summary_counts()
+        rows = self.device_rows()
+        user_type_stats = self.user_type_stats()
+        devices = list(Device.objects.values_list('device_code', 'model'))
+
+        device_stats = []
+        usage_by_code = {}
+        for row in rows:
+            usage_by_code[row['device__device_code']] = (
+                row['booking_count'], row['usage_hours'], row['external_revenue']
+            )
+            device_stats.append({
+                'device__device_code': row['device__device_code'],
+                'device__model': row['device__model'],
+                'booking_count': row['booking_count'],
+                # 所有已通过预约按设备校外价格计算的金额
+                'revenue': float((row['price'] or 0) * row['booking_count']),
+            })
+
+        # 设备使用率统计（包括没有预约的设备）
+        days = (self.end_date - self.start_date).days + 1
+        total_hours = max(days * AVAILABLE_HOURS_PER_DAY, 1)  # 防止除以0
+        device_usage = []
+        for device_code, model in devices:
+            booking_count, usage_hours, external_revenue = usage_by_code.get(device_code, (0, 0, None))
+            device_usage.append({
+                'device_code': device_code,
+                'device_model': model,
+                'booking_count': booking_count,
+                'usage_hours': usage_hours,
+                'usage_rate': round(usage_hours / total_hours * 100, 2),
+                'revenue': float(external_revenue or Decimal('0')),
+            })
+
+        return {
+            'summary': {
+                'total_bookings': summary['total_bookings'],
+                'approved_count': summary['approved_count'],
+                'rejected_count': summary['rejected_count'],
+                'pending_count': summary['pending_count'],
+                'total_devices': len(devices),
+                # 每个申请人只有一种用户类型，各类型用户数之和即为总用户数
+                'total_users': sum(row['user_count'] for row in user_type_stats),
+                'total_revenue': float(summary['total_revenue'] or Decimal('0')),
+            },
+            'device_stats': device_stats,
+            'user_type_stats': user_type_stats,
+            'date_stats': self.date_stats(),
+            'device_usage': device_usage,
+        }
+
+
+# ---------------------- 统计结果缓存 ----------------------
+REPORT_CACHE_PREFIX = 'reports'
+REPORT_CACHE_TIMEOUT = 3600
+# 设备、用户信息（设备编号/型号/校外价格、用户类型）变化时整体失效
+_REFERENCE_VERSION_KEY = f'{REPORT_CACHE_PREFIX}:version:reference'
+
+
+def _month_version_key(month):
+    return f'{REPORT_CACHE_PREFIX}:version:{month.strftime("%Y-%m")}'
+
+
+def _months_between(start_date, end_date):
+    month = date(start_date.year, start_date.month, 1)
+    while month <= end_date:
+        yield month
+        month = date(month.year + 1, 1, 1) if month.month == 12 else date(month.year, month.month + 1, 1)
+
+
+def _bump(key):
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_report_cache(*dates):
+    """这些日期所在月份的预约发生变化时调用"""
+    for month in {date(day.year, day.month, 1) for day in dates if day is not None}:
+        _bump(_month_version_key(month))
+
+
+def invalidate_all_reports():
+    """设备或用户信息变化时调用，所有时间段的统计结果失效"""
+    _bump(_REFERENCE_VERSION_KEY)
+
+
+def report_cache_key(report_type, start_date, end_date):
+    """缓存键：报表类型 + 起止日期 + 涉及月份及基础数据的版本号"""
+    version_keys = [_REFERENCE_VERSION_KEY] + [_month_version_key(m) for m in _months_between(start_date, end_date)]
+    versions = cache.get_many(version_keys)
+    signature = ','.join(str(versions.get(key, 0)) for key in version_keys)
+    digest = hashlib.md5(signature.encode()).hexdigest()
+    return f'{REPORT_CACHE_PREFIX}:data:{report_type}:{start_date.isoformat()}:{end_date.isoformat()}:{digest}'
+
+
+def get_report_data(report_type, start_date, end_date):
+    """报表统计数据（带缓存，同一时间段在数据未变化时直接返回缓存结果）"""
+    cache_key = report_cache_key(report_type, start_date, end_date)
+    report_data = cache.get(cache_key)
+    if report_data is None:
+        report_data = ReportEngine(start_date, end_date).build()
+        cache.set(cache_key, report_data, REPORT_CACHE_TIMEOUT)
+    return report_data
+
+
+# ---------------------- 报表时间段与报表记录 ----------------------
+class InvalidReportPeriod(Exception):
+    """报表类型或时间段无效（消息可直接提示给用户）"""
+
+
+def month_range(year, month):
+    """某月的第一天和最后一天"""
+    start_date = date(year, month, 1)
+    if month == 12:
+        end_date = date(year + 1, 1, 1) - timedelta(days=1)
+    else:
+        end_date = date(year, month + 1, 1) - timedelta(days=1)
+    return start_date, end_date
+
+
+def parse_report_period(report_type, date_input='', start_input='', end_input=''):
+    """把页面/命令行输入解析为（起始日期, 结束日期）
+
+    week：输入日期所在周的周一至周日；month：YYYY-MM 或 YYYY-MM-DD 所在月；
+    year：YYYY；custom：start_input 至 end_input。日期格式错误时抛出 ValueError。
+    """
+    if report_type == 'week':
+        input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
+        start_date = input_date - timedelta(days=input_date.weekday())
+        return start_date, start_date + timedelta(days=6)
+    if report_type == 'month':
+        if len(date_input) == 7 and date_input.count('-') == 1:
+            year, month = map(int, date_input.split('-'))
+        else:
+            input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
+            year, month = input_date.year, input_date.month
+        return month_range(year, month)
+    if report_type == 'year':
+        year = int(date_input)
+        return date(year, 1, 1), date(year, 12, 31)
+    if report_type == 'custom':
+        start_date = datetime.strptime(start_input, '%Y-%m-%d').date()
+        end_date = datetime.strptime(end_input, '%Y-%m-%d').date()
+        if start_date > end_date:
+            raise InvalidReportPeriod('起始日期不能晚于结束日期！')
+        return start_date, end_date
+    raise InvalidReportPeriod('无效的报表类型！')
+
+
+def report_name_for(report_type, start_date, end_date):
+    """报表名称"""
+    if report_type == 'month':
+        return f"{start_date.year}年{start_date.month:02d}月报表"
+    if report_type == 'year':
+        return f"{start_date.year}年报表"
+    period = f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')}"
+    return f"{period} 周报表" if report_type == 'week' else f"{period} 自定义报表"
+
+
+def find_existing_report(report_type, start_date, end_date):
+    """已生成的同类型同时间段报表（自定义报表允许重复生成，不查找）"""
+    if report_type == 'custom':
+        return None
+    return Report.objects.filter(
+        report_type=report_type,
+        start_date=start_date,
+        end_date=end_date
+    ).first()
+
+
+def create_report(report_type, start_date, end_date, generated_by=None, report_name=None):
+    """统计并保存报表记录（generated_by 为空表示系统自动生成）"""
+    report_data = get_report_data(report_type, start_date, end_date)
+    # 日期等非JSON类型按 DjangoJSONEncoder 转成字符串后再存入JSONField
+    report_data = json.loads(json.dumps(report_data, cls=DjangoJSONEncoder))
+    return Report.objects.create(
+        report_type=report_type,
+        report_name=report_name or report_name_for(report_type, start_date, end_date),
+        start_date=start_date,
+        end_date=end_date,
+        report_data=report_data,
+        total_bookings=report_data['summary']['total_bookings'],
+        total_devices=report_data['summary']['total_devices'],
+        total_users=report_data['summary']['total_users'],
+        total_revenue=Decimal(str(report_data['summary']['total_revenue'])),
+        generated_by=generated_by
+    )
+
+
+# ---------------------- Excel导出 ----------------------
+USER_TYPE_DISPLAY = {
+    'student': '校内学生',
+    'teacher': '校内教师',
+    'external': '校外人员',
+}
+
+
+def _style_header_row(ws, column_count):
+    header_row = ws.max_row
+    for col in range(1, column_count + 1):
+        cell = ws.cell(row=header_row, column=col)
+        cell.font = Font(bold=True)
+        cell.alignment = Alignment(horizontal='center', vertical='center')
+
+
+def build_report_workbook(report):
+    """把报表记录写入Excel工作簿"""
+    data = report.get_report_data()
+
+    wb = Workbook()
+    ws = wb.active
+    ws.title = "报表"
+
+    # 写入报表基本信息
+    # 转换datetime为naive datetime（移除时区信息）
+    generated_at = report.generated_at.replace(tzinfo=None) if report.generated_at else None
+
+    ws.append(['报表名称', report.report_name])
+    ws.append(['报表类型', report.get_report_type_display()])
+    ws.append(['统计时间', f'{report.start_date.strftime("%Y-%m-%d")} 至 {report.end_date.strftime("%Y-%m-%d")}'])
+    ws.append(['生成时间', generated_at])
+    ws.append(['生成人', report.generated_by.username if report.generated_by else '系统自动'])
+    ws.append([])  # 空行
+
+    # 设置生成时间为日期格式
+    if generated_at:
+        ws.cell(row=4, column=2).number_format = 'yyyy-mm-dd hh:mm:ss'
+
+    # 写入汇总统计
+    ws.append(['汇总统计'])
+    ws.append(['总预约次数', data['summary']['total_bookings']])
+    ws.append(['已审批通过', data['summary']['approved_count']])
+    ws.append(['总收入（元）', data['summary']['total_revenue']])
+    ws.append(['设备总数', data['summary']['total_devices']])
+    ws.append(['用户总数', data['summary']['total_users']])
+    ws.append([])  # 空行
+
+    # 写入设备使用统计
+    ws.append(['设备使用统计'])
+    headers = ['设备编号', '设备型号', '预约次数', '使用时长（小时）', '使用率（%）', '校外收费（元）']
+    ws.append(headers)
+    _style_header_row(ws, len(headers))
+    for device in data.get('device_usage', []):
+        ws.append([
+            device['device_code'],
+            device['device_model'],
+            device['booking_count'],
+            device['usage_hours'],
+            f"{device['usage_rate']}%",
+            device['revenue']
+        ])
+    ws.append([])  # 空行
+
+    # 写入用户类型统计
+    ws.append(['用户类型统计'])
+    headers = ['用户类型', '预约次数', '用户数量']
+    ws.append(headers)
+    _style_header_row(ws, len(headers))
+    for stat in data.get('user_type_stats', []):
+        user_type = stat.get('applicant__user_type', '')
+        ws.append([
+            USER_TYPE_DISPLAY.get(user_type, user_type),
+            stat['booking_count'],
+            stat['user_count']
+        ])
+
+    # 自动调整列宽
+    for column in ws.columns:
+        max_length = max(len(str(cell.value)) for cell in column)
+        ws.column_dimensions[get_column_letter(column[0].column)].width = min(max_length + 2, 50)
+    return wb
+
+
+def report_filename(report):
+    """报表下载文件名（不含扩展名），清理文件名中的特殊字符"""
+    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', report.report_name)
+    return f'report_{report.id}_{safe_filename}'
+
+
+class ReportExport:
+    """后台导出任务使用的报表导出（报表是多段格式的工作簿，不是单张表，直接保存工作簿）"""
+
+    def __init__(self, report):
+        self.report = report
+        self.filename = report_filename(report)
+
+    def write(self, fileobj):
+        """写入Excel文件，返回写入的行数"""
+        wb = build_report_workbook(self.report)
+        wb.save(fileobj)
+        return wb.active.max_row
+
+
+def report_export(params):
+    return ReportExport(Report.objects.get(id=params['report_id']))
+
+
+def report_xlsx_response(report):
+    """报表Excel下载响应"""
+    wb = build_report_workbook(report)
+    response = HttpResponse(
+        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+    )
+    response['Content-Disposition'] = f'attachment; filename="{report_filename(report)}.xlsx"'
+    wb.save(response)
+    return response
@@ -0,0 +1,22 @@
+"""报表缓存失效"""
+from django.db.models.signals import post_save, post_delete
+from django.dispatch import receiver
+from booking.signals import bookings_changed
+from devices.models import Device
+from user.models import UserInfo
+from .reports import invalidate_report_cache, invalidate_all_reports
+
+
+@receiver(bookings_changed)
+def bookings_changed_handler(sender, dates, **kwargs):
+    """预约变化时，使包含这些日期的报表统计缓存失效"""
+    invalidate_report_cache(*dates)
+
+
+@receiver(post_save, sender=Device)
+@receiver(post_delete, sender=Device)
+@receiver(post_save, sender=UserInfo)
+@receiver(post_delete, sender=UserInfo)
+def reference_data_changed(sender, **kwargs):
+    """设备或用户信息变化时，所有报表统计缓存失效"""
+    invalidate_all_reports()
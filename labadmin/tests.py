@@ -1,3 +1,490 @@
-from django.test import TestCase
+from django.test import TestCase, override_settings
+from django.contrib.auth.models import User, Group
+from django.core.management import call_command
+from django.urls import reverse
+from io import StringIO
+from datetime import date, timedelta
+from decimal import Decimal
+from django.db.models import Count, Sum, Q
 
-# Create your tests here.
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+from labadmin.export_jobs import create_job, run_job
+from labadmin.models import ExportJob, Report
+from labadmin.views import generate_report_data
+
+LOCMEM_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'report-tests',
+    }
+}
+
+
+def legacy_generate_report_data(report_type, start_date, end_date):
+    """原 generate_report_data 实现（逐设备查询），作为回归测试的参照"""
+    bookings = Booking.objects.filter(
+        booking_date__gte=start_date,
+        booking_date__lte=end_date
+    )
+    approved_bookings = bookings.filter(status='manager_approved')
+    total_bookings = bookings.count()
+    approved_count = approved_bookings.count()
+    rejected_count = bookings.filter(
+        Q(status='teacher_rejected') | Q(status='admin_rejected') | Q(status='manager_rejected')
+    ).count()
+    pending_count = bookings.filter(
+        Q(status='teacher_pending') | Q(status='pending')
+    ).count()
+    device_stats_queryset = approved_bookings.values('device__device_code', 'device__model').annotate(
+        booking_count=Count('id'),
+        revenue=Sum('device__price_external')
+    ).order_by('-booking_count')
+    device_stats = []
+    for item in device_stats_queryset:
+        item['revenue'] = float(item['revenue'] or 0)
+        device_stats.append(item)
+    user_type_stats = approved_bookings.values('applicant__user_type').annotate(
+        booking_count=Count('id'),
+        user_count=Count('applicant', distinct=True)
+    )
+    date_stats = approved_bookings.values('booking_date').annotate(
+        booking_count=Count('id')
+    ).order_by('booking_date')
+    total_revenue = approved_bookings.filter(
+        applicant__user_type='external'
+    ).aggregate(
+        total=Sum('device__price_external')
+    )['total'] or Decimal('0')
+    device_usage = []
+    for device in Device.objects.all():
+        device_bookings = approved_bookings.filter(device=device)
+        booking_count = device_bookings.count()
+        usage_hours = booking_count * 2
+        days = (end_date - start_date).days + 1
+        total_hours = max(days * 8, 1)
+        usage_rate = (usage_hours / total_hours * 100)
+        dev_rev = device_bookings.filter(applicant__user_type='external').aggregate(
+            total=Sum('device__price_external')
+        )['total'] or Decimal('0')
+        device_usage.append({
+            'device_code': device.device_code,
+            'device_model': device.model,
+            'booking_count': booking_count,
+            'usage_hours': usage_hours,
+            'usage_rate': round(usage_rate, 2),
+            'revenue': float(dev_rev)
+        })
+    return {
+        'summary': {
+            'total_bookings': total_bookings,
+            'approved_count': approved_count,
+            'rejected_count': rejected_count,
+            'pending_count': pending_count,
+            'total_devices': Device.objects.count(),
+            'total_users': UserInfo.objects.filter(booking__in=approved_bookings).distinct().count(),
+            'total_revenue': float(total_revenue),
+        },
+        'device_stats': device_stats,
+        'user_type_stats': list(user_type_stats),
+        'date_stats': list(date_stats),
+        'device_usage': device_usage,
+    }
+
+
+class ReportEngineTestCase(TestCase):
+    """报表统计引擎测试"""
+
+    SLOTS = ['08:00-10:00', '10:00-12:00', '12:00-14:00', '14:00-16:00', '16:00-18:00', '18:00-20:00']
+    STATUSES = [
+        'manager_approved', 'manager_approved', 'manager_approved', 'teacher_pending', 'pending',
+        'admin_approved', 'payment_pending', 'teacher_rejected', 'admin_rejected', 'manager_rejected', 'cancelled',
+    ]
+
+    def setUp(self):
+        """设置测试数据：多台设备、三类用户、覆盖所有状态的预约"""
+        self.start = date(2025, 3, 1)
+        self.end = date(2025, 3, 31)
+        applicants = [
+            UserInfo.objects.create(
+                user_code=f'U{i:03d}', name=f'用户{i}', user_type=user_type,
+                department='测试学院', phone='13800138000'
+            )
+            for i, user_type in enumerate(['student', 'teacher', 'external', 'external', 'teacher'])
+        ]
+        devices = [
+            Device.objects.create(
+                device_code=f'DEV{i:03d}', model=f'型号{i % 3}',
+                price_external=Decimal('100.50') + i
+            )
+            for i in range(8)
+        ]
+        # DEV007 没有任何预约；部分预约落在统计范围之外
+        n = 0
+        for day_offset in range(-3, 35, 2):
+            day = self.start + timedelta(days=day_offset)
+            for device in devices[:7]:
+                for slot in self.SLOTS[:(n % 4) + 1]:
+                    Booking.objects.create(
+                        booking_code=f'BOOK{n:05d}', applicant=applicants[n % len(applicants)],
+                        device=device, booking_date=day, time_slot=slot,
+                        status=self.STATUSES[n % len(self.STATUSES)]
+                    )
+                    n += 1
+
+    def test_identical_to_legacy_implementation(self):
+        """测试新引擎的输出与原实现完全一致"""
+        summary = generate_report_data('month', self.start, self.end)['summary']
+        self.assertGreater(summary['approved_count'], 0)
+        self.assertGreater(summary['total_revenue'], 0)
+        for start, end in [(self.start, self.end), (self.start, self.start), (date(2024, 1, 1), date(2024, 1, 7))]:
+            self.assertEqual(
+                generate_report_data('custom', start, end),
+                legacy_generate_report_data('custom', start, end),
+            )
+
+    def test_constant_query_count(self):
+        """测试查询次数与设备数量无关"""
+        with self.assertNumQueries(5):
+            generate_report_data('month', self.start, self.end)
+        for i in range(8, 48):
+            Device.objects.create(device_code=f'DEV{i:03d}', model='新型号')
+        with self.assertNumQueries(5):
+            report_data = generate_report_data('month', self.start, self.end)
+        self.assertEqual(report_data['summary']['total_devices'], 48)
+        self.assertEqual(len(report_data['device_usage']), 48)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ReportServiceTestCase(TestCase):
+    """报表服务测试：统计结果缓存、报表保存、命令与页面共用"""
+
+    def setUp(self):
+        """设置测试数据"""
+        from django.core.cache import cache
+        cache.clear()
+        self.start = date(2025, 3, 1)
+        self.end = date(2025, 3, 31)
+        self.external = UserInfo.objects.create(
+            user_code='E001', name='王先生', user_type='external',
+            department='校外单位', phone='13800138002'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='型号A', price_external=Decimal('200'))
+        Booking.objects.create(
+            booking_code='BOOK001', applicant=self.external, device=self.device,
+            booking_date=date(2025, 3, 10), time_slot='08:00-10:00', status='manager_approved'
+        )
+
+    def test_memoized_until_booking_in_range_changes(self):
+        """测试同一时间段重复统计直接返回缓存，范围内预约变化后重新统计"""
+        from labadmin.reports import get_report_data
+        with self.assertNumQueries(5):
+            first = get_report_data('month', self.start, self.end)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_report_data('month', self.start, self.end), first)
+
+        # 范围外的预约变化不影响缓存
+        Booking.objects.create(
+            booking_code='BOOK002', applicant=self.external, device=self.device,
+            booking_date=date(2025, 4, 10), time_slot='08:00-10:00', status='manager_approved'
+        )
+        with self.assertNumQueries(0):
+            get_report_data('month', self.start, self.end)
+
+        Booking.objects.filter(booking_code='BOOK001').first().save()
+        Booking.objects.create(
+            booking_code='BOOK003', applicant=self.external, device=self.device,
+            booking_date=date(2025, 3, 11), time_slot='08:00-10:00', status='manager_approved'
+        )
+        with self.assertNumQueries(5):
+            data = get_report_data('month', self.start, self.end)
+        self.assertEqual(data['summary']['approved_count'], 2)
+
+        # 设备价格变化使所有报表缓存失效
+        self.device.price_external = Decimal('300')
+        self.device.save()
+        data = get_report_data('month', self.start, self.end)
+        self.assertEqual(data['summary']['total_revenue'], 600.0)
+
+    def test_generate_reports_command(self):
+        """测试命令通过报表服务生成报表，日期统计以字符串保存"""
+        call_command('generate_reports', type='month', date='2025-03', stdout=StringIO())
+        report = Report.objects.get(report_type='month', start_date=self.start, end_date=self.end)
+        self.assertEqual(report.report_name, '2025年03月报表')
+        self.assertIsNone(report.generated_by)
+        self.assertEqual(report.total_revenue, Decimal('200'))
+        self.assertEqual(report.get_report_data()['date_stats'], [{'booking_date': '2025-03-10', 'booking_count': 1}])
+
+    def test_admin_and_manager_views_share_service(self):
+        """测试管理员、负责人页面生成的报表与命令一致，并可导出Excel"""
+        admin = User.objects.create_user(username='admin01', password='test123456')
+        admin.groups.add(Group.objects.create(name='设备管理员'))
+        self.client.force_login(admin)
+        response = self.client.post(reverse('report_stat'), {
+            'generate': '1', 'report_type': 'custom', 'start_date': '2025-03-01', 'end_date': '2025-03-31'
+        })
+        self.assertEqual(response.status_code, 302)
+        report = Report.objects.get(report_type='custom')
+        self.assertEqual(report.generated_by, admin)
+        self.assertEqual(report.get_report_data()['summary']['approved_count'], 1)
+
+        response = self.client.get(reverse('export_report_csv', args=[report.id]))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            response['Content-Type'], 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+        )
+
+        manager = User.objects.create_user(username='manager01', password='test123456')
+        manager.groups.add(Group.objects.create(name='实验室负责人'))
+        self.client.force_login(manager)
+        self.client.post(reverse('manager_report_stat'), {
+            'generate': '1', 'report_type': 'month', 'date_input': '2025-03'
+        })
+        report = Report.objects.get(report_type='month')
+        self.assertEqual(report.generated_by, manager)
+        self.assertEqual(report.total_bookings, 1)
+
+        # 起始日期晚于结束日期
+        self.client.post(reverse('manager_report_stat'), {
+            'generate': '1', 'report_type': 'custom', 'start_date': '2025-03-31', 'end_date': '2025-03-01'
+        })
+        self.assertEqual(Report.objects.count(), 2)
+
+
+@override_settings(EXPORT_JOB_RUNNER='command')
+class ExportJobTestCase(TestCase):
+    """后台导出任务测试：排队、执行、轮询状态、下载和过期清理"""
+
+    def setUp(self):
+        """设置测试数据"""
+        import shutil
+        import tempfile
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media = override_settings(MEDIA_ROOT=media_root)
+        media.enable()
+        self.addCleanup(media.disable)
+
+        self.admin = User.objects.create_user(username='admin01', password='test123456')
+        self.admin.groups.add(Group.objects.create(name='设备管理员'))
+        student = UserInfo.objects.create(
+            user_code='S001', name='张三', user_type='student',
+            department='物联网学院', phone='13800138001'
+        )
+        for i in range(3):
+            device = Device.objects.create(device_code=f'DEV00{i}', model=f'型号{i}')
+            Booking.objects.create(
+                booking_code=f'BOOK00{i}', applicant=student, device=device,
+                booking_date=date(2025, 3, 10 + i), time_slot='08:00-10:00', status='manager_approved'
+            )
+
+    def test_ledger_export_job(self):
+        """测试台账后台导出：返回202，命令执行后状态为已完成，只有申请人能下载"""
+        self.client.force_login(self.admin)
+        response = self.client.get(
+            reverse('ledger:export_booking_ledger_csv'), {'background': '1', 'format': 'csv', 'device_code': 'DEV00'}
+        )
+        self.assertEqual(response.status_code, 202)
+        data = response.json()
+        self.assertEqual(data['status'], 'pending')
+        self.assertIsNone(data['download_url'])
+        job = ExportJob.objects.get(id=data['id'])
+        self.assertEqual(job.params, {'device_code': 'DEV00'})
+        self.assertEqual(job.file_format, 'csv')
+
+        out = StringIO()
+        call_command('run_export_jobs', stdout=out)
+        self.assertIn('已执行 1 个导出任务', out.getvalue())
+
+        data = self.client.get(data['status_url']).json()
+        self.assertEqual(data['status'], 'success')
+        self.assertEqual(data['rows_written'], 3)
+        response = self.client.get(data['download_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('booking_ledger.csv', response['Content-Disposition'])
+        content = b''.join(response.streaming_content).decode('utf-8-sig')
+        self.assertEqual(len(content.strip().splitlines()), 4)
+        response.close()
+
+        # 已执行的任务不会被重复执行
+        self.assertFalse(run_job(job.id))
+
+        other = User.objects.create_user(username='admin02', password='test123456')
+        other.groups.add(Group.objects.get(name='设备管理员'))
+        self.client.force_login(other)
+        self.assertEqual(self.client.get(data['status_url']).status_code, 404)
+        self.assertEqual(self.client.get(data['download_url']).status_code, 404)
+
+    def test_report_and_user_ledger_jobs(self):
+        """测试报表和用户台账后台导出生成Excel文件，出错的任务标记为失败"""
+        from openpyxl import load_workbook
+        from labadmin.reports import create_report
+        report = create_report('month', date(2025, 3, 1), date(2025, 3, 31))
+        self.client.force_login(self.admin)
+        data = self.client.get(
+            reverse('export_report_csv', args=[report.id]), {'background': '1', 'format': 'csv'}
+        ).json()
+        self.assertTrue(data['status_url'].startswith('/labadmin/'))
+        self.assertEqual(data['format'], 'xlsx')
+        self.assertTrue(run_job(data['id']))
+
+        job = ExportJob.objects.get(id=data['id'])
+        self.assertEqual(job.status, 'success')
+        self.assertEqual(job.filename, f'report_{report.id}_{report.report_name}.xlsx')
+        with job.file.open('rb') as f:
+            self.assertEqual(load_workbook(f).active['B1'].value, report.report_name)
+
+        job = create_job(self.admin, 'user_ledger', {'user_type': 'student'})
+        run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual((job.status, job.rows_written), ('success', 1))
+
+        job = create_job(self.admin, 'report', {'report_id': 0})
+        with self.assertLogs('labadmin.export_jobs', 'ERROR'):
+            run_job(job.id)
+        job.refresh_from_db()
+        self.assertEqual(job.status, 'failed')
+        self.assertTrue(job.error)
+
+    def test_cleanup_expired_jobs(self):
+        """测试清理命令删除过期任务及其文件，保留未过期的任务"""
+        import os
+        from django.utils import timezone
+        old = create_job(self.admin, 'device_ledger', {})
+        run_job(old.id)
+        old.refresh_from_db()
+        path = old.file.path
+        self.assertTrue(os.path.exists(path))
+        ExportJob.objects.filter(id=old.id).update(created_at=timezone.now() - timedelta(days=8))
+        recent = create_job(self.admin, 'device_ledger', {})
+
+        out = StringIO()
+        call_command('cleanup_export_jobs', '--dry-run', stdout=out)
+        self.assertIn('将删除 1 个', out.getvalue())
+        self.assertTrue(ExportJob.objects.filter(id=old.id).exists())
+
+        call_command('cleanup_export_jobs', stdout=StringIO())
+        self.assertFalse(ExportJob.objects.filter(id=old.id).exists())
+        self.assertFalse(os.path.exists(path))
+        self.assertTrue(ExportJob.objects.filter(id=recent.id).exists())
+
+
+class BulkApprovalTestCase(TestCase):
+    """批量审批测试：按申请人类型更新状态、批量写入审批记录和借出台账、返回逐条结果"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.admin = User.objects.create_user(username='admin01', password='test123456')
+        self.admin.groups.add(Group.objects.create(name='设备管理员'))
+        self.manager = User.objects.create_user(username='manager01', password='test123456')
+        self.manager.groups.add(Group.objects.create(name='实验室负责人'))
+        self.device = Device.objects.create(device_code='DEV001', model='示波器')
+        self.applicants = {
+            user_type: UserInfo.objects.create(
+                user_code=f'{user_type[0].upper()}001', name=f'{user_type}用户', user_type=user_type,
+                department='物联网学院', phone='13800138001'
+            )
+            for user_type in ('student', 'teacher', 'external')
+        }
+
+    def _bookings(self, count, user_type, status='pending'):
+        start = Booking.objects.count()
+        return [
+            Booking.objects.create(
+                booking_code=f'BOOK{start + i:04d}', applicant=self.applicants[user_type], device=self.device,
+                booking_date=date(2025, 3, 1) + timedelta(days=start + i), time_slot='08:00-10:00',
+                status=status, payment_amount=Decimal('100.00')
+            )
+            for i in range(count)
+        ]
+
+    def _post(self, url_name, data):
+        import json
+        return self.client.post(reverse(url_name), json.dumps(data), content_type='application/json')
+
+    def test_admin_bulk_approve(self):
+        """测试管理员批量批准：校内人员直接通过并借出，校外人员待负责人审批，查询次数与数量无关"""
+        from django.db import connection
+        from django.test.utils import CaptureQueriesContext
+        from booking.models import ApprovalRecord
+        from ledger.models import DeviceLedger
+
+        internal = self._bookings(3, 'student') + self._bookings(2, 'teacher')
+        external = self._bookings(2, 'external')
+        done = self._bookings(1, 'student', status='manager_approved')
+        self.client.force_login(self.admin)
+
+        # 预热会话、权限等按请求固定的查询
+        self._post('booking_approve_batch', {'booking_ids': [999999], 'action': 'approve'})
+        with CaptureQueriesContext(connection) as small:
+            self._post('booking_approve_batch', {'booking_ids': [internal[0].id, external[0].id], 'action': 'approve'})
+        ids = [booking.id for booking in internal[1:] + external[1:] + done] + [999999, 'x']
+        with CaptureQueriesContext(connection) as queries:
+            response = self._post('booking_approve_batch', {
+                'booking_ids': ids, 'action': 'approve', 'comments': {internal[1].booking_code: '同意'}
+            })
+        self.assertEqual(len(queries), len(small))
+
+        data = response.json()
+        self.assertEqual((data['total'], data['succeeded'], data['failed']), (7, 5, 2))
+        results = {result['id']: result for result in data['results']}
+        self.assertEqual(results[internal[1].id]['status'], 'manager_approved')
+        self.assertEqual(results[external[1].id]['status'], 'admin_approved')
+        self.assertFalse(results[done[0].id]['success'])
+        self.assertEqual(results[999999]['error'], '预约不存在')
+
+        statuses = dict(Booking.objects.values_list('id', 'status'))
+        self.assertTrue(all(statuses[booking.id] == 'manager_approved' for booking in internal))
+        self.assertTrue(all(statuses[booking.id] == 'admin_approved' for booking in external))
+        self.assertEqual(ApprovalRecord.objects.filter(approver=self.admin, approval_level='admin').count(), 7)
+        self.assertEqual(ApprovalRecord.objects.get(booking=internal[1]).comment, '同意')
+        ledgers = DeviceLedger.objects.filter(operation_type='borrow')
+        self.assertEqual(ledgers.count(), 5)
+        self.assertEqual(ledgers.get(description__contains=internal[0].booking_code).operator, self.admin)
+
+    def test_manager_bulk_approve_and_reject(self):
+        """测试负责人只能审批管理员已批准的校外人员预约，批准后待缴费"""
+        external = self._bookings(3, 'external', status='admin_approved')
+        student = self._bookings(1, 'student', status='admin_approved')
+        self.client.force_login(self.manager)
+
+        response = self._post('manager_booking_approve_batch', {
+            'booking_ids': [external[0].id, external[1].id, student[0].id], 'action': 'approve'
+        })
+        data = response.json()
+        self.assertEqual(data['approval_level'], 'manager')
+        self.assertEqual(data['succeeded'], 2)
+        self.assertEqual(Booking.objects.get(id=external[0].id).status, 'payment_pending')
+        self.assertEqual(Booking.objects.get(id=student[0].id).status, 'admin_approved')
+
+        # 表单批量拒绝走同一个事务
+        self.client.post(reverse('manager_booking_approve'), {
+            'batch_reject': '1', 'booking_ids': [external[2].id], f'comment_{external[2].booking_code}': '资料不全'
+        })
+        self.assertEqual(Booking.objects.get(id=external[2].id).status, 'manager_rejected')
+
+        response = self._post('manager_booking_approve_batch', {'booking_ids': [external[2].id], 'action': 'delete'})
+        self.assertEqual(response.status_code, 400)
+
+    def test_single_approval_conflict_shows_error(self):
+        """测试单条审批时预约被并发修改，提示错误而不是返回500"""
+        from unittest import mock
+        from django.contrib.messages import get_messages
+        from booking.state_machine import TransitionConflict
+        booking = self._bookings(1, 'student')[0]
+        self.client.force_login(self.admin)
+
+        with mock.patch('labadmin.views.bulk_approve', side_effect=TransitionConflict('预约状态已被其他操作修改，请刷新后重试')):
+            response = self.client.post(reverse('booking_approve'), {'approve': booking.id})
+        self.assertEqual(response.status_code, 302)
+        self.assertIn('预约状态已被其他操作修改，请刷新后重试', [str(m) for m in get_messages(response.wsgi_request)])
+        self.assertEqual(Booking.objects.get(id=booking.id).status, 'pending')
+
+    def test_requires_approval_role(self):
+        """测试无审批角色的用户不能调用批量审批接口"""
+        booking = self._bookings(1, 'student')[0]
+        self.client.force_login(User.objects.create_user(username='nobody', password='test123456'))
+        response = self._post('booking_approve_batch', {'booking_ids': [booking.id], 'action': 'approve'})
+        self.assertEqual(response.status_code, 403)
+        self.assertEqual(Booking.objects.get(id=booking.id).status, 'pending')
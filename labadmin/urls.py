@@ -7,6 +7,8 @@ urlpatterns = [
     path('home/', views.admin_home, name='admin_home'),
     # 预约审批页
     path('booking/approve/', views.booking_approve, name='booking_approve'),
+    # 批量审批接口（JSON）
+    path('booking/approve/batch/', views.booking_approve_batch, name='booking_approve_batch'),
     # 设备管理页
     path('device/manage/', device_manage, name='device_manage'),
     # 设备详情/编辑页（接收设备ID pk）
@@ -15,6 +17,9 @@ urlpatterns = [
     path('report/', views.report_stat, name='report_stat'),
     # 报表导出
     path('report/export/<int:report_id>/', views.export_report_csv, name='export_report_csv'),
+    # 后台导出任务：状态查询 / 文件下载
+    path('export/job/<int:job_id>/', views.export_job_status, name='export_job_status'),
+    path('export/job/<int:job_id>/download/', views.export_job_download, name='export_job_download'),
     # 报表删除
     path('report/delete/<int:report_id>/', views.delete_report, name='delete_report'),
 ]
\ No newline at end of file
@@ -10,22 +10,28 @@ from django.contrib.auth import update_session_auth_hash  # 保持登录状态
 from django.contrib.auth.models import User, Group, Permission
 
 from django.contrib.auth.decorators import login_required
+from django.views.decorators.http import require_POST
 from django.contrib import messages
 
 from booking.models import Booking, ApprovalRecord
 from user.models import UserInfo
 from devices.models import Device
 from ledger.models import DeviceLedger
-from .models import Report
+from .models import Report, ExportJob
+from .export_jobs import background_export, job_status_data
+from booking.queue_counters import ADMIN_QUEUE, queue_count
+from .approvals import bulk_approve, summarize as summarize_approvals
+from search.index import search
+from .reports import (
+    InvalidReportPeriod, create_report, find_existing_report, get_report_data, parse_report_period,
+    report_name_for, report_xlsx_response
+)
 from django.utils import timezone
 from datetime import timedelta, datetime, date
 from django.db.models import Count, Sum, Q, Avg
-from django.http import JsonResponse, HttpResponse
+from django.http import FileResponse, Http404, JsonResponse, HttpResponse
 import json
-from decimal import Decimal
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from jnu_lab_system.identity import get_current_user_info
 
 
 @login_required
@@ -39,8 +45,8 @@ def admin_home(request):
         return redirect('user_login')
     
     # 验证用户是否是管理员（严格检查，不允许负责人访问）
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 关键修复：如果是负责人但不是管理员，必须重定向到负责人首页
     if is_manager and not is_admin and not request.user.is_superuser:
@@ -51,8 +57,7 @@ def admin_home(request):
     if not is_admin and not request.user.is_superuser:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -63,6 +68,7 @@ def admin_home(request):
     context = {
         'is_admin': True,  # 明确设置为True，因为已经通过验证
         'is_manager': False,  # 管理员首页不应该显示负责人相关功能
+        'pending_booking_count': queue_count(ADMIN_QUEUE),  # 待审批预约数（读取审批队列计数）
     }
     return render(request, 'admin/home.html', context)
 
@@ -77,14 +83,8 @@ def device_list(request):
     # 基础查询：获取所有设备（按编号排序）
     devices = Device.objects.all().order_by('device_code')
     
-    # 如果有搜索关键词，过滤结果
-    if keyword:
-        devices = devices.filter(
-            Q(device_code__icontains=keyword) |  # 按设备编号搜索
-            Q(model__icontains=keyword) |        # 按型号搜索
-            Q(manufacturer__icontains=keyword) | # 按厂商搜索
-            Q(purpose__icontains=keyword)        # 按实验用途搜索
-        )
+    # 如果有搜索关键词，按设备编号/型号/厂商/实验用途搜索
+    devices = search(devices, keyword, ['device_code', 'model', 'manufacturer', 'purpose'])
 
     # 2. 准备上下文数据
     context = {
@@ -97,110 +97,16 @@ def device_list(request):
 # 这里不再需要这些函数，避免与 booking/views.py 中的函数冲突
 
 def generate_report_data(report_type, start_date, end_date):
-    """生成报表数据"""
-    # 获取时间范围内的预约数据
-    bookings = Booking.objects.filter(
-        booking_date__gte=start_date,
-        booking_date__lte=end_date
-    )
-    
-    # 获取已审批通过的预约
-    approved_bookings = bookings.filter(status='manager_approved')
-    
-    # 基础统计 (已修正：包含 teacher_pending 和 teacher_rejected)
-    total_bookings = bookings.count()
-    approved_count = approved_bookings.count()
-    # 拒绝总数 = 指导教师拒绝 + 管理员拒绝 + 负责人拒绝
-    rejected_count = bookings.filter(
-        Q(status='teacher_rejected') | Q(status='admin_rejected') | Q(status='manager_rejected')
-    ).count()
-    # 待处理总数 = 待指导教师审 + 待管理员审
-    pending_count = bookings.filter(
-        Q(status='teacher_pending') | Q(status='pending')
-    ).count()
-    
-    # 按设备统计
-    device_stats_queryset = approved_bookings.values('device__device_code', 'device__model').annotate(
-        booking_count=Count('id'),
-        revenue=Sum('device__price_external')
-    ).order_by('-booking_count')
-    
-    # 【核心修复】：遍历列表，转换内部字典里的 Decimal 为 float
-    device_stats = []
-    for item in device_stats_queryset:
-        item['revenue'] = float(item['revenue'] or 0)
-        device_stats.append(item)
-    
-    # 按用户类型统计
-    user_type_stats = approved_bookings.values('applicant__user_type').annotate(
-        booking_count=Count('id'),
-        user_count=Count('applicant', distinct=True)
-    )
-    
-    # 按日期统计（用于图表）
-    date_stats = approved_bookings.values('booking_date').annotate(
-        booking_count=Count('id')
-    ).order_by('booking_date')
-    
-    # 计算总收入（仅校外人员）
-    total_revenue = approved_bookings.filter(
-        applicant__user_type='external'
-    ).aggregate(
-        total=Sum('device__price_external')
-    )['total'] or Decimal('0')
-    
-    # 设备使用率统计
-    device_usage = []
-    for device in Device.objects.all():
-        device_bookings = approved_bookings.filter(device=device)
-        booking_count = device_bookings.count()
-        # 假设每个预约使用2小时
-        usage_hours = booking_count * 2
-        # 计算使用率（假设每天可用8小时）
-        days = (end_date - start_date).days + 1
-        total_hours = max(days * 8, 1) # 防止除以0
-        usage_rate = (usage_hours / total_hours * 100)
-        
-        # 该设备的校外收入
-        dev_rev = device_bookings.filter(applicant__user_type='external').aggregate(
-            total=Sum('device__price_external')
-        )['total'] or Decimal('0')
-        
-        device_usage.append({
-            'device_code': device.device_code,
-            'device_model': device.model,
-            'booking_count': booking_count,
-            'usage_hours': usage_hours,
-            'usage_rate': round(usage_rate, 2),
-            'revenue': float(dev_rev) 
-        })
-    
-    # 构建报表数据
-    report_data = {
-        'summary': {
-            'total_bookings': total_bookings,
-            'approved_count': approved_count,
-            'rejected_count': rejected_count,
-            'pending_count': pending_count,
-            'total_devices': Device.objects.count(),
-            'total_users': UserInfo.objects.filter(booking__in=approved_bookings).distinct().count(),
-            'total_revenue': float(total_revenue),
-        },
-        'device_stats': device_stats, # 使用转换后的列表
-        'user_type_stats': list(user_type_stats),
-        'date_stats': list(date_stats),
-        'device_usage': device_usage,
-    }
-    
-    return report_data
+    """生成报表数据（分组条件聚合，查询次数与设备数量无关；结果按时间段缓存）"""
+    return get_report_data(report_type, start_date, end_date)
 
 @login_required
 @login_required
 def report_stat(request):
     """报表统计页面 - 仅允许管理员访问"""
     # 验证用户是否是管理员（严格检查，不允许负责人访问）
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 关键修复：如果是负责人但不是管理员，重定向到负责人报表页面
     if is_manager and not is_admin and not request.user.is_superuser:
@@ -211,8 +117,7 @@ def report_stat(request):
     if not is_admin and not request.user.is_superuser:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -247,77 +152,27 @@ def report_stat(request):
         
         try:
             # 解析日期
-            if report_type == 'week':
-                # 周报表：输入日期所在周的周一和周日
-                input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
-                start_date = input_date - timedelta(days=input_date.weekday())
-                end_date = start_date + timedelta(days=6)
-                report_name = f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')} 周报表"
-            elif report_type == 'month':
-                # 月报表：处理 YYYY-MM 格式
-                if len(date_input) == 7 and date_input.count('-') == 1:
-                    year, month = map(int, date_input.split('-'))
-                else:
-                    input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
-                    year, month = input_date.year, input_date.month
-                start_date = date(year, month, 1)
-                if month == 12:
-                    end_date = date(year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    end_date = date(year, month + 1, 1) - timedelta(days=1)
-                report_name = f"{year}年{month:02d}月报表"
-            elif report_type == 'year':
-                year = int(date_input)
-                start_date = date(year, 1, 1)
-                end_date = date(year, 12, 31)
-                report_name = f"{year}年报表"
-            elif report_type == 'custom':
-                start_date = datetime.strptime(start_date_input, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date_input, '%Y-%m-%d').date()
-                if start_date > end_date:
-                    messages.error(request, '起始日期不能晚于结束日期！')
-                    return redirect('report_stat')
-                report_name = f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')} 自定义报表"
-            else:
-                messages.error(request, '无效的报表类型！')
-                return redirect('report_stat')
-            
-            # 【修复点 1】：改用绝对路径重定向，解决 Reverse 报错
-            if report_type != 'custom':
-                existing_report = Report.objects.filter(
-                    report_type=report_type,
-                    start_date=start_date,
-                    end_date=end_date
-                ).first()
-                
-                if existing_report:
-                    if existing_report.generated_by:
-                        messages.info(request, f'该时间段报表已存在（手动生成），已为您加载：{existing_report.report_name}')
-                    else:
-                        messages.info(request, f'该时间段报表已存在（系统自动生成），已为您加载：{existing_report.report_name}')
-                    return redirect(f'/labadmin/report/?view={existing_report.id}')
+            start_date, end_date = parse_report_period(report_type, date_input, start_date_input, end_date_input)
+            report_name = report_name_for(report_type, start_date, end_date)
             
-            # 生成报表数据
-            report_data = generate_report_data(report_type, start_date, end_date)
+            # 检查是否已存在相同报表（只检查相同类型的，自定义报表可以重复生成）
+            existing_report = find_existing_report(report_type, start_date, end_date)
+            if existing_report:
+                if existing_report.generated_by:
+                    messages.info(request, f'该时间段报表已存在（手动生成），已为您加载：{existing_report.report_name}')
+                else:
+                    messages.info(request, f'该时间段报表已存在（系统自动生成），已为您加载：{existing_report.report_name}')
+                return redirect(f'/labadmin/report/?view={existing_report.id}')
             
-            # 创建报表记录 (此处的崩溃取决于 generate_report_data 是否已将 Decimal 转为 float)
-            report = Report.objects.create(
-                report_type=report_type,
-                report_name=report_name,
-                start_date=start_date,
-                end_date=end_date,
-                report_data=report_data,
-                total_bookings=report_data['summary']['total_bookings'],
-                total_devices=report_data['summary']['total_devices'],
-                total_users=report_data['summary']['total_users'],
-                total_revenue=Decimal(str(report_data['summary']['total_revenue'])),
-                generated_by=request.user
-            )
+            # 生成报表数据并保存（统计结果按时间段缓存，数据未变化时不重复计算）
+            report = create_report(report_type, start_date, end_date, generated_by=request.user, report_name=report_name)
             
             messages.success(request, f'报表生成成功：{report_name}')
-            # 【修复点 2】：改用绝对路径重定向，解决 Reverse 报错
             return redirect(f'/labadmin/report/?view={report.id}')
             
+        except InvalidReportPeriod as e:
+            messages.error(request, str(e))
+            return redirect('report_stat')
         except ValueError as e:
             messages.error(request, f'日期格式错误：请检查日期格式是否正确！')
             return redirect('report_stat')
@@ -335,8 +190,8 @@ def report_stat(request):
             messages.error(request, '报表不存在！')
     
     # 获取用户角色信息
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 处理报表删除请求
     if request.method == 'POST' and 'delete_report' in request.POST:
@@ -399,125 +254,54 @@ def delete_report(request, report_id):
         redirect_url += '?' + query_params.urlencode()
     return HttpResponseRedirect(redirect_url)
 
+def report_job_params(request, report_id):
+    """后台导出报表的任务参数"""
+    report = get_object_or_404(Report, id=report_id)
+    return {'report_id': report.id}
+
+
 @login_required
+@background_export('report', report_job_params)
 def export_report_csv(request, report_id):
-    """导出报表为Excel文件（.xlsx）"""
-    from django.http import HttpResponse
-    from .models import Report
-    import re
-    
+    """导出报表为Excel文件（.xlsx），?background=1 时转为后台导出任务"""
     report = get_object_or_404(Report, id=report_id)
-    data = report.get_report_data()
-    
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "报表"
-    
-    # 写入报表基本信息
-    # 转换datetime为naive datetime（移除时区信息）
-    generated_at = report.generated_at.replace(tzinfo=None) if report.generated_at else None
-    
-    ws.append(['报表名称', report.report_name])
-    ws.append(['报表类型', report.get_report_type_display()])
-    ws.append(['统计时间', f'{report.start_date.strftime("%Y-%m-%d")} 至 {report.end_date.strftime("%Y-%m-%d")}'])
-    ws.append(['生成时间', generated_at])
-    ws.append(['生成人', report.generated_by.username if report.generated_by else '系统自动'])
-    ws.append([])  # 空行
-    
-    # 设置生成时间为日期格式
-    if generated_at:
-        ws.cell(row=4, column=2).number_format = 'yyyy-mm-dd hh:mm:ss'
-    
-    # 写入汇总统计
-    ws.append(['汇总统计'])
-    ws.append(['总预约次数', data['summary']['total_bookings']])
-    ws.append(['已审批通过', data['summary']['approved_count']])
-    ws.append(['总收入（元）', data['summary']['total_revenue']])
-    ws.append(['设备总数', data['summary']['total_devices']])
-    ws.append(['用户总数', data['summary']['total_users']])
-    ws.append([])  # 空行
-    
-    # 写入设备使用统计
-    ws.append(['设备使用统计'])
-    headers = ['设备编号', '设备型号', '预约次数', '使用时长（小时）', '使用率（%）', '校外收费（元）']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_row = ws.max_row
-    header_font = Font(bold=True)
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for device in data.get('device_usage', []):
-        ws.append([
-            device['device_code'],
-            device['device_model'],
-            device['booking_count'],
-            device['usage_hours'],
-            f"{device['usage_rate']}%",
-            device['revenue']
-        ])
-    ws.append([])  # 空行
-    
-    # 写入用户类型统计
-    ws.append(['用户类型统计'])
-    headers = ['用户类型', '预约次数', '用户数量']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_row = ws.max_row
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for stat in data.get('user_type_stats', []):
-        user_type = stat.get('applicant__user_type', '')
-        user_type_display = {
-            'student': '校内学生',
-            'teacher': '校内教师',
-            'external': '校外人员'
-        }.get(user_type, user_type)
-        ws.append([
-            user_type_display,
-            stat['booking_count'],
-            stat['user_count']
-        ])
-    
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 创建响应
-    # 清理文件名中的特殊字符
-    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', report.report_name)
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="report_{report.id}_{safe_filename}.xlsx"'
-    
-    wb.save(response)
-    return response
+    return report_xlsx_response(report)
+
+
+def _get_own_export_job(request, job_id):
+    """只允许任务申请人（或超级管理员）查看和下载导出任务"""
+    job = get_object_or_404(ExportJob, id=job_id)
+    if job.requested_by_id != request.user.id and not request.user.is_superuser:
+        raise Http404('导出任务不存在')
+    return job
+
+
+@login_required
+def export_job_status(request, job_id):
+    """导出任务状态（JSON），供页面轮询进度"""
+    job = _get_own_export_job(request, job_id)
+    return JsonResponse(job_status_data(request, job))
+
+
+@login_required
+def export_job_download(request, job_id):
+    """下载已完成的导出文件"""
+    job = _get_own_export_job(request, job_id)
+    if job.status != 'success' or not job.file:
+        raise Http404('导出文件尚未生成或已过期')
+    try:
+        fileobj = job.file.open('rb')
+    except FileNotFoundError:
+        raise Http404('导出文件已被清理')
+    return FileResponse(fileobj, as_attachment=True, filename=job.filename)
 
 # 1. 管理员审批页面
 @login_required
 def booking_approve(request):
     """设备预约审批（管理员） - 仅允许管理员访问"""
     # 校验是否是管理员（严格检查，不允许负责人访问管理员审批页面）
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 关键修复：如果是负责人但不是管理员，重定向到负责人审批页面
     if is_manager and not is_admin and not request.user.is_superuser:
@@ -528,8 +312,7 @@ def booking_approve(request):
     if not is_admin and not request.user.is_superuser:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -573,10 +356,8 @@ def booking_approve(request):
         
         # 批量审批（简化版）
         elif 'batch_approve' in request.POST or 'batch_reject' in request.POST:
-            booking_ids = request.POST.getlist('booking_ids')
             action = 'approve' if 'batch_approve' in request.POST else 'reject'
-            for booking_id in booking_ids:
-                handle_approval(request, booking_id, action)
+            handle_batch_approval(request, request.POST.getlist('booking_ids'), action)
         
         # 保留查询参数（筛选条件），避免跳转错误
         from django.http import HttpResponseRedirect
@@ -596,101 +377,102 @@ def booking_approve(request):
     return render(request, 'admin/booking_approve.html', context)
 
 def handle_approval(request, booking_id, action):
-    """处理审批逻辑（核心）"""
-    booking = get_object_or_404(Booking, id=booking_id)
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
-    
-    # 1. 管理员审批逻辑
-    if is_admin:
-        if action == 'approve':
-            # 学生/教师：直接审批通过
-            if booking.applicant.user_type in ['student', 'teacher']:
-                booking.status = 'manager_approved'
-                # 审批通过时创建借出台账记录
-                create_borrow_ledger(booking, request.user)
-            # 校外人员：需负责人审批
-            else:
-                booking.status = 'admin_approved'
-            approval_level = 'admin'
-        else:
-            booking.status = 'admin_rejected'
-            approval_level = 'admin'
-    
-    # 2. 负责人审批逻辑（仅校外人员）
-    elif is_manager:
-        if action == 'approve':
-            # 校外人员：负责人批准后，需要缴费
-            booking.status = 'payment_pending'
-            # 发送缴费请求到财务处
-            from booking.finance_integration import send_payment_request_to_finance
-            payment_result = send_payment_request_to_finance(booking)
-            # 注意：实际缴费确认需要通过财务处回调接口完成
-        else:
-            booking.status = 'manager_rejected'
-        approval_level = 'manager'
-    
-    # 保存预约状态
-    booking.save()
-    
-    # 记录审批日志
-    ApprovalRecord.objects.create(
-        booking=booking,
-        approver=request.user,
-        approval_level=approval_level,
-        action=action,
-        comment=request.POST.get(f'comment_{booking.booking_code}', '')  # 可扩展审批备注
-    )
+    """处理单条审批：与批量审批走同一条路径（预约状态机校验状态变化）"""
+    approval_level = approval_level_for(request)
+    if approval_level is None:
+        messages.error(request, '你无审批权限！')
+        return
+    try:
+        result = bulk_approve([booking_id], action, request.user, approval_level,
+                              comments=_approval_comments(request.POST))[0]
+    except ValueError as e:
+        # 包括 TransitionConflict：预约状态已被其他审批人并发修改
+        messages.error(request, str(e))
+        return
+    if not result['success']:
+        messages.error(request, f'{result["booking_code"] or booking_id}：{result["error"]}')
+        return
     
     # 提示信息
     action_text = '批准' if action == 'approve' else '拒绝'
-    messages.success(request, f'已{action_text}预约申请：{booking.booking_code}')
+    messages.success(request, f'已{action_text}预约申请：{result["booking_code"]}')
+
+def approval_level_for(request):
+    """当前用户的审批级别：同时具有两种角色时按管理员审批"""
+    if request.roles.is_admin:
+        return 'admin'
+    if request.roles.is_manager:
+        return 'manager'
+    return None
+
+
+def _approval_comments(data):
+    """表单中的审批备注：comment_<预约编号>"""
+    return {
+        key[len('comment_'):]: value
+        for key, value in data.items() if key.startswith('comment_') and value
+    }
+
+
+def handle_batch_approval(request, booking_ids, action):
+    """批量审批表单：一次事务处理所有选中的预约"""
+    approval_level = approval_level_for(request)
+    if approval_level is None or not booking_ids:
+        messages.error(request, '请选择要审批的预约')
+        return
+    try:
+        results = bulk_approve(booking_ids, action, request.user, approval_level,
+                               comments=_approval_comments(request.POST))
+    except ValueError as e:
+        messages.error(request, str(e))
+        return
+    action_text = '批准' if action == 'approve' else '拒绝'
+    summary = summarize_approvals(results)
+    if summary['succeeded']:
+        messages.success(request, f'已{action_text}{summary["succeeded"]}条预约申请')
+    for result in results:
+        if not result['success']:
+            messages.warning(request, f'{result["booking_code"] or result["id"]}：{result["error"]}')
+
+
+@login_required
+@require_POST
+def booking_approve_batch(request):
+    """批量审批接口（管理员 / 负责人）
+
+    POST JSON：{"booking_ids": [1, 2], "action": "approve" | "reject", "comment": "", "comments": {"预约编号": "备注"}}
+    也接受表单提交（booking_ids 可重复、action、comment、comment_<预约编号>）。
+    返回每条预约的处理结果，一次事务完成。
+    """
+    approval_level = approval_level_for(request)
+    if approval_level is None:
+        return JsonResponse({'success': False, 'error': '你无审批权限！'}, status=403)
 
-def create_borrow_ledger(booking, operator):
-    """审批通过时创建借出台账记录"""
+    if request.content_type == 'application/json':
+        try:
+            data = json.loads(request.body or b'{}')
+        except ValueError:
+            return JsonResponse({'success': False, 'error': 'JSON格式错误'}, status=400)
+        if not isinstance(data, dict):
+            return JsonResponse({'success': False, 'error': 'JSON格式错误'}, status=400)
+        booking_ids = data.get('booking_ids') or []
+        action = data.get('action')
+        comment = data.get('comment') or ''
+        comments = data.get('comments') or {}
+    else:
+        booking_ids = request.POST.getlist('booking_ids')
+        action = request.POST.get('action')
+        comment = request.POST.get('comment', '')
+        comments = _approval_comments(request.POST)
+
+    if action not in ('approve', 'reject'):
+        return JsonResponse({'success': False, 'error': 'action 应为 approve 或 reject'}, status=400)
+    if not isinstance(booking_ids, list) or not booking_ids or not isinstance(comments, dict):
+        return JsonResponse({'success': False, 'error': '请提供预约ID列表 booking_ids'}, status=400)
     try:
-        from datetime import datetime, time as dt_time
-        
-        # 计算预期归还时间（基于预约日期和时段）
-        # 解析时段，获取结束时间
-        time_slot = booking.time_slot
-        end_time_str = time_slot.split('-')[1] if '-' in time_slot else '20:00'
-        end_hour, end_minute = map(int, end_time_str.split(':'))
-        
-        # 创建预期归还时间（预约日期的结束时间）
-        expected_return_date = datetime.combine(
-            booking.booking_date,
-            dt_time(end_hour, end_minute)
-        )
-        
-        # 判断设备状态：只有在预约日期是今天且当前时段正在进行时才设置为"不可用"
-        # 否则保持设备当前状态，由定时任务来管理
-        now = timezone.now()
-        today = now.date()
-        current_time = now.time()
-        
-        # 解析时段开始时间
-        start_time_str = time_slot.split('-')[0] if '-' in time_slot else '08:00'
-        start_hour, start_minute = map(int, start_time_str.split(':'))
-        slot_start_time = dt_time(start_hour, start_minute)
-        slot_end_time = dt_time(end_hour, end_minute)
-        
-        # 创建借出台账记录
-        # 注意：设备状态不再设置为"不可用"，时段可用性由预约情况决定
-        DeviceLedger.objects.create(
-            device=booking.device,
-            device_name=booking.device.model,
-            user=booking.applicant,
-            operation_type='borrow',
-            operation_date=timezone.now(),
-            expected_return_date=expected_return_date,
-            status_after_operation=booking.device.status,  # 保持设备当前状态（正常/维修中/已报废）
-            description=f'预约编号：{booking.booking_code}，用途：{booking.purpose or "无"}',
-            operator=operator
-        )
-        
-        # 设备状态不再因为预约而改变，时段可用性通过预约情况来判断
-        print(f'已为预约 {booking.booking_code} 创建借出台账记录（预约日期：{booking.booking_date}，时段：{booking.time_slot}）')
-        
-    except Exception as e:
-        print(f'创建台账记录失败：{str(e)}')
+        results = bulk_approve(booking_ids, action, request.user, approval_level,
+                               comment=str(comment), comments=comments)
+    except ValueError as e:
+        return JsonResponse({'success': False, 'error': str(e)}, status=400)
+    return JsonResponse({'success': True, 'approval_level': approval_level, 'action': action,
+                         **summarize_approvals(results), 'results': results})
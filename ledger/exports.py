@@ -0,0 +1,221 @@
+"""
+台账导出
+每个导出函数接收查询参数（request.GET 或保存下来的参数字典），应用与列表页相同的筛选条件
+（ledger.filters），返回 ExportTable；由 jnu_lab_system.exports 流式写成Excel或CSV。
+
+行数据用 values_list 分批读取，不实例化模型，选项字段的显示值在内存中按字典转换。
+"""
+from itertools import islice
+from booking.models import Booking
+from devices.models import Device, DEVICE_STATUS
+from user.models import UserInfo
+from jnu_lab_system.exports import ExportTable, EXPORT_CHUNK_SIZE, DATE_FORMAT, DATETIME_FORMAT, naive
+from .filters import borrowed_devices, borrowers, filter_devices, filter_bookings, filter_operations
+from .models import DeviceLedger
+
+DEVICE_STATUS_DISPLAY = dict(DEVICE_STATUS)
+USER_TYPE_DISPLAY = dict(UserInfo.USER_TYPE_CHOICES)
+BOOKING_STATUS_DISPLAY = dict(Booking.APPROVAL_STATUS)
+OPERATION_TYPE_DISPLAY = dict(DeviceLedger.OPERATION_TYPES)
+
+
+def _chunks(iterable, size=EXPORT_CHUNK_SIZE):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def device_ledger_table(params):
+    """设备台账"""
+    devices = filter_devices(Device.objects.order_by('device_code'), params).values_list(
+        'device_code', 'model', 'purchase_date', 'manufacturer', 'purpose', 'status',
+        'price_internal', 'price_external', 'created_at', 'updated_at',
+    )
+
+    def rows():
+        for (device_code, model, purchase_date, manufacturer, purpose, status,
+             price_internal, price_external, created_at, updated_at) in devices.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                device_code,
+                model,
+                purchase_date,
+                manufacturer,
+                purpose or '-',
+                DEVICE_STATUS_DISPLAY.get(status, status),
+                price_internal,
+                price_external,
+                naive(created_at),
+                naive(updated_at),
+            ]
+
+    return ExportTable(
+        '设备台账', 'device_info_ledger',
+        ['设备编号', '型号', '购入时间', '生产厂商', '实验用途',
+         '时段可用状态', '校内租用价格（元/2小时）', '校外租用价格（元/2小时）', '创建时间', '更新时间'],
+        rows(),
+        formats={3: DATE_FORMAT, 9: DATETIME_FORMAT, 10: DATETIME_FORMAT},
+    )
+
+
+def _borrower_rows(params, user_type, fields, with_advisors=False):
+    """按批读取用户，每批用一次查询取出借用设备（及一次查询取出导师）
+
+    产出 (用户字段元组, 借用设备, 导师)
+    """
+    users = borrowers(params, user_type).values_list('id', *fields)
+    for chunk in _chunks(users.iterator(chunk_size=EXPORT_CHUNK_SIZE)):
+        ids = [row[0] for row in chunk]
+        devices = borrowed_devices(ids)
+        advisors = {}
+        if with_advisors:
+            for student_id, advisor_name in UserInfo.advisors.through.objects.filter(
+                from_userinfo_id__in=ids
+            ).order_by('-to_userinfo__create_time').values_list('from_userinfo_id', 'to_userinfo__name'):
+                advisors.setdefault(student_id, []).append(advisor_name)
+        for row in chunk:
+            device_codes = devices.get(row[0])
+            yield (
+                row[1:],
+                '、'.join(device_codes) if device_codes else '-',
+                ', '.join(advisors.get(row[0], [])) or '-',
+            )
+
+
+def teacher_ledger_table(params):
+    """教师台账"""
+    fields = ('user_code', 'name', 'gender', 'title', 'research_field', 'department', 'phone', 'create_time')
+
+    def rows():
+        for (user_code, name, gender, title, research_field, department, phone, create_time), device_str, _ in \
+                _borrower_rows(params, 'teacher', fields):
+            yield [
+                user_code, name, gender, title or '-', research_field or '-',
+                department, phone, device_str, naive(create_time),
+            ]
+
+    return ExportTable(
+        '教师台账', 'teacher_ledger',
+        ['教师编号', '姓名', '性别', '职称', '专业方向', '所在学院', '联系电话', '借用设备', '创建时间'],
+        rows(),
+        formats={9: DATETIME_FORMAT},
+    )
+
+
+def student_ledger_table(params):
+    """学生台账"""
+    fields = ('user_code', 'name', 'gender', 'major', 'department', 'phone', 'create_time')
+
+    def rows():
+        for (user_code, name, gender, major, department, phone, create_time), device_str, advisor_str in \
+                _borrower_rows(params, 'student', fields, with_advisors=True):
+            yield [
+                user_code, name, gender, major or '-', advisor_str,
+                department, phone, device_str, naive(create_time),
+            ]
+
+    return ExportTable(
+        '学生台账', 'student_ledger',
+        ['学号', '姓名', '性别', '专业', '导师', '所在学院', '联系电话', '借用设备', '创建时间'],
+        rows(),
+        formats={9: DATETIME_FORMAT},
+    )
+
+
+def external_ledger_table(params):
+    """校外人员台账"""
+    fields = ('user_code', 'name', 'gender', 'department', 'phone', 'create_time')
+
+    def rows():
+        for (user_code, name, gender, department, phone, create_time), device_str, _ in \
+                _borrower_rows(params, 'external', fields):
+            yield [user_code, name, gender, department, phone, device_str, naive(create_time)]
+
+    return ExportTable(
+        '校外人员台账', 'external_ledger',
+        ['编号', '姓名', '性别', '所在单位名称', '联系电话', '借用设备', '创建时间'],
+        rows(),
+        formats={7: DATETIME_FORMAT},
+    )
+
+
+def booking_ledger_table(params):
+    """预约台账"""
+    bookings = filter_bookings(Booking.objects.order_by('-create_time'), params).values_list(
+        'booking_code', 'applicant__user_code', 'applicant__name', 'applicant__user_type',
+        'device__device_code', 'device__model', 'booking_date', 'time_slot', 'purpose',
+        'teacher__user_code', 'status', 'create_time', 'update_time',
+    )
+
+    def rows():
+        for (booking_code, applicant_code, applicant_name, user_type, device_code, device_model,
+             booking_date, time_slot, purpose, teacher_code, status, create_time, update_time) \
+                in bookings.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                booking_code,
+                applicant_code,
+                applicant_name,
+                USER_TYPE_DISPLAY.get(user_type, user_type),
+                device_code,
+                device_model,
+                booking_date,
+                time_slot,
+                purpose or '-',
+                teacher_code or '-',
+                BOOKING_STATUS_DISPLAY.get(status, status),
+                naive(create_time),
+                naive(update_time),
+            ]
+
+    return ExportTable(
+        '预约台账', 'booking_ledger',
+        ['预约编号', '申请人编号', '申请人姓名', '申请人类型', '设备编号', '设备型号',
+         '预约日期', '预约时段', '借用用途', '指导教师编号', '审批状态', '创建时间', '更新时间'],
+        rows(),
+        formats={7: DATE_FORMAT, 12: DATETIME_FORMAT, 13: DATETIME_FORMAT},
+    )
+
+
+def operation_device_code(device_code, device_name, operation_type, description):
+    """操作记录的设备编号：优先使用关联设备，已删除的设备从删除描述中提取"""
+    if device_code:
+        return device_code
+    if operation_type == 'discard' and '删除设备：' in (description or ''):
+        return description.split('删除设备：')[1].split(' - ')[0]
+    return device_name
+
+
+def operation_history_table(params):
+    """设备操作历史"""
+    ledgers = filter_operations(DeviceLedger.objects.order_by('-operation_date'), params).values_list(
+        'device__device_code', 'device_name', 'user__name', 'operation_type', 'operation_date',
+        'expected_return_date', 'actual_return_date', 'status_after_operation',
+        'operator__username', 'description',
+    )
+
+    def rows():
+        for (device_code, device_name, user_name, operation_type, operation_date, expected_return_date,
+             actual_return_date, status_after_operation, operator_username, description) \
+                in ledgers.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield [
+                operation_device_code(device_code, device_name, operation_type, description),
+                device_name,
+                user_name or '',
+                OPERATION_TYPE_DISPLAY.get(operation_type, operation_type),
+                naive(operation_date),
+                naive(expected_return_date),
+                naive(actual_return_date),
+                DEVICE_STATUS_DISPLAY.get(status_after_operation, status_after_operation),
+                operator_username or '系统',
+                description or '',
+            ]
+
+    return ExportTable(
+        '设备操作历史', 'device_operation_history',
+        ['设备编号', '设备名称', '借用人', '操作类型', '操作日期',
+         '预期归还时间', '实际归还时间', '设备状态', '操作员', '备注'],
+        rows(),
+        formats={5: DATETIME_FORMAT, 6: DATETIME_FORMAT, 7: DATETIME_FORMAT},
+    )
@@ -0,0 +1,143 @@
+"""
+台账筛选条件
+列表页和导出（Excel/CSV）共用，保证导出的内容与页面上看到的一致。
+每个函数接收基础查询集和查询参数（request.GET 或参数字典），返回筛选后的查询集。
+设备、用户、预约的文本条件通过 search.index 的搜索索引匹配（语义与 icontains 相同）。
+"""
+from django.db.models import Count, Exists, Max, OuterRef, Prefetch, Subquery
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+from search.index import search, search_related
+
+
+def _booking_aggregate(aggregate):
+    """按申请人聚合预约记录的相关子查询（每个用户一个值，不与用户行连接，不会因多值关联重复计数）"""
+    return Subquery(
+        Booking.objects.filter(applicant=OuterRef('pk')).order_by().values('applicant')
+        .annotate(value=aggregate).values('value')
+    )
+
+
+def borrowers(params, user_type):
+    """有预约记录的教师/学生/校外人员（按编号排序），附带借用统计：
+
+    booking_count 预约次数、device_count 借用过的设备数、last_booking_date 最近预约日期
+    """
+    users = UserInfo.objects.filter(
+        Exists(Booking.objects.filter(applicant=OuterRef('pk'))),
+        user_type=user_type,
+    ).annotate(
+        booking_count=_booking_aggregate(Count('*')),
+        device_count=_booking_aggregate(Count('device', distinct=True)),
+        last_booking_date=_booking_aggregate(Max('booking_date')),
+    ).order_by('user_code')
+    return filter_borrowers(users, params, user_type)
+
+
+def borrowed_devices(user_ids):
+    """{用户ID: [借用过的设备编号（去重，按编号排序）]}，一次查询，行数只与用户和设备组合数有关"""
+    devices = {}
+    for applicant_id, device_code in Booking.objects.filter(applicant_id__in=user_ids).order_by(
+        'applicant_id', 'device__device_code'
+    ).values_list('applicant_id', 'device__device_code').distinct():
+        devices.setdefault(applicant_id, []).append(device_code)
+    return devices
+
+
+def attach_borrowed_devices(users):
+    """为当前页的用户设置 borrowed_devices 属性（列表页模板使用）"""
+    users = list(users)
+    devices = borrowed_devices([user.pk for user in users])
+    for user in users:
+        user.borrowed_devices = devices.get(user.pk, [])
+    return users
+
+
+def prefetch_advisors(users):
+    """预加载导师姓名（列表页和导出只显示姓名）"""
+    return users.prefetch_related(
+        Prefetch('advisors', queryset=UserInfo.objects.only('id', 'name').order_by('-create_time'))
+    )
+
+
+def filter_devices(devices, params):
+    """设备台账：设备编号、型号、生产厂商、状态"""
+    devices = search(devices, params.get('device_code'), ['device_code'])
+    devices = search(devices, params.get('model'), ['model'])
+    devices = search(devices, params.get('manufacturer'), ['manufacturer'])
+
+    status = params.get('status')
+    if status:
+        devices = devices.filter(status=status)
+    return devices
+
+
+def filter_borrowers(users, params, user_type):
+    """教师/学生/校外人员台账：编号、姓名、学院/单位，以及教师职称、学生专业和导师"""
+    users = search(users, params.get('user_code'), ['user_code'])
+    users = search(users, params.get('name'), ['name'])
+    users = search(users, params.get('department'), ['department'])
+
+    if user_type == 'teacher':
+        title = params.get('title')
+        if title:
+            users = users.filter(title__icontains=title)
+    elif user_type == 'student':
+        major = params.get('major')
+        if major:
+            users = users.filter(major__icontains=major)
+
+        advisor = params.get('advisor')
+        if advisor:
+            # 通过多对多关系查询指导教师（用子查询而不是连接，避免一个学生因多位导师匹配而重复出现）
+            users = users.filter(pk__in=search_related(
+                UserInfo.advisors.through.objects.all(), 'to_userinfo', UserInfo, advisor, ['name']
+            ).values('from_userinfo_id'))
+    return users
+
+
+def filter_bookings(bookings, params):
+    """预约台账：预约编号、设备编号、申请人、申请人类型、状态、预约日期范围"""
+    bookings = search(bookings, params.get('booking_code'), ['booking_code'])
+    bookings = search_related(bookings, 'device', Device, params.get('device_code'), ['device_code'])
+    bookings = search_related(bookings, 'applicant', UserInfo, params.get('applicant_name'), ['name'])
+
+    user_type = params.get('user_type')
+    if user_type:
+        bookings = bookings.filter(applicant__user_type=user_type)
+
+    status = params.get('status')
+    if status:
+        bookings = bookings.filter(status=status)
+
+    date_from = params.get('date_from')
+    if date_from:
+        bookings = bookings.filter(booking_date__gte=date_from)
+
+    date_to = params.get('date_to')
+    if date_to:
+        bookings = bookings.filter(booking_date__lte=date_to)
+    return bookings
+
+
+def filter_operations(ledgers, params):
+    """设备操作历史：设备编号、操作类型、操作日期范围、操作员"""
+    ledgers = search_related(ledgers, 'device', Device, params.get('device_code'), ['device_code'])
+
+    operation_type = params.get('operation_type')
+    if operation_type:
+        ledgers = ledgers.filter(operation_type=operation_type)
+
+    date_from = params.get('date_from')
+    if date_from:
+        ledgers = ledgers.filter(operation_date__date__gte=date_from)
+
+    date_to = params.get('date_to')
+    if date_to:
+        ledgers = ledgers.filter(operation_date__date__lte=date_to)
+
+    operator_name = params.get('operator')
+    if operator_name:
+        ledgers = ledgers.filter(operator__username__icontains=operator_name)
+    return ledgers
@@ -0,0 +1,21 @@
+# Generated by Django 5.2.9 on 2026-10-18 03:41
+
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('devices', '0003_alter_device_status'),
+        ('ledger', '0005_alter_deviceledger_device'),
+        ('user', '0003_remove_userinfo_advisor_userinfo_advisors'),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='deviceledger',
+            index=models.Index(fields=['-operation_date', '-id'], name='ledger_opdate_id_idx'),
+        ),
+    ]
@@ -37,6 +37,10 @@ class DeviceLedger(models.Model):
         verbose_name = '设备台账'
         verbose_name_plural = '设备台账'
         ordering = ['-operation_date']
+        indexes = [
+            # 操作历史游标分页：按 (操作日期, id) 倒序定位
+            models.Index(fields=['-operation_date', '-id'], name='ledger_opdate_id_idx'),
+        ]
 
     def __str__(self):
         return f"{self.device.device_code} - {self.device_name} - {self.get_operation_type_display()} - {self.operation_date.strftime('%Y-%m-%d %H:%M')}"
\ No newline at end of file
@@ -0,0 +1,153 @@
+"""
+台账列表分页
+默认使用 Django Paginator（页码 + OFFSET）。数据量大时可以通过查询参数切换：
+
+- ?paging=cursor：游标（keyset）分页，按排序键 (时间, id) 定位下一页/上一页，
+  查询条件为 "(时间, id) < 上一页最后一行"，配合复合索引，翻到多深的位置耗时都相同；
+  游标分页没有页码，只提供"上一页/下一页"，链接中的 after/before 参数是上一页首/末行的排序键；
+- ?count=estimate：总数使用估算值，不执行 COUNT(*)：
+  PostgreSQL 下取查询计划的估算行数，其他数据库最多数到 ESTIMATE_COUNT_LIMIT 行，超过显示为"N+"。
+  只对游标分页生效：页码分页需要准确的页数（否则超出估算值的页码会被截到最后一页），
+  忽略该参数，只执行一次 COUNT(*)。
+"""
+import base64
+import json
+from django.core.paginator import Paginator
+from django.db import connections
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+
+PER_PAGE = 20
+# 非PostgreSQL数据库估算总数时最多计数的行数
+ESTIMATE_COUNT_LIMIT = 1000
+# 分页相关的查询参数（生成翻页链接时去掉，其余筛选条件原样保留）
+PAGING_PARAMS = ('page', 'after', 'before')
+
+
+def encode_cursor(values):
+    """排序键 -> 游标字符串（日期时间用ISO格式，整体做URL安全的base64）"""
+    raw = json.dumps([value.isoformat() if hasattr(value, 'isoformat') else value for value in values])
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+
+def decode_cursor(cursor):
+    """游标字符串 -> (时间, id)；格式不正确时返回 None（当作第一页）"""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        time_value, pk = json.loads(raw)
+        time_value = parse_datetime(time_value)
+        pk = int(pk)
+    except (ValueError, TypeError):
+        return None
+    if time_value is None:
+        return None
+    return time_value, pk
+
+
+def estimate_count(queryset):
+    """估算查询结果行数，返回 (行数, 精度)
+
+    精度：'estimate' 为查询计划估算值，'lower_bound' 表示实际行数超过该值，'exact' 为准确值。
+    """
+    connection = connections[queryset.db]
+    if connection.vendor == 'postgresql':
+        sql, params = queryset.order_by().query.sql_with_params()
+        with connection.cursor() as cursor:
+            cursor.execute('EXPLAIN (FORMAT JSON) ' + sql, params)
+            plan = cursor.fetchone()[0]
+        if isinstance(plan, str):
+            plan = json.loads(plan)
+        return int(plan[0]['Plan']['Plan Rows']), 'estimate'
+    count = queryset.order_by()[:ESTIMATE_COUNT_LIMIT + 1].count()
+    if count > ESTIMATE_COUNT_LIMIT:
+        return ESTIMATE_COUNT_LIMIT, 'lower_bound'
+    return count, 'exact'
+
+
+class KeysetPage:
+    """游标分页的一页（接口与模板中用到的 Page 属性保持一致：遍历、has_next、has_previous 等）"""
+
+    paging = 'cursor'
+
+    def __init__(self, object_list, has_next, has_previous, time_field, base_query):
+        self.object_list = object_list
+        self._has_next = has_next
+        self._has_previous = has_previous
+        self.time_field = time_field
+        self.base_query = base_query
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def has_next(self):
+        return self._has_next
+
+    def has_previous(self):
+        return self._has_previous
+
+    def has_other_pages(self):
+        return self._has_next or self._has_previous
+
+    def _url(self, key, obj):
+        cursor = encode_cursor([getattr(obj, self.time_field), obj.pk])
+        return f'?{self.base_query}&{key}={cursor}' if self.base_query else f'?{key}={cursor}'
+
+    @property
+    def next_url(self):
+        return self._url('after', self.object_list[-1]) if self._has_next else ''
+
+    @property
+    def previous_url(self):
+        return self._url('before', self.object_list[0]) if self._has_previous else ''
+
+
+def keyset_page(queryset, params, time_field, per_page=PER_PAGE):
+    """按 (time_field, id) 倒序的游标分页
+
+    after：取排在该游标之后（更早）的一页；before：取排在该游标之前（更新）的一页。
+    """
+    after = decode_cursor(params.get('after', ''))
+    before = decode_cursor(params.get('before', '')) if after is None else None
+
+    if before is not None:
+        time_value, pk = before
+        rows = list(queryset.filter(
+            Q(**{f'{time_field}__gt': time_value}) | Q(**{time_field: time_value, 'pk__gt': pk})
+        ).order_by(time_field, 'pk')[:per_page + 1])
+        has_previous = len(rows) > per_page
+        object_list = rows[:per_page][::-1]
+        has_next = bool(object_list)
+    else:
+        if after is not None:
+            time_value, pk = after
+            queryset = queryset.filter(
+                Q(**{f'{time_field}__lt': time_value}) | Q(**{time_field: time_value, 'pk__lt': pk})
+            )
+        rows = list(queryset.order_by(f'-{time_field}', '-pk')[:per_page + 1])
+        has_next = len(rows) > per_page
+        object_list = rows[:per_page]
+        has_previous = after is not None
+
+    query = params.copy()
+    for key in PAGING_PARAMS:
+        query.pop(key, None)
+    return KeysetPage(object_list, has_next, has_previous, time_field, query.urlencode())
+
+
+def paginate(queryset, params, time_field, per_page=PER_PAGE):
+    """按查询参数选择分页方式，返回 (page_obj, 总数, 总数精度)
+
+    queryset 应已按 -time_field 排序（页码分页沿用该排序，并以 -id 作为次序键保证翻页稳定）。
+    """
+    if params.get('paging') == 'cursor':
+        page_obj = keyset_page(queryset, params, time_field, per_page)
+        if params.get('count') == 'estimate':
+            return page_obj, *estimate_count(queryset)
+        return page_obj, queryset.count(), 'exact'
+
+    # 页码分页忽略 count=estimate：页码范围需要准确的总数
+    paginator = Paginator(queryset.order_by(f'-{time_field}', '-pk'), per_page)
+    return paginator.get_page(params.get('page')), paginator.count, 'exact'
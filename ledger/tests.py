@@ -1,4 +1,6 @@
 from django.test import TestCase, Client
+from django.test.utils import CaptureQueriesContext
+from django.db import connection
 from django.contrib.auth.models import User, Group
 from django.utils import timezone
 from django.urls import reverse
@@ -62,9 +64,9 @@ class LedgerModelTestCase(TestCase):
             phone='13800138002',
             gender='女',
             major='计算机科学',
-            advisor='张老师',
             auth_user=self.normal_user
         )
+        self.student.advisors.add(self.teacher)
         
         self.external = UserInfo.objects.create(
             user_code='E001',
@@ -229,9 +231,9 @@ class LedgerViewTestCase(TestCase):
             phone='13800138002',
             gender='女',
             major='计算机科学',
-            advisor='张老师',
             auth_user=self.normal_user
         )
+        self.student.advisors.add(self.teacher)
         
         self.external = UserInfo.objects.create(
             user_code='E001',
@@ -516,9 +518,9 @@ class LedgerExportTestCase(TestCase):
             phone='13800138002',
             gender='女',
             major='计算机科学',
-            advisor='张老师',
             auth_user=self.student_user
         )
+        self.student.advisors.add(self.teacher)
         
         self.external = UserInfo.objects.create(
             user_code='E001',
@@ -650,6 +652,273 @@ class LedgerExportTestCase(TestCase):
         self.assertIn('.xlsx', response['Content-Disposition'])
 
 
+class StreamingExportTestCase(TestCase):
+    """台账流式导出测试：write_only 工作簿 + 分批读取，内容与原导出一致"""
+
+    def setUp(self):
+        """设置测试数据并以设备管理员登录"""
+        from datetime import date
+        from decimal import Decimal
+        from django.contrib.auth.models import Group
+        from booking.models import Booking
+        from devices.models import Device
+        admin_group = Group.objects.create(name='设备管理员')
+        self.admin_user = User.objects.create_user(username='admin', password='admin123')
+        self.admin_user.groups.add(admin_group)
+        self.client.force_login(self.admin_user)
+
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='计算机学院', phone='13800138001'
+        )
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student',
+            department='计算机学院', phone='13800138000'
+        )
+        self.devices = [
+            Device.objects.create(device_code=f'DEV{i:03d}', model=f'型号{i}', price_external=Decimal('100'))
+            for i in range(3)
+        ]
+        for i, device in enumerate(self.devices):
+            Booking.objects.create(
+                booking_code=f'BOOK{i:03d}', applicant=self.teacher if i else self.student,
+                device=device, booking_date=date(2025, 3, 10 + i), time_slot='08:00-10:00',
+                status='manager_approved'
+            )
+
+    def _load(self, response):
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from jnu_lab_system.exports import XLSX_CONTENT_TYPE
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(response['Content-Type'], XLSX_CONTENT_TYPE)
+        wb = load_workbook(BytesIO(b''.join(response.streaming_content)))
+        return wb.active
+
+    def test_booking_ledger_export(self):
+        """测试预约台账导出：表头样式、日期格式和筛选条件"""
+        response = self.client.get(reverse('ledger:export_booking_ledger_csv'), {'user_type': 'teacher'})
+        self.assertIn('booking_ledger.xlsx', response['Content-Disposition'])
+        ws = self._load(response)
+        rows = list(ws.iter_rows(values_only=True))
+        self.assertEqual(rows[0][0], '预约编号')
+        self.assertTrue(ws['A1'].font.bold)
+        # 按创建时间倒序，只包含教师的预约
+        self.assertEqual([row[0] for row in rows[1:]], ['BOOK002', 'BOOK001'])
+        self.assertEqual(ws['G2'].number_format, 'yyyy-mm-dd')
+        self.assertEqual(ws['L2'].number_format, 'yyyy-mm-dd hh:mm:ss')
+        self.assertGreater(ws.column_dimensions['A'].width, 0)
+
+    def test_all_ledger_exports(self):
+        """测试各台账和用户台账导出都能生成文件"""
+        expected = {
+            'ledger:export_device_ledger_csv': ('设备编号', 3),
+            'ledger:export_teacher_ledger_csv': ('教师编号', 1),
+            'ledger:export_student_ledger_csv': ('学号', 1),
+            'ledger:export_external_ledger_csv': ('编号', 0),
+            # 新增设备时写入了设备台账操作记录
+            'ledger:export_ledger_csv': ('设备编号', 3),
+            'user_export_ledger': ('用户编号', 2),
+        }
+        for url_name, (first_header, row_count) in expected.items():
+            rows = list(self._load(self.client.get(reverse(url_name))).iter_rows(values_only=True))
+            self.assertEqual(rows[0][0], first_header, url_name)
+            self.assertEqual(len(rows) - 1, row_count, url_name)
+
+        rows = list(self._load(
+            self.client.get(reverse('ledger:export_student_ledger_csv'))
+        ).iter_rows(values_only=True))
+        self.assertEqual(rows[1][7], 'DEV000')
+
+    def _csv_rows(self, content):
+        import csv
+        import io
+        self.assertTrue(content.startswith(b'\xef\xbb\xbf'))
+        return list(csv.reader(io.StringIO(content.decode('utf-8-sig'))))
+
+    def test_booking_ledger_csv(self):
+        """测试CSV导出：UTF-8 BOM、与列表页相同的筛选条件、不实例化预约模型"""
+        from django.db.models.signals import post_init
+        from booking.models import Booking
+        instances = []
+
+        def count_instances(sender, **kwargs):
+            instances.append(sender)
+
+        post_init.connect(count_instances, sender=Booking)
+        try:
+            response = self.client.get(
+                reverse('ledger:export_booking_ledger_csv'), {'format': 'csv', 'user_type': 'teacher'}
+            )
+            content = b''.join(response.streaming_content)
+        finally:
+            post_init.disconnect(count_instances, sender=Booking)
+
+        self.assertEqual(instances, [])
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        self.assertIn('booking_ledger.csv', response['Content-Disposition'])
+        rows = self._csv_rows(content)
+        self.assertEqual(rows[0][0], '预约编号')
+        self.assertEqual([row[0] for row in rows[1:]], ['BOOK002', 'BOOK001'])
+        self.assertEqual(rows[1][3], '校内教师')
+        self.assertEqual(rows[1][6], '2025-03-12')
+        self.assertEqual(rows[1][9], '-')
+        self.assertRegex(rows[1][11], r'^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$')
+
+    def test_csv_gzip_transfer(self):
+        """测试客户端支持gzip时压缩传输"""
+        import gzip
+        url = reverse('ledger:export_student_ledger_csv')
+        response = self.client.get(url, {'format': 'csv'}, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        rows = self._csv_rows(gzip.decompress(b''.join(response.streaming_content)))
+        self.assertEqual(rows[1][0], 'S001')
+        self.assertEqual(rows[1][7], 'DEV000')
+
+        response = self.client.get(url, {'format': 'csv'})
+        self.assertFalse(response.has_header('Content-Encoding'))
+
+    def test_write_xlsx_streams_rows(self):
+        """测试行迭代器只被消费一次，超过列宽样本的行也全部写入"""
+        from io import BytesIO
+        from openpyxl import load_workbook
+        from jnu_lab_system import exports
+
+        consumed = []
+
+        def rows():
+            for i in range(exports.WIDTH_SAMPLE_ROWS + 500):
+                consumed.append(i)
+                yield [i, f'第{i}行']
+
+        fileobj = BytesIO()
+        exports.write_xlsx(exports.ExportTable('测试', 'test', ['序号', '内容'], rows()), fileobj)
+        self.assertEqual(len(consumed), exports.WIDTH_SAMPLE_ROWS + 500)
+        rows = list(load_workbook(fileobj, read_only=True).active.iter_rows(values_only=True))
+        self.assertEqual(len(rows), exports.WIDTH_SAMPLE_ROWS + 501)
+        self.assertEqual(rows[-1], (exports.WIDTH_SAMPLE_ROWS + 499, f'第{exports.WIDTH_SAMPLE_ROWS + 499}行'))
+
+
+class BorrowerLedgerQueryTestCase(TestCase):
+    """教师/学生/校外人员台账：借用统计用子查询计算，查询次数与数据量无关"""
+
+    def setUp(self):
+        """设置测试数据并以设备管理员登录"""
+        from django.contrib.auth.models import Group
+        from devices.models import Device
+        admin_user = User.objects.create_user(username='admin', password='admin123')
+        admin_user.groups.add(Group.objects.create(name='设备管理员'))
+        self.client.force_login(admin_user)
+        self.devices = [Device.objects.create(device_code=f'DEV{i:03d}', model=f'型号{i}') for i in range(3)]
+        self.advisors = [
+            UserInfo.objects.create(
+                user_code=f'T{i:03d}', name=f'王老师{i}', user_type='teacher',
+                department='计算机学院', phone='13800138001'
+            )
+            for i in range(2)
+        ]
+        self.booking_seq = 0
+
+    def _add_borrowers(self, user_type, count, bookings_per_user=3):
+        from datetime import date, timedelta
+        from booking.models import Booking
+        start = UserInfo.objects.filter(user_type=user_type).count()
+        for i in range(start, start + count):
+            user = UserInfo.objects.create(
+                user_code=f'{user_type[0].upper()}{i + 100:03d}', name=f'用户{i}', user_type=user_type,
+                department='计算机学院', phone='13800138000'
+            )
+            if user_type == 'student':
+                user.advisors.set(self.advisors)
+            for j in range(bookings_per_user):
+                self.booking_seq += 1
+                Booking.objects.create(
+                    booking_code=f'BOOK{self.booking_seq:05d}', applicant=user,
+                    # 前两次预约同一台设备，借用设备去重后为2台
+                    device=self.devices[min(j, 1)],
+                    booking_date=date(2025, 1, 1) + timedelta(days=self.booking_seq),
+                    time_slot='08:00-10:00', status='manager_approved'
+                )
+
+    def test_list_query_count_independent_of_data_size(self):
+        """测试列表页查询次数固定：计数、当前页用户、当前页借用设备，学生另加导师
+
+        请求本身的会话、身份查询随配置不同，整页只比较数据量增加前后的查询次数。
+        """
+        from django.core.paginator import Paginator
+        from django.db import connection
+        from django.http import QueryDict
+        from django.test.utils import CaptureQueriesContext
+        from ledger.filters import attach_borrowed_devices, borrowers, prefetch_advisors
+        for url_name, user_type, queries in [
+            ('ledger:teacher_ledger_list', 'teacher', 3),
+            ('ledger:student_ledger_list', 'student', 4),
+            ('ledger:external_ledger_list', 'external', 3),
+        ]:
+            self._add_borrowers(user_type, 2)
+            # 先访问一次，使会话、身份缓存处于稳定状态
+            self.client.get(reverse(url_name))
+            with CaptureQueriesContext(connection) as small:
+                self.client.get(reverse(url_name))
+            self._add_borrowers(user_type, 30, bookings_per_user=5)
+            with self.assertNumQueries(len(small)):
+                response = self.client.get(reverse(url_name))
+
+            users = borrowers(QueryDict(), user_type)
+            if user_type == 'student':
+                users = prefetch_advisors(users)
+            with self.assertNumQueries(queries):
+                page = Paginator(users, 20).get_page(2)
+                for user in attach_borrowed_devices(page.object_list):
+                    if user_type == 'student':
+                        list(user.advisors.all())
+
+            page = response.context['page_obj']
+            self.assertEqual(len(page.object_list), 20)
+            self.assertEqual(response.context['total_count'], 32)
+            first = page.object_list[0]
+            self.assertEqual(first.booking_count, 3)
+            self.assertEqual(first.device_count, 2)
+            self.assertEqual(first.borrowed_devices, ['DEV000', 'DEV001'])
+            self.assertEqual(first.last_booking_date, max(first.booking_set.values_list('booking_date', flat=True)))
+            self.assertContains(response, 'DEV000、')
+
+    def test_student_advisor_filter_not_duplicated(self):
+        """测试按导师筛选时匹配多位导师的学生只出现一次，预约次数不被放大"""
+        self._add_borrowers('student', 1)
+        response = self.client.get(reverse('ledger:student_ledger_list'), {'advisor': '王老师'})
+        self.assertEqual(response.context['total_count'], 1)
+        student = response.context['page_obj'].object_list[0]
+        self.assertEqual(student.booking_count, 3)
+        self.assertContains(response, '王老师1、')
+
+    def test_export_query_count_independent_of_data_size(self):
+        """测试台账导出每批用户的查询次数固定"""
+        from django.http import QueryDict
+        from ledger.exports import student_ledger_table
+        from manager.exports import user_ledger_table
+        self._add_borrowers('student', 2)
+        # 学生台账：用户、借用设备、导师各一次
+        with self.assertNumQueries(3):
+            rows = list(student_ledger_table(QueryDict()).rows)
+        # 用户台账：用户、导师各一次
+        with self.assertNumQueries(2):
+            list(user_ledger_table(QueryDict('user_type=student')).rows)
+        self.assertEqual(rows[0][4], '王老师1, 王老师0')
+        self.assertEqual(rows[0][7], 'DEV000、DEV001')
+
+        self._add_borrowers('student', 40, bookings_per_user=5)
+        with self.assertNumQueries(3):
+            rows = list(student_ledger_table(QueryDict()).rows)
+        self.assertEqual(len(rows), 42)
+        with self.assertNumQueries(2):
+            rows = list(user_ledger_table(QueryDict('user_type=student')).rows)
+        self.assertEqual(len(rows), 42)
+        self.assertEqual(rows[0][4], '王老师1, 王老师0')
+
+
 class LedgerPaginationTestCase(TestCase):
     """台账分页测试"""
     
@@ -703,6 +972,103 @@ class LedgerPaginationTestCase(TestCase):
         self.assertTrue(response.context['page_obj'].has_previous())
 
 
+class KeysetPaginationTestCase(TestCase):
+    """台账游标分页测试：按 (时间, id) 翻页不重不漏，查询次数与页深无关"""
+
+    def setUp(self):
+        """设置测试数据并以设备管理员登录"""
+        from datetime import date, timedelta
+        from django.contrib.auth.models import Group
+        from django.utils import timezone
+        from booking.models import Booking
+        from devices.models import Device
+        admin_user = User.objects.create_user(username='admin', password='admin123')
+        admin_user.groups.add(Group.objects.create(name='设备管理员'))
+        self.client.force_login(admin_user)
+        applicant = UserInfo.objects.create(
+            user_code='S001', name='李同学', user_type='student',
+            department='计算机学院', phone='13800138000'
+        )
+        device = Device.objects.create(device_code='DEV001', model='型号1')
+        for i in range(45):
+            Booking.objects.create(
+                booking_code=f'BOOK{i:03d}', applicant=applicant, device=device,
+                booking_date=date(2025, 1, 1) + timedelta(days=i), time_slot='08:00-10:00',
+                status='manager_approved'
+            )
+        # 一半记录创建时间相同，翻页必须依靠 id 区分先后
+        now = timezone.now()
+        Booking.objects.filter(booking_code__lt='BOOK020').update(create_time=now)
+        self.expected = list(Booking.objects.order_by('-create_time', '-id').values_list('booking_code', flat=True))
+
+    def _codes(self, response):
+        return [booking.booking_code for booking in response.context['page_obj']]
+
+    def test_walk_forward_and_back(self):
+        """测试下一页、上一页链接遍历全部记录，且保留筛选条件"""
+        url = reverse('ledger:booking_ledger_list')
+        response = self.client.get(url, {'paging': 'cursor', 'device_code': 'DEV'})
+        pages = [self._codes(response)]
+        self.assertFalse(response.context['page_obj'].has_previous())
+        while response.context['page_obj'].has_next():
+            next_url = response.context['page_obj'].next_url
+            self.assertIn('device_code=DEV', next_url)
+            self.assertIn('paging=cursor', next_url)
+            response = self.client.get(url + next_url)
+            pages.append(self._codes(response))
+        self.assertEqual([len(page) for page in pages], [20, 20, 5])
+        self.assertEqual(sum(pages, []), self.expected)
+        self.assertEqual(response.context['total_count'], 45)
+
+        response = self.client.get(url + response.context['page_obj'].previous_url)
+        self.assertEqual(self._codes(response), pages[1])
+        response = self.client.get(url + response.context['page_obj'].previous_url)
+        self.assertEqual(self._codes(response), pages[0])
+        self.assertFalse(response.context['page_obj'].has_previous())
+
+        # 无法解析的游标当作第一页
+        response = self.client.get(url, {'paging': 'cursor', 'after': 'not-a-cursor'})
+        self.assertEqual(self._codes(response), pages[0])
+
+    def test_deep_page_does_not_use_offset(self):
+        """测试游标分页的查询不带 OFFSET，且估算总数不执行完整计数"""
+        from django.db import connection
+        from django.http import QueryDict
+        from unittest import mock
+        from django.test.utils import CaptureQueriesContext
+        from booking.models import Booking
+        from ledger import pagination
+        queryset = Booking.objects.order_by('-create_time')
+        page, total, precision = pagination.paginate(queryset, QueryDict('paging=cursor'), 'create_time')
+        params = QueryDict(page.next_url[1:])
+        with CaptureQueriesContext(connection) as queries:
+            page, total, precision = pagination.paginate(queryset, params, 'create_time')
+        self.assertEqual(len(queries), 2)
+        self.assertNotIn('OFFSET', queries[0]['sql'])
+        self.assertEqual([booking.booking_code for booking in page], self.expected[20:40])
+
+        params = QueryDict('paging=cursor&count=estimate')
+        with mock.patch.object(pagination, 'ESTIMATE_COUNT_LIMIT', 30):
+            self.assertEqual(pagination.paginate(queryset, params, 'create_time')[1:], (30, 'lower_bound'))
+            response = self.client.get(reverse('ledger:booking_ledger_list'), {'paging': 'cursor', 'count': 'estimate'})
+            self.assertContains(response, '共 30+ 条记录')
+            # 页码分页忽略 count=estimate：只执行一次准确计数，超出估算值的页码仍可访问
+            with mock.patch.object(pagination, 'estimate_count', side_effect=AssertionError):
+                page, total, precision = pagination.paginate(
+                    queryset, QueryDict('count=estimate&page=3'), 'create_time'
+                )
+            self.assertEqual((page.number, total, precision), (3, 45, 'exact'))
+            response = self.client.get(reverse('ledger:booking_ledger_list'), {'count': 'estimate', 'page': 3})
+            self.assertEqual(response.context['page_obj'].paginator.num_pages, 3)
+            self.assertEqual(response.context['page_obj'].number, 3)
+            self.assertEqual(self._codes(response), self.expected[40:])
+            self.assertContains(response, '共 45 条记录')
+
+        response = self.client.get(reverse('ledger:device_operation_history_list'), {'paging': 'cursor'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context['total_count'], 1)
+
+
 class LedgerIntegrationTestCase(TestCase):
     """台账集成测试：测试预约与台账的联动"""
     
@@ -1,5 +1,6 @@
 from django.urls import path
 from . import views
+from labadmin.views import export_job_status, export_job_download
 
 app_name = 'ledger'
 
@@ -24,4 +25,7 @@ urlpatterns = [
     # 预约台账
     path('booking/', views.booking_ledger_list, name='booking_ledger_list'),
     path('booking/export/csv/', views.export_booking_ledger_csv, name='export_booking_ledger_csv'),
+    # 后台导出任务：状态查询 / 文件下载
+    path('export/job/<int:job_id>/', export_job_status, name='export_job_status'),
+    path('export/job/<int:job_id>/download/', export_job_download, name='export_job_download'),
 ]
\ No newline at end of file
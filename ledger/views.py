@@ -11,9 +11,17 @@ from .models import DeviceLedger
 from devices.models import Device, DEVICE_STATUS
 from user.models import UserInfo
 from booking.models import Booking
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from booking.occupancy import OccupancyIndex
+from jnu_lab_system.exports import export_response
+from labadmin.export_jobs import background_export
+from .filters import (
+    attach_borrowed_devices, borrowers, filter_devices, filter_bookings, filter_operations, prefetch_advisors,
+)
+from .pagination import paginate
+from .exports import (
+    device_ledger_table, teacher_ledger_table, student_ledger_table,
+    external_ledger_table, booking_ledger_table, operation_history_table,
+)
 
 def check_ledger_permission(view_func):
     """权限检查装饰器：只允许设备管理员和实验室负责人访问台账"""
@@ -23,8 +31,8 @@ def check_ledger_permission(view_func):
             messages.error(request, '请先登录！')
             return redirect('user_login')
         
-        is_admin = request.user.groups.filter(name='设备管理员').exists()
-        is_manager = request.user.groups.filter(name='实验室负责人').exists()
+        is_admin = request.roles.is_admin
+        is_manager = request.roles.is_manager
         if not is_admin and not is_manager and not request.user.is_superuser:
             messages.error(request, '您无权访问台账模块！')
             # 尝试重定向到管理员首页，如果不存在则重定向到登录页
@@ -39,8 +47,8 @@ def check_ledger_permission(view_func):
 @check_ledger_permission
 def ledger_home(request):
     """台账选择页面"""
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     context = {
         'is_admin': is_admin,
         'is_manager': is_manager,
@@ -49,23 +57,11 @@ def ledger_home(request):
 
 def get_user_role_context(request):
     """辅助函数：获取用户角色信息"""
-    # 多角色支持：如果使用了角色特定的session，从那里获取用户
-    from jnu_lab_system.multi_role_session import get_role_from_path, get_user_from_role_session
-    
-    role = get_role_from_path(request.path)
-    current_user = request.user
-    
-    # 如果路径匹配某个角色，尝试从角色特定的session中获取用户
-    if role:
-        role_user = get_user_from_role_session(request, role)
-        if role_user:
-            current_user = role_user
-    
-    is_admin = current_user.groups.filter(name='设备管理员').exists() if current_user.is_authenticated else False
-    is_manager = current_user.groups.filter(name='实验室负责人').exists() if current_user.is_authenticated else False
+    # 多角色支持：MultiRoleSessionMiddleware 已按URL路径切换 request.user，
+    # request.roles 对应当前用户，用户组每个session只查询一次
     return {
-        'is_admin': is_admin,
-        'is_manager': is_manager,
+        'is_admin': request.roles.is_admin,
+        'is_manager': request.roles.is_manager,
     }
 
 @login_required
@@ -75,22 +71,13 @@ def device_ledger_list(request):
     from datetime import date, timedelta
     devices = Device.objects.all().order_by('device_code')
 
-    # 筛选
-    device_code = request.GET.get('device_code')
-    if device_code:
-        devices = devices.filter(device_code__icontains=device_code)
+    # 筛选（与导出共用）
+    devices = filter_devices(devices, request.GET)
 
-    model = request.GET.get('model')
-    if model:
-        devices = devices.filter(model__icontains=model)
-
-    manufacturer = request.GET.get('manufacturer')
-    if manufacturer:
-        devices = devices.filter(manufacturer__icontains=manufacturer)
-
-    status = request.GET.get('status')
-    if status:
-        devices = devices.filter(status=status)
+    # 分页（先分页，只为当前页的设备构建时段网格）
+    paginator = Paginator(devices, 20)  # 每页20条记录
+    page_number = request.GET.get('page')
+    page_obj = paginator.get_page(page_number)
 
     # 为每个设备计算时段可用状态（今天和未来6天，共7天）
     from datetime import date, timedelta, datetime
@@ -99,17 +86,13 @@ def device_ledger_list(request):
     time_slots = ['上午', '下午', '全天']
     device_time_status = {}
     
-    # 获取所有相关预约（一次性查询，提高性能）
-    future_date = today + timedelta(days=6)
-    active_bookings = Booking.objects.filter(
-        device__in=devices,
-        booking_date__gte=today,
-        booking_date__lte=future_date,
-        status__in=['pending', 'admin_approved', 'manager_approved', 'payment_pending', 'teacher_pending']
-    ).select_related('device', 'applicant')
+    # 一次性查询当前页设备一周内的有效预约，在内存中按（设备, 日期, 时段）建立索引
+    page_devices = list(page_obj.object_list)
+    page_obj.object_list = page_devices  # 模板复用已取出的设备，避免重复查询
+    occupancy = OccupancyIndex.for_week(page_devices, today, days=7)
     
     # 构建设备时段状态字典
-    for device in devices:
+    for device in page_devices:
         device_time_status[device.id] = []
         for day_offset in range(7):
             check_date = today + timedelta(days=day_offset)
@@ -122,12 +105,8 @@ def device_ledger_list(request):
             }
             
             for slot in time_slots:
-                # 查找该设备在该日期该时段的预约
-                booking = active_bookings.filter(
-                    device=device,
-                    booking_date=check_date,
-                    time_slot=slot
-                ).first()
+                # 查找该设备在该日期该时段的预约（内存索引，无SQL查询）
+                booking = occupancy.get(device.id, check_date, slot)
                 
                 if booking:
                     # 判断当前时段是否正在进行中（仅今天）
@@ -174,15 +153,10 @@ def device_ledger_list(request):
             
             device_time_status[device.id].append(day_status)
 
-    # 分页
-    paginator = Paginator(devices, 20)  # 每页20条记录
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
-
     context = {
         'page_obj': page_obj,
         'status_choices': DEVICE_STATUS,
-        'total_count': devices.count(),
+        'total_count': paginator.count,
         'device_time_status': device_time_status,
         'today': today,
         'time_slots': time_slots,
@@ -196,36 +170,17 @@ def device_operation_history_list(request):
     """设备操作历史列表视图（保留原有功能）"""
     ledgers = DeviceLedger.objects.select_related('device', 'user', 'operator').order_by('-operation_date')
 
-    # 筛选
-    device_code = request.GET.get('device_code')
-    if device_code:
-        ledgers = ledgers.filter(device__device_code__icontains=device_code)
+    # 筛选（与导出共用）
+    ledgers = filter_operations(ledgers, request.GET)
 
-    operation_type = request.GET.get('operation_type')
-    if operation_type:
-        ledgers = ledgers.filter(operation_type=operation_type)
-
-    date_from = request.GET.get('date_from')
-    if date_from:
-        ledgers = ledgers.filter(operation_date__date__gte=date_from)
-
-    date_to = request.GET.get('date_to')
-    if date_to:
-        ledgers = ledgers.filter(operation_date__date__lte=date_to)
-
-    operator_name = request.GET.get('operator')
-    if operator_name:
-        ledgers = ledgers.filter(operator__username__icontains=operator_name)
-
-    # 分页
-    paginator = Paginator(ledgers, 20)  # 每页20条记录
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 分页（?paging=cursor 为游标分页，?count=estimate 为估算总数）
+    page_obj, total_count, count_precision = paginate(ledgers, request.GET, 'operation_date')
 
     context = {
         'page_obj': page_obj,
         'operation_types': DeviceLedger.OPERATION_TYPES,
-        'total_count': ledgers.count(),
+        'total_count': total_count,
+        'count_precision': count_precision,
     }
     context.update(get_user_role_context(request))
     return render(request, 'ledger/device_ledger_list.html', context)
@@ -234,39 +189,20 @@ def device_operation_history_list(request):
 @check_ledger_permission
 def teacher_ledger_list(request):
     """教师台账列表视图：显示申请过设备借用的教师信息"""
-    # 筛选出申请过设备借用的教师（通过Booking关联），预加载设备信息
-    teachers = UserInfo.objects.filter(
-        user_type='teacher',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 筛选
-    user_code = request.GET.get('user_code')
-    if user_code:
-        teachers = teachers.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        teachers = teachers.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        teachers = teachers.filter(department__icontains=department)
-
-    title = request.GET.get('title')
-    if title:
-        teachers = teachers.filter(title__icontains=title)
+    # 申请过设备借用的教师，预约次数等借用统计用子查询计算，筛选与导出共用
+    teachers = borrowers(request.GET, 'teacher')
 
     # 分页
     paginator = Paginator(teachers, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # 只查询当前页用户借用过的设备编号（去重）
+    page_obj.object_list = attach_borrowed_devices(page_obj.object_list)
+
     context = {
         'page_obj': page_obj,
-        'total_count': teachers.count(),
+        'total_count': paginator.count,
     }
     context.update(get_user_role_context(request))
     return render(request, 'ledger/teacher_ledger_list.html', context)
@@ -275,44 +211,22 @@ def teacher_ledger_list(request):
 @check_ledger_permission
 def student_ledger_list(request):
     """学生台账列表视图：显示申请过设备借用的学生信息"""
-    # 筛选出申请过设备借用的学生（通过Booking关联），预加载设备信息
-    students = UserInfo.objects.filter(
-        user_type='student',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 筛选
-    user_code = request.GET.get('user_code')
-    if user_code:
-        students = students.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        students = students.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        students = students.filter(department__icontains=department)
-
-    major = request.GET.get('major')
-    if major:
-        students = students.filter(major__icontains=major)
-
-    advisor = request.GET.get('advisor')
-    if advisor:
-        # 通过多对多关系查询指导教师
-        students = students.filter(advisors__name__icontains=advisor).distinct()
+    # 申请过设备借用的学生，预约次数等借用统计用子查询计算，筛选与导出共用
+    students = borrowers(request.GET, 'student')
+    # 只显示导师姓名
+    students = prefetch_advisors(students)
 
     # 分页
     paginator = Paginator(students, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # 只查询当前页用户借用过的设备编号（去重）
+    page_obj.object_list = attach_borrowed_devices(page_obj.object_list)
+
     context = {
         'page_obj': page_obj,
-        'total_count': students.count(),
+        'total_count': paginator.count,
     }
     context.update(get_user_role_context(request))
     return render(request, 'ledger/student_ledger_list.html', context)
@@ -321,35 +235,20 @@ def student_ledger_list(request):
 @check_ledger_permission
 def external_ledger_list(request):
     """校外人员台账列表视图：显示申请过设备借用的校外人员信息"""
-    # 筛选出申请过设备借用的校外人员（通过Booking关联），预加载设备信息
-    externals = UserInfo.objects.filter(
-        user_type='external',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 筛选
-    user_code = request.GET.get('user_code')
-    if user_code:
-        externals = externals.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        externals = externals.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        externals = externals.filter(department__icontains=department)
+    # 申请过设备借用的校外人员，预约次数等借用统计用子查询计算，筛选与导出共用
+    externals = borrowers(request.GET, 'external')
 
     # 分页
     paginator = Paginator(externals, 20)
     page_number = request.GET.get('page')
     page_obj = paginator.get_page(page_number)
 
+    # 只查询当前页用户借用过的设备编号（去重）
+    page_obj.object_list = attach_borrowed_devices(page_obj.object_list)
+
     context = {
         'page_obj': page_obj,
-        'total_count': externals.count(),
+        'total_count': paginator.count,
     }
     context.update(get_user_role_context(request))
     return render(request, 'ledger/external_ledger_list.html', context)
@@ -360,45 +259,18 @@ def booking_ledger_list(request):
     """预约台账列表视图：显示所有预约申请信息"""
     bookings = Booking.objects.select_related('applicant', 'device').order_by('-create_time')
 
-    # 筛选
-    booking_code = request.GET.get('booking_code')
-    if booking_code:
-        bookings = bookings.filter(booking_code__icontains=booking_code)
-
-    device_code = request.GET.get('device_code')
-    if device_code:
-        bookings = bookings.filter(device__device_code__icontains=device_code)
-
-    applicant_name = request.GET.get('applicant_name')
-    if applicant_name:
-        bookings = bookings.filter(applicant__name__icontains=applicant_name)
-
-    user_type = request.GET.get('user_type')
-    if user_type:
-        bookings = bookings.filter(applicant__user_type=user_type)
-
-    status = request.GET.get('status')
-    if status:
-        bookings = bookings.filter(status=status)
-
-    date_from = request.GET.get('date_from')
-    if date_from:
-        bookings = bookings.filter(booking_date__gte=date_from)
+    # 筛选（与导出共用）
+    bookings = filter_bookings(bookings, request.GET)
 
-    date_to = request.GET.get('date_to')
-    if date_to:
-        bookings = bookings.filter(booking_date__lte=date_to)
-
-    # 分页
-    paginator = Paginator(bookings, 20)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    # 分页（?paging=cursor 为游标分页，?count=estimate 为估算总数）
+    page_obj, total_count, count_precision = paginate(bookings, request.GET, 'create_time')
 
     context = {
         'page_obj': page_obj,
         'status_choices': Booking.APPROVAL_STATUS,
         'user_type_choices': UserInfo.USER_TYPE_CHOICES,
-        'total_count': bookings.count(),
+        'total_count': total_count,
+        'count_precision': count_precision,
     }
     context.update(get_user_role_context(request))
     return render(request, 'ledger/booking_ledger_list.html', context)
@@ -415,607 +287,41 @@ def device_ledger_detail(request, pk):
 
 @login_required
 @check_ledger_permission
+@background_export('device_ledger')
 def export_device_ledger_csv(request):
-    """导出设备台账为Excel文件（.xlsx）"""
-    
-    devices = Device.objects.all().order_by('device_code')
-
-    # 应用相同的筛选条件
-    device_code = request.GET.get('device_code')
-    if device_code:
-        devices = devices.filter(device_code__icontains=device_code)
-
-    model = request.GET.get('model')
-    if model:
-        devices = devices.filter(model__icontains=model)
-
-    manufacturer = request.GET.get('manufacturer')
-    if manufacturer:
-        devices = devices.filter(manufacturer__icontains=manufacturer)
-
-    status = request.GET.get('status')
-    if status:
-        devices = devices.filter(status=status)
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "设备台账"
-
-    # 设置表头
-    headers = [
-        '设备编号', '型号', '购入时间', '生产厂商', '实验用途', 
-        '时段可用状态', '校内租用价格（元/2小时）', '校外租用价格（元/2小时）', '创建时间', '更新时间'
-    ]
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引（从1开始，表头是第1行，数据从第2行开始）
-    purchase_date_col = 3  # 购入时间
-    created_at_col = 9     # 创建时间
-    updated_at_col = 10    # 更新时间
-
-    # 写入数据
-    for device in devices:
-        # 转换datetime为naive datetime（移除时区信息）
-        purchase_date = device.purchase_date.date() if device.purchase_date else None
-        created_at = device.created_at.replace(tzinfo=None) if device.created_at else None
-        updated_at = device.updated_at.replace(tzinfo=None) if device.updated_at else None
-        
-        row = [
-            device.device_code,
-            device.model,
-            purchase_date,
-            device.manufacturer,
-            device.purpose or '-',
-            device.get_status_display(),
-            device.price_internal,
-            device.price_external,
-            created_at,
-            updated_at,
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if purchase_date:
-            cell = ws.cell(row=current_row, column=purchase_date_col)
-            cell.number_format = 'yyyy-mm-dd'
-        if created_at:
-            cell = ws.cell(row=current_row, column=created_at_col)
-            cell.number_format = 'yyyy-mm-dd hh:mm:ss'
-        if updated_at:
-            cell = ws.cell(row=current_row, column=updated_at_col)
-            cell.number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="device_info_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
+    """导出设备台账为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, device_ledger_table(request.GET))
 
 @login_required
 @check_ledger_permission
+@background_export('teacher_ledger')
 def export_teacher_ledger_csv(request):
-    """导出教师台账为Excel文件（.xlsx）"""
-    teachers = UserInfo.objects.filter(
-        user_type='teacher',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 应用相同的筛选条件
-    user_code = request.GET.get('user_code')
-    if user_code:
-        teachers = teachers.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        teachers = teachers.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        teachers = teachers.filter(department__icontains=department)
-
-    title = request.GET.get('title')
-    if title:
-        teachers = teachers.filter(title__icontains=title)
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "教师台账"
-
-    # 设置表头
-    headers = ['教师编号', '姓名', '性别', '职称', '专业方向', '所在学院', '联系电话', '借用设备', '创建时间']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引
-    create_time_col = 9
-
-    # 写入数据
-    for teacher in teachers:
-        device_codes = [booking.device.device_code for booking in teacher.booking_set.all()]
-        device_str = '、'.join(device_codes) if device_codes else '-'
-        # 转换datetime为naive datetime（移除时区信息）
-        create_time = teacher.create_time.replace(tzinfo=None) if teacher.create_time else None
-        
-        row = [
-            teacher.user_code,
-            teacher.name,
-            teacher.gender,
-            teacher.title or '-',
-            teacher.research_field or '-',
-            teacher.department,
-            teacher.phone,
-            device_str,
-            create_time,
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if create_time:
-            ws.cell(row=current_row, column=create_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="teacher_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
+    """导出教师台账为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, teacher_ledger_table(request.GET))
 
 @login_required
 @check_ledger_permission
+@background_export('student_ledger')
 def export_student_ledger_csv(request):
-    """导出学生台账为Excel文件（.xlsx）"""
-    students = UserInfo.objects.filter(
-        user_type='student',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 应用相同的筛选条件
-    user_code = request.GET.get('user_code')
-    if user_code:
-        students = students.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        students = students.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        students = students.filter(department__icontains=department)
-
-    major = request.GET.get('major')
-    if major:
-        students = students.filter(major__icontains=major)
-
-    advisor = request.GET.get('advisor')
-    if advisor:
-        # 通过多对多关系查询指导教师
-        students = students.filter(advisors__name__icontains=advisor).distinct()
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "学生台账"
-
-    # 设置表头
-    headers = ['学号', '姓名', '性别', '专业', '导师', '所在学院', '联系电话', '借用设备', '创建时间']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引
-    create_time_col = 9
-
-    # 写入数据
-    for student in students:
-        device_codes = [booking.device.device_code for booking in student.booking_set.all()]
-        device_str = '、'.join(device_codes) if device_codes else '-'
-        # 转换datetime为naive datetime（移除时区信息）
-        create_time = student.create_time.replace(tzinfo=None) if student.create_time else None
-        
-        row = [
-            student.user_code,
-            student.name,
-            student.gender,
-            student.major or '-',
-            ', '.join([a.name for a in student.advisors.all()]) or '-',
-            student.department,
-            student.phone,
-            device_str,
-            create_time,
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if create_time:
-            ws.cell(row=current_row, column=create_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="student_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
+    """导出学生台账为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, student_ledger_table(request.GET))
 
 @login_required
 @check_ledger_permission
+@background_export('external_ledger')
 def export_external_ledger_csv(request):
-    """导出校外人员台账为Excel文件（.xlsx）"""
-    externals = UserInfo.objects.filter(
-        user_type='external',
-        booking__isnull=False
-    ).distinct().prefetch_related('booking_set__device').annotate(
-        booking_count=Count('booking')
-    ).order_by('user_code')
-
-    # 应用相同的筛选条件
-    user_code = request.GET.get('user_code')
-    if user_code:
-        externals = externals.filter(user_code__icontains=user_code)
-
-    name = request.GET.get('name')
-    if name:
-        externals = externals.filter(name__icontains=name)
-
-    department = request.GET.get('department')
-    if department:
-        externals = externals.filter(department__icontains=department)
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "校外人员台账"
-
-    # 设置表头
-    headers = ['编号', '姓名', '性别', '所在单位名称', '联系电话', '借用设备', '创建时间']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引
-    create_time_col = 7
-
-    # 写入数据
-    for external in externals:
-        device_codes = [booking.device.device_code for booking in external.booking_set.all()]
-        device_str = '、'.join(device_codes) if device_codes else '-'
-        # 转换datetime为naive datetime（移除时区信息）
-        create_time = external.create_time.replace(tzinfo=None) if external.create_time else None
-        
-        row = [
-            external.user_code,
-            external.name,
-            external.gender,
-            external.department,
-            external.phone,
-            device_str,
-            create_time,
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if create_time:
-            ws.cell(row=current_row, column=create_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="external_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
+    """导出校外人员台账为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, external_ledger_table(request.GET))
 
 @login_required
 @check_ledger_permission
+@background_export('booking_ledger')
 def export_booking_ledger_csv(request):
-    """导出预约台账为Excel文件（.xlsx）"""
-    bookings = Booking.objects.select_related('applicant', 'device').order_by('-create_time')
-
-    # 应用相同的筛选条件
-    booking_code = request.GET.get('booking_code')
-    if booking_code:
-        bookings = bookings.filter(booking_code__icontains=booking_code)
-
-    device_code = request.GET.get('device_code')
-    if device_code:
-        bookings = bookings.filter(device__device_code__icontains=device_code)
-
-    applicant_name = request.GET.get('applicant_name')
-    if applicant_name:
-        bookings = bookings.filter(applicant__name__icontains=applicant_name)
-
-    user_type = request.GET.get('user_type')
-    if user_type:
-        bookings = bookings.filter(applicant__user_type=user_type)
-
-    status = request.GET.get('status')
-    if status:
-        bookings = bookings.filter(status=status)
-
-    date_from = request.GET.get('date_from')
-    if date_from:
-        bookings = bookings.filter(booking_date__gte=date_from)
-
-    date_to = request.GET.get('date_to')
-    if date_to:
-        bookings = bookings.filter(booking_date__lte=date_to)
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "预约台账"
-
-    # 设置表头
-    headers = [
-        '预约编号', '申请人编号', '申请人姓名', '申请人类型', '设备编号', '设备型号',
-        '预约日期', '预约时段', '借用用途', '指导教师编号', '审批状态', '创建时间', '更新时间'
-    ]
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引
-    booking_date_col = 7
-    create_time_col = 12
-    update_time_col = 13
-
-    # 写入数据
-    for booking in bookings:
-        # 转换datetime为naive datetime（移除时区信息）
-        booking_date = booking.booking_date if booking.booking_date else None
-        create_time = booking.create_time.replace(tzinfo=None) if booking.create_time else None
-        update_time = booking.update_time.replace(tzinfo=None) if booking.update_time else None
-        
-        row = [
-            booking.booking_code,
-            booking.applicant.user_code,
-            booking.applicant.name,
-            booking.applicant.get_user_type_display(),
-            booking.device.device_code,
-            booking.device.model,
-            booking_date,
-            booking.time_slot,
-            booking.purpose or '-',
-            booking.teacher.user_code if booking.teacher else '-',
-            booking.get_status_display(),
-            create_time,
-            update_time,
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if booking_date:
-            ws.cell(row=current_row, column=booking_date_col).number_format = 'yyyy-mm-dd'
-        if create_time:
-            ws.cell(row=current_row, column=create_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-        if update_time:
-            ws.cell(row=current_row, column=update_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="booking_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
+    """导出预约台账为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, booking_ledger_table(request.GET))
 
 @login_required
+@background_export('operation_history')
 def export_ledger_csv(request):
-    """导出设备操作历史为Excel文件（.xlsx）"""
-    ledgers = DeviceLedger.objects.select_related('device', 'user', 'operator').order_by('-operation_date')
-
-    # 应用相同的筛选条件
-    device_code = request.GET.get('device_code')
-    if device_code:
-        ledgers = ledgers.filter(device__device_code__icontains=device_code)
-
-    operation_type = request.GET.get('operation_type')
-    if operation_type:
-        ledgers = ledgers.filter(operation_type=operation_type)
-
-    date_from = request.GET.get('date_from')
-    if date_from:
-        ledgers = ledgers.filter(operation_date__date__gte=date_from)
-
-    date_to = request.GET.get('date_to')
-    if date_to:
-        ledgers = ledgers.filter(operation_date__date__lte=date_to)
-
-    operator_name = request.GET.get('operator')
-    if operator_name:
-        ledgers = ledgers.filter(operator__username__icontains=operator_name)
-
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "设备操作历史"
-
-    # 设置表头
-    headers = [
-        '设备编号', '设备名称', '借用人', '操作类型', '操作日期',
-        '预期归还时间', '实际归还时间', '设备状态', '操作员', '备注'
-    ]
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-
-    # 日期列的索引
-    operation_date_col = 5
-    expected_return_date_col = 6
-    actual_return_date_col = 7
-
-    # 写入数据
-    for ledger in ledgers:
-        # 处理设备编号：优先使用device.device_code，否则从description中提取
-        if ledger.device:
-            device_code = ledger.device.device_code
-        elif ledger.operation_type == 'discard' and '删除设备：' in (ledger.description or ''):
-            # 从删除描述中提取设备编号
-            desc = ledger.description or ''
-            if '删除设备：' in desc:
-                device_code = desc.split('删除设备：')[1].split(' - ')[0]
-            else:
-                device_code = ledger.device_name
-        else:
-            device_code = ledger.device_name
-        
-        # 转换datetime为naive datetime（移除时区信息）
-        operation_date = ledger.operation_date.replace(tzinfo=None) if ledger.operation_date else None
-        expected_return_date = ledger.expected_return_date.replace(tzinfo=None) if ledger.expected_return_date else None
-        actual_return_date = ledger.actual_return_date.replace(tzinfo=None) if ledger.actual_return_date else None
-        
-        row = [
-            device_code,
-            ledger.device_name,
-            ledger.user.name if ledger.user else '',
-            ledger.get_operation_type_display(),
-            operation_date,
-            expected_return_date,
-            actual_return_date,
-            ledger.get_status_after_operation_display(),
-            ledger.operator.username if ledger.operator else '系统',
-            ledger.description or ''
-        ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if operation_date:
-            ws.cell(row=current_row, column=operation_date_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-        if expected_return_date:
-            ws.cell(row=current_row, column=expected_return_date_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-        if actual_return_date:
-            ws.cell(row=current_row, column=actual_return_date_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="device_operation_history.xlsx"'
-    
-    wb.save(response)
-    return response
\ No newline at end of file
+    """导出设备操作历史为Excel文件（.xlsx），?format=csv 时导出为CSV，?background=1 时转为后台导出任务"""
+    return export_response(request, operation_history_table(request.GET))
@@ -0,0 +1,75 @@
+"""
+用户台账导出
+与用户管理页面相同的筛选条件（用户类型、姓名/编号关键字），返回 ExportTable，
+由 jnu_lab_system.exports 流式写成文件。
+"""
+from django.db.models import Count, Prefetch
+from user.models import UserInfo
+from search.index import search
+from jnu_lab_system.exports import ExportTable, EXPORT_CHUNK_SIZE, DATETIME_FORMAT, naive
+
+USER_LEDGER_HEADERS = {
+    'teacher': ['教师编号', '姓名', '性别', '职称', '专业方向', '所在学院', '联系电话', '借用次数', '借用资格', '创建时间'],
+    'student': ['学号', '姓名', '性别', '专业', '导师', '所在学院', '联系电话', '借用次数', '借用资格', '创建时间'],
+    'external': ['编号', '姓名', '性别', '所在单位名称', '联系电话', '借用次数', '借用资格', '创建时间'],
+    '': ['用户编号', '姓名', '用户类型', '性别', '所在学院/单位', '联系电话', '借用次数', '借用资格', '创建时间'],
+}
+
+
+def filter_users(params):
+    user_type = params.get('user_type', '')
+    keyword = params.get('keyword', '')
+    users = UserInfo.objects.annotate(booking_count=Count('booking'))
+    if user_type and user_type in ['student', 'teacher', 'external']:
+        users = users.filter(user_type=user_type)
+    if keyword:
+        users = search(users, keyword, ['name', 'user_code'])
+    return users
+
+
+def _user_row(user, user_type):
+    status = '正常' if user.is_active else '禁用'
+    create_time = naive(user.create_time)
+    if user_type == 'teacher':
+        return [
+            user.user_code, user.name, user.gender, user.title or '-', user.research_field or '-',
+            user.department, user.phone, user.booking_count, status, create_time,
+        ]
+    if user_type == 'student':
+        return [
+            user.user_code, user.name, user.gender, user.major or '-',
+            ', '.join([a.name for a in user.advisors.all()]),
+            user.department, user.phone, user.booking_count, status, create_time,
+        ]
+    if user_type == 'external':
+        return [
+            user.user_code, user.name, user.gender, user.department, user.phone,
+            user.booking_count, status, create_time,
+        ]
+    return [
+        user.user_code, user.name, user.get_user_type_display(), user.gender, user.department,
+        user.phone, user.booking_count, status, create_time,
+    ]
+
+
+def user_ledger_table(params):
+    """用户台账（表头随用户类型筛选变化）"""
+    user_type = params.get('user_type', '')
+    if user_type not in USER_LEDGER_HEADERS:
+        user_type = ''
+    users = filter_users(params)
+    if user_type == 'student':
+        # 导师姓名按批预加载（每批一次查询），不在每行单独查询
+        users = users.prefetch_related(
+            Prefetch('advisors', queryset=UserInfo.objects.only('id', 'name').order_by('-create_time'))
+        )
+    headers = USER_LEDGER_HEADERS[user_type]
+
+    def rows():
+        for user in users.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            yield _user_row(user, user_type)
+
+    return ExportTable(
+        '用户台账', 'user_ledger', headers, rows(),
+        formats={len(headers): DATETIME_FORMAT},
+    )
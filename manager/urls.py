@@ -1,11 +1,14 @@
 from django.urls import path
 from . import views
+from labadmin.views import export_job_status, export_job_download, booking_approve_batch
 
 urlpatterns = [
     # 负责人首页
     path('home/', views.manager_home, name='manager_home'),
     # 校外人员审批页
     path('booking/approve/', views.booking_approve, name='manager_booking_approve'),
+    # 批量审批接口（JSON）
+    path('booking/approve/batch/', booking_approve_batch, name='manager_booking_approve_batch'),
     # 用户管理核心路由
     path('user/manage/', views.user_manage, name='user_manage'),          # 用户列表/新增
     path('user/edit/<int:pk>/', views.user_edit, name='user_edit'),      # 编辑用户
@@ -17,6 +20,9 @@ urlpatterns = [
     path('report/', views.manager_report_stat, name='manager_report_stat'),
     # 报表导出
     path('report/export/<int:report_id>/', views.manager_export_report_csv, name='manager_export_report_csv'),
+    # 后台导出任务：状态查询 / 文件下载
+    path('export/job/<int:job_id>/', export_job_status, name='manager_export_job_status'),
+    path('export/job/<int:job_id>/download/', export_job_download, name='manager_export_job_download'),
     # 报表删除
     path('report/delete/<int:report_id>/', views.manager_delete_report, name='manager_delete_report'),
 ]
\ No newline at end of file
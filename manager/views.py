@@ -14,11 +14,14 @@ from django.shortcuts import redirect
 from user.models import UserInfo
 from booking.models import Booking, ApprovalRecord
 from django.contrib import messages
-from openpyxl import Workbook
-from openpyxl.styles import Font, Alignment
-from openpyxl.utils import get_column_letter
+from jnu_lab_system.exports import xlsx_response
+from .exports import user_ledger_table
+from labadmin.export_jobs import background_export
 
-from labadmin.views import handle_approval
+from labadmin.views import handle_approval, handle_batch_approval, report_job_params
+from jnu_lab_system.identity import get_current_user_info
+from search.index import search
+from booking.queue_counters import MANAGER_QUEUE, REGISTRATION_QUEUE, queue_count, queue_counts
 
 # Create your views here.
 # ---------------------- 负责人视图 ----------------------
@@ -33,8 +36,8 @@ def manager_home(request):
         return redirect('user_login')
     
     # 验证用户是否是负责人（严格检查，不允许管理员访问）
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
+    is_manager = request.roles.is_manager
+    is_admin = request.roles.is_admin
     
     # 关键修复：如果是管理员但不是负责人，必须重定向到管理员首页
     if is_admin and not is_manager and not request.user.is_superuser:
@@ -45,8 +48,7 @@ def manager_home(request):
     if not is_manager:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -54,15 +56,20 @@ def manager_home(request):
         messages.error(request, '您不是实验室负责人，无权访问此页面！')
         return redirect('user_login')
     
-    return render(request, 'manager/home.html')
+    # 待处理数量读取审批队列计数
+    counts = queue_counts([(MANAGER_QUEUE, None), (REGISTRATION_QUEUE, None)])
+    return render(request, 'manager/home.html', {
+        'pending_booking_count': counts[(MANAGER_QUEUE, None)],
+        'pending_approvals': counts[(REGISTRATION_QUEUE, None)],
+    })
 
 @login_required
 @csrf_protect
 def booking_approve(request):
     """设备预约审批（负责人） - 仅允许负责人访问"""
     # 校验是否是负责人（严格检查，不允许管理员访问负责人审批页面）
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 关键修复：如果是管理员但不是负责人，重定向到管理员审批页面
     if is_admin and not is_manager and not request.user.is_superuser:
@@ -73,8 +80,7 @@ def booking_approve(request):
     if not is_manager:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -117,10 +123,8 @@ def booking_approve(request):
         
         # 批量审批（简化版）
         elif 'batch_approve' in request.POST or 'batch_reject' in request.POST:
-            booking_ids = request.POST.getlist('booking_ids')
             action = 'approve' if 'batch_approve' in request.POST else 'reject'
-            for booking_id in booking_ids:
-                handle_approval(request, booking_id, action)
+            handle_batch_approval(request, request.POST.getlist('booking_ids'), action)
         
         # 保留查询参数（筛选条件），避免跳转错误
         from django.http import HttpResponseRedirect
@@ -144,8 +148,8 @@ def booking_approve(request):
 def manager_report_stat(request):
     """负责人报表统计页面 - 仅允许负责人访问"""
     # 验证用户是否是负责人（严格检查，不允许管理员访问）
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 关键修复：如果是管理员但不是负责人，重定向到管理员报表页面
     if is_admin and not is_manager and not request.user.is_superuser:
@@ -156,8 +160,7 @@ def manager_report_stat(request):
     if not is_manager:
         # 如果是普通用户，重定向到普通用户首页
         try:
-            from user.models import UserInfo
-            user_info = UserInfo.objects.get(auth_user=request.user)
+            user_info = get_current_user_info(request)
             return redirect('user_home')
         except:
             pass
@@ -165,9 +168,9 @@ def manager_report_stat(request):
         return redirect('user_login')
     
     from labadmin.models import Report
-    from labadmin.views import generate_report_data
-    from datetime import datetime, timedelta, date
-    from decimal import Decimal
+    from labadmin.reports import (
+        InvalidReportPeriod, create_report, find_existing_report, parse_report_period, report_name_for
+    )
 
     # 获取已生成的报表列表
     reports = Report.objects.all().order_by('-generated_at')[:20]
@@ -197,83 +200,27 @@ def manager_report_stat(request):
         
         try:
             # 解析日期
-            if report_type == 'week':
-                # 周报表：输入日期所在周的周一和周日
-                input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
-                start_date = input_date - timedelta(days=input_date.weekday())
-                end_date = start_date + timedelta(days=6)
-                report_name = f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')} 周报表"
-            elif report_type == 'month':
-                # 月报表：输入日期所在月的第一天和最后一天
-                # 处理 YYYY-MM 格式
-                if len(date_input) == 7 and date_input.count('-') == 1:
-                    year, month = map(int, date_input.split('-'))
-                else:
-                    # 尝试解析为日期
-                    input_date = datetime.strptime(date_input, '%Y-%m-%d').date()
-                    year, month = input_date.year, input_date.month
-                start_date = date(year, month, 1)
-                if month == 12:
-                    end_date = date(year + 1, 1, 1) - timedelta(days=1)
-                else:
-                    end_date = date(year, month + 1, 1) - timedelta(days=1)
-                report_name = f"{year}年{month:02d}月报表"
-            elif report_type == 'year':
-                # 年报表：输入日期所在年的1月1日和12月31日
-                year = int(date_input)
-                start_date = date(year, 1, 1)
-                end_date = date(year, 12, 31)
-                report_name = f"{year}年报表"
-            elif report_type == 'custom':
-                # 自定义时间段报表：使用用户指定的起始日期和结束日期
-                start_date = datetime.strptime(start_date_input, '%Y-%m-%d').date()
-                end_date = datetime.strptime(end_date_input, '%Y-%m-%d').date()
-                
-                # 验证日期范围
-                if start_date > end_date:
-                    messages.error(request, '起始日期不能晚于结束日期！')
-                    return redirect('manager_report_stat')
-                
-                report_name = f"{start_date.strftime('%Y年%m月%d日')} 至 {end_date.strftime('%Y年%m月%d日')} 自定义报表"
-            else:
-                messages.error(request, '无效的报表类型！')
-                return redirect('manager_report_stat')
+            start_date, end_date = parse_report_period(report_type, date_input, start_date_input, end_date_input)
+            report_name = report_name_for(report_type, start_date, end_date)
             
             # 检查是否已存在相同报表（只检查相同类型的，自定义报表可以重复生成）
-            if report_type != 'custom':
-                existing_report = Report.objects.filter(
-                    report_type=report_type,
-                    start_date=start_date,
-                    end_date=end_date
-                ).first()
-                
-                if existing_report:
-                    if existing_report.generated_by:
-                        messages.info(request, f'该时间段报表已存在（手动生成），已为您加载：{existing_report.report_name}')
-                    else:
-                        messages.info(request, f'该时间段报表已存在（系统自动生成），已为您加载：{existing_report.report_name}')
-                    return redirect(f'manager_report_stat?view={existing_report.id}')
-            
-            # 生成报表数据
-            report_data = generate_report_data(report_type, start_date, end_date)
+            existing_report = find_existing_report(report_type, start_date, end_date)
+            if existing_report:
+                if existing_report.generated_by:
+                    messages.info(request, f'该时间段报表已存在（手动生成），已为您加载：{existing_report.report_name}')
+                else:
+                    messages.info(request, f'该时间段报表已存在（系统自动生成），已为您加载：{existing_report.report_name}')
+                return redirect(f'manager_report_stat?view={existing_report.id}')
             
-            # 创建报表记录
-            report = Report.objects.create(
-                report_type=report_type,
-                report_name=report_name,
-                start_date=start_date,
-                end_date=end_date,
-                report_data=report_data,
-                total_bookings=report_data['summary']['total_bookings'],
-                total_devices=report_data['summary']['total_devices'],
-                total_users=report_data['summary']['total_users'],
-                total_revenue=Decimal(str(report_data['summary']['total_revenue'])),
-                generated_by=request.user
-            )
+            # 生成报表数据并保存（统计结果按时间段缓存，数据未变化时不重复计算）
+            report = create_report(report_type, start_date, end_date, generated_by=request.user, report_name=report_name)
             
             messages.success(request, f'报表生成成功：{report_name}')
             return redirect(f'manager_report_stat?view={report.id}')
             
+        except InvalidReportPeriod as e:
+            messages.error(request, str(e))
+            return redirect('manager_report_stat')
         except ValueError as e:
             messages.error(request, f'日期格式错误：请检查日期格式是否正确！')
             return redirect('manager_report_stat')
@@ -326,117 +273,14 @@ def manager_delete_report(request, report_id):
     return HttpResponseRedirect(redirect_url)
 
 @login_required
+@background_export('report', report_job_params)
 def manager_export_report_csv(request, report_id):
-    """负责人导出报表为Excel文件（.xlsx）"""
-    from django.http import HttpResponse
+    """负责人导出报表为Excel文件（.xlsx），?background=1 时转为后台导出任务"""
     from labadmin.models import Report
-    import re
+    from labadmin.reports import report_xlsx_response
     
     report = get_object_or_404(Report, id=report_id)
-    data = report.get_report_data()
-    
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "报表"
-    
-    # 写入报表基本信息
-    # 转换datetime为naive datetime（移除时区信息）
-    generated_at = report.generated_at.replace(tzinfo=None) if report.generated_at else None
-    
-    ws.append(['报表名称', report.report_name])
-    ws.append(['报表类型', report.get_report_type_display()])
-    ws.append(['统计时间', f'{report.start_date.strftime("%Y-%m-%d")} 至 {report.end_date.strftime("%Y-%m-%d")}'])
-    ws.append(['生成时间', generated_at])
-    ws.append(['生成人', report.generated_by.username if report.generated_by else '系统自动'])
-    ws.append([])  # 空行
-    
-    # 设置生成时间为日期格式
-    if generated_at:
-        ws.cell(row=4, column=2).number_format = 'yyyy-mm-dd hh:mm:ss'
-    
-    # 写入汇总统计
-    ws.append(['汇总统计'])
-    ws.append(['总预约次数', data['summary']['total_bookings']])
-    ws.append(['已审批通过', data['summary']['approved_count']])
-    ws.append(['总收入（元）', data['summary']['total_revenue']])
-    ws.append(['设备总数', data['summary']['total_devices']])
-    ws.append(['用户总数', data['summary']['total_users']])
-    ws.append([])  # 空行
-    
-    # 写入设备使用统计
-    ws.append(['设备使用统计'])
-    headers = ['设备编号', '设备型号', '预约次数', '使用时长（小时）', '使用率（%）', '校外收费（元）']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_row = ws.max_row
-    header_font = Font(bold=True)
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for device in data.get('device_usage', []):
-        ws.append([
-            device['device_code'],
-            device['device_model'],
-            device['booking_count'],
-            device['usage_hours'],
-            f"{device['usage_rate']}%",
-            device['revenue']
-        ])
-    ws.append([])  # 空行
-    
-    # 写入用户类型统计
-    ws.append(['用户类型统计'])
-    headers = ['用户类型', '预约次数', '用户数量']
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_row = ws.max_row
-    for col in range(1, len(headers) + 1):
-        cell = ws.cell(row=header_row, column=col)
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    for stat in data.get('user_type_stats', []):
-        user_type = stat.get('applicant__user_type', '')
-        user_type_display = {
-            'student': '校内学生',
-            'teacher': '校内教师',
-            'external': '校外人员'
-        }.get(user_type, user_type)
-        ws.append([
-            user_type_display,
-            stat['booking_count'],
-            stat['user_count']
-        ])
-    
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 创建响应
-    # 清理文件名中的特殊字符
-    import re
-    safe_filename = re.sub(r'[<>:"/\\|?*]', '_', report.report_name)
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = f'attachment; filename="report_{report.id}_{safe_filename}.xlsx"'
-    
-    wb.save(response)
-    return response
+    return report_xlsx_response(report)
 
 # -----------------------s--- 1. 用户列表（含搜索、筛选） --------------------------
 @login_required
@@ -465,7 +309,7 @@ def user_manage(request):
         user = UserInfo.objects.none()  # 空查询集
     if keyword:
         if user_type != 'admin':
-            user = user.filter(Q(name__icontains=keyword) | Q(user_code__icontains=keyword))
+            user = search(user, keyword, ['name', 'user_code'])
         else:
             admin_users = admin_users.filter(Q(username__icontains=keyword) | Q(first_name__icontains=keyword))
     if approval_status == 'pending':
@@ -534,7 +378,7 @@ def user_manage(request):
                         'active_users': user.filter(is_active=True).count() + (admin_users.filter(is_active=True).count() if user_type == 'admin' else 0),
                         'inactive_users': user.filter(is_active=False).count() + (admin_users.filter(is_active=False).count() if user_type == 'admin' else 0),
                         'users_with_bookings': user.filter(booking_count__gt=0).count(),
-                        'pending_approvals': UserInfo.objects.filter(approval_status='pending').count(),
+                        'pending_approvals': queue_count(REGISTRATION_QUEUE),
                     })
                 
                 # 创建登录账号
@@ -608,8 +452,8 @@ def user_manage(request):
     
     # 4. 准备上下文（原有逻辑不变）
     # 获取用户角色信息
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     # 统计信息（包含管理员）
     if user_type == 'admin':
@@ -623,7 +467,7 @@ def user_manage(request):
         inactive_users = user.filter(is_active=False).count()
         users_with_bookings = user.filter(booking_count__gt=0).count()
     
-    pending_approvals = UserInfo.objects.filter(approval_status='pending').count()
+    pending_approvals = queue_count(REGISTRATION_QUEUE)
     
     context = {
         'users': user,
@@ -690,8 +534,8 @@ def user_edit(request, pk):
         form = UserInfoForm(instance=user_info)
     
     # 获取用户角色信息
-    is_admin = request.user.groups.filter(name='设备管理员').exists()
-    is_manager = request.user.groups.filter(name='实验室负责人').exists()
+    is_admin = request.roles.is_admin
+    is_manager = request.roles.is_manager
     
     context = {
         'form': form,
@@ -773,127 +617,7 @@ def user_toggle_admin_status(request, pk):
 
 # -------------------------- 5. 导出用户台账 --------------------------
 @login_required
+@background_export('user_ledger')
 def user_export_ledger(request):
-    """导出用户台账为Excel文件（.xlsx）"""
-    from django.http import HttpResponse
-    from django.db.models import Count
-    
-    user_type = request.GET.get('user_type', '')
-    keyword = request.GET.get('keyword', '')
-    
-    # 根据筛选条件获取用户
-    users = UserInfo.objects.annotate(booking_count=Count('booking'))
-    if user_type and user_type in ['student', 'teacher', 'external']:
-        users = users.filter(user_type=user_type)
-    if keyword:
-        users = users.filter(Q(name__icontains=keyword) | Q(user_code__icontains=keyword))
-    
-    # 创建Excel工作簿
-    wb = Workbook()
-    ws = wb.active
-    ws.title = "用户台账"
-    
-    # 根据用户类型设置不同的表头
-    if user_type == 'teacher':
-        headers = ['教师编号', '姓名', '性别', '职称', '专业方向', '所在学院', '联系电话', '借用次数', '借用资格', '创建时间']
-        create_time_col = 10
-    elif user_type == 'student':
-        headers = ['学号', '姓名', '性别', '专业', '导师', '所在学院', '联系电话', '借用次数', '借用资格', '创建时间']
-        create_time_col = 10
-    elif user_type == 'external':
-        headers = ['编号', '姓名', '性别', '所在单位名称', '联系电话', '借用次数', '借用资格', '创建时间']
-        create_time_col = 8
-    else:
-        headers = ['用户编号', '姓名', '用户类型', '性别', '所在学院/单位', '联系电话', '借用次数', '借用资格', '创建时间']
-        create_time_col = 9
-    
-    ws.append(headers)
-    
-    # 设置表头样式
-    header_font = Font(bold=True)
-    for cell in ws[1]:
-        cell.font = header_font
-        cell.alignment = Alignment(horizontal='center', vertical='center')
-    
-    # 写入数据
-    for user in users:
-        # 转换datetime为naive datetime（移除时区信息）
-        create_time = user.create_time.replace(tzinfo=None) if user.create_time else None
-        
-        if user_type == 'teacher':
-            row = [
-                user.user_code,
-                user.name,
-                user.gender,
-                user.title or '-',
-                user.research_field or '-',
-                user.department,
-                user.phone,
-                user.booking_count,
-                '正常' if user.is_active else '禁用',
-                create_time,
-            ]
-        elif user_type == 'student':
-            row = [
-                user.user_code,
-                user.name,
-                user.gender,
-                user.major or '-',
-                ', '.join([a.name for a in user.advisors.all()]) if user.user_type == 'student' else '-',
-                user.department,
-                user.phone,
-                user.booking_count,
-                '正常' if user.is_active else '禁用',
-                create_time,
-            ]
-        elif user_type == 'external':
-            row = [
-                user.user_code,
-                user.name,
-                user.gender,
-                user.department,
-                user.phone,
-                user.booking_count,
-                '正常' if user.is_active else '禁用',
-                create_time,
-            ]
-        else:
-            row = [
-                user.user_code,
-                user.name,
-                user.get_user_type_display(),
-                user.gender,
-                user.department,
-                user.phone,
-                user.booking_count,
-                '正常' if user.is_active else '禁用',
-                create_time,
-            ]
-        ws.append(row)
-        
-        # 设置日期格式（短日期格式）
-        current_row = ws.max_row
-        if create_time:
-            ws.cell(row=current_row, column=create_time_col).number_format = 'yyyy-mm-dd hh:mm:ss'
-    
-    # 自动调整列宽
-    for column in ws.columns:
-        max_length = 0
-        column_letter = get_column_letter(column[0].column)
-        for cell in column:
-            try:
-                if len(str(cell.value)) > max_length:
-                    max_length = len(str(cell.value))
-            except:
-                pass
-        adjusted_width = min(max_length + 2, 50)
-        ws.column_dimensions[column_letter].width = adjusted_width
-    
-    # 创建响应
-    response = HttpResponse(
-        content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
-    )
-    response['Content-Disposition'] = 'attachment; filename="user_ledger.xlsx"'
-    
-    wb.save(response)
-    return response
\ No newline at end of file
+    """导出用户台账为Excel文件（.xlsx），?background=1 时转为后台导出任务"""
+    return xlsx_response(user_ledger_table(request.GET))
\ No newline at end of file
@@ -0,0 +1,166 @@
+"""
+关键字搜索
+设备、用户、预约的关键字搜索统一通过 search() / matching() 完成，语义与原来多列 icontains 相同
+（任一列包含关键字即匹配，不区分大小写），按数据库选择实现：
+
+- SQLite：每个模型一张 FTS5 虚拟表（trigram 分词，rowid 与模型主键一致），由信号在保存/删除时同步，
+  关键字不少于3个字符时用 MATCH 查询索引；更短的关键字 trigram 无法使用索引，退回 icontains；
+  SQLite 编译时未包含 FTS5 或版本低于 3.34（没有 trigram 分词）时不建虚拟表，同样退回 icontains（fts_supported()）；
+- PostgreSQL：迁移为各列建立 pg_trgm 的 GIN 表达式索引（UPPER(列)），icontains 生成的
+  UPPER(列) LIKE UPPER(%s) 直接使用该索引，不需要额外的表和同步；
+- 其他数据库：icontains。
+
+新增被搜索的列时修改 INDEXES，并新增迁移重建对应的索引表（python manage.py rebuild_search_index）。
+"""
+from django.db import DatabaseError, connection, transaction
+from django.db.models import Q
+from django.db.models.expressions import RawSQL
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+
+# trigram 分词需要的最少字符数
+MIN_MATCH_LENGTH = 3
+
+
+class SearchIndex:
+    """一个模型的搜索索引：FTS5 表名和被搜索的列（与模型字段同名）"""
+
+    def __init__(self, model, table, fields):
+        self.model = model
+        self.table = table
+        self.fields = tuple(fields)
+
+    def values(self, instance):
+        return [getattr(instance, field) for field in self.fields]
+
+
+INDEXES = {
+    index.model: index for index in (
+        SearchIndex(Device, 'search_device_fts', ['device_code', 'model', 'manufacturer', 'purpose']),
+        SearchIndex(UserInfo, 'search_userinfo_fts', ['user_code', 'name', 'department']),
+        SearchIndex(Booking, 'search_booking_fts', ['booking_code', 'purpose']),
+    )
+}
+
+
+# 数据库别名 -> 是否支持 FTS5 trigram 分词
+_fts_support = {}
+
+
+def fts_supported(conn=None):
+    """SQLite 是否支持 FTS5 的 trigram 分词：在保存点中试建一张临时虚拟表（结果按数据库缓存）
+
+    迁移按它决定是否建立虚拟表，uses_fts() 按它决定是否查询索引，两者一致。
+    """
+    conn = conn or connection
+    if conn.vendor != 'sqlite':
+        return False
+    if conn.alias not in _fts_support:
+        try:
+            with transaction.atomic(using=conn.alias), conn.cursor() as cursor:
+                cursor.execute("CREATE VIRTUAL TABLE temp.search_fts_probe USING fts5(x, tokenize='trigram')")
+                cursor.execute('DROP TABLE temp.search_fts_probe')
+            _fts_support[conn.alias] = True
+        except DatabaseError:
+            _fts_support[conn.alias] = False
+    return _fts_support[conn.alias]
+
+
+def uses_fts():
+    return fts_supported(connection)
+
+
+def _match_expression(keyword, fields):
+    """FTS5 查询：只在指定列中查找，整个关键字作为短语（即子串）匹配"""
+    phrase = '"' + keyword.replace('"', '""') + '"'
+    return '{%s} : %s' % (' '.join(fields), phrase)
+
+
+def _contains(fields, keyword, prefix=''):
+    q = Q()
+    for field in fields:
+        q |= Q(**{f'{prefix}{field}__icontains': keyword})
+    return q
+
+
+def _index_for(model, fields):
+    index = INDEXES[model]
+    fields = tuple(fields) if fields else index.fields
+    unknown = set(fields) - set(index.fields)
+    if unknown:
+        raise ValueError(f'{model.__name__} 的搜索索引不包含字段：{", ".join(sorted(unknown))}')
+    return index, fields
+
+
+def matching(model, keyword, fields=None):
+    """包含关键字的记录主键（可用于 pk__in / 外键__in 子查询）"""
+    index, fields = _index_for(model, fields)
+    if uses_fts() and len(keyword) >= MIN_MATCH_LENGTH:
+        return RawSQL(
+            f'SELECT rowid FROM {index.table} WHERE {index.table} MATCH %s',
+            [_match_expression(keyword, fields)],
+        )
+    return model.objects.filter(_contains(fields, keyword)).values('pk')
+
+
+def search(queryset, keyword, fields=None):
+    """按关键字筛选查询集：fields 中任一列包含关键字（默认为索引的全部列）"""
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return queryset
+    fields = _index_for(queryset.model, fields)[1]
+    if uses_fts() and len(keyword) >= MIN_MATCH_LENGTH:
+        return queryset.filter(pk__in=matching(queryset.model, keyword, fields))
+    return queryset.filter(_contains(fields, keyword))
+
+
+def search_related(queryset, relation, model, keyword, fields=None):
+    """按关联对象的关键字筛选，如 search_related(bookings, 'device', Device, 'DEV', ['device_code'])"""
+    keyword = (keyword or '').strip()
+    if not keyword:
+        return queryset
+    fields = _index_for(model, fields)[1]
+    if uses_fts() and len(keyword) >= MIN_MATCH_LENGTH:
+        return queryset.filter(**{f'{relation}__in': matching(model, keyword, fields)})
+    return queryset.filter(_contains(fields, keyword, prefix=f'{relation}__'))
+
+
+# ---------------------- 索引同步（仅支持 FTS5 的 SQLite） ----------------------
+
+def index_instances(model, instances):
+    """写入（或覆盖）实例的索引行"""
+    if not uses_fts():
+        return
+    index = INDEXES[model]
+    rows = [[instance.pk, *index.values(instance)] for instance in instances]
+    if not rows:
+        return
+    columns = ', '.join(index.fields)
+    placeholders = ', '.join(['%s'] * (len(index.fields) + 1))
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {index.table} WHERE rowid = %s', [[row[0]] for row in rows])
+        cursor.executemany(f'INSERT INTO {index.table} (rowid, {columns}) VALUES ({placeholders})', rows)
+
+
+def unindex_pks(model, pks):
+    """删除索引行"""
+    if not uses_fts() or not pks:
+        return
+    with connection.cursor() as cursor:
+        cursor.executemany(f'DELETE FROM {INDEXES[model].table} WHERE rowid = %s', [[pk] for pk in pks])
+
+
+def rebuild_index(model):
+    """按模型表的当前内容重建索引，返回索引行数（批量导入、update() 之后使用）"""
+    if not uses_fts():
+        return 0
+    index = INDEXES[model]
+    columns = ', '.join(index.fields)
+    with connection.cursor() as cursor:
+        cursor.execute(f'DELETE FROM {index.table}')
+        cursor.execute(
+            f'INSERT INTO {index.table} (rowid, {columns}) '
+            f'SELECT {model._meta.pk.column}, {columns} FROM {model._meta.db_table}'
+        )
+        return cursor.rowcount
@@ -0,0 +1,23 @@
+"""
+重建搜索索引
+使用方法：python manage.py rebuild_search_index
+保存、删除设备/用户/预约时索引由信号自动同步；bulk_create()、update() 等批量操作不触发信号，
+批量导入数据或直接修改数据库后运行本命令。PostgreSQL 使用数据库自身的索引，无需重建。
+"""
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from search.index import INDEXES, rebuild_index, uses_fts
+
+
+class Command(BaseCommand):
+    help = '按当前数据重建设备、用户、预约的搜索索引'
+
+    def handle(self, *args, **options):
+        if not uses_fts():
+            self.stdout.write(self.style.SUCCESS('当前数据库使用数据库索引，无需重建。'))
+            return
+        with transaction.atomic():
+            for model in INDEXES:
+                count = rebuild_index(model)
+                self.stdout.write(f'{model._meta.verbose_name}：{count} 条')
+        self.stdout.write(self.style.SUCCESS('搜索索引重建完成'))
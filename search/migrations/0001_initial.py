@@ -0,0 +1,60 @@
+# 搜索索引：SQLite 建立 FTS5（trigram）虚拟表并写入现有数据（不支持 FTS5/trigram 时跳过，搜索退回 icontains）；
+# PostgreSQL 建立 pg_trgm 表达式索引
+
+from django.db import migrations
+from search.index import fts_supported
+
+# (FTS5表名, 模型表名, 被搜索的列)，与 search.index.INDEXES 一致
+FTS_TABLES = [
+    ('search_device_fts', 'devices_device', ['device_code', 'model', 'manufacturer', 'purpose']),
+    ('search_userinfo_fts', 'user_userinfo', ['user_code', 'name', 'department']),
+    ('search_booking_fts', 'booking_booking', ['booking_code', 'purpose']),
+]
+
+
+def create_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    if vendor == 'sqlite':
+        if not fts_supported(schema_editor.connection):
+            return
+        for fts_table, table, columns in FTS_TABLES:
+            column_list = ', '.join(columns)
+            schema_editor.execute(
+                f"CREATE VIRTUAL TABLE {fts_table} USING fts5({column_list}, tokenize='trigram')"
+            )
+            schema_editor.execute(
+                f'INSERT INTO {fts_table} (rowid, {column_list}) SELECT id, {column_list} FROM {table}'
+            )
+    elif vendor == 'postgresql':
+        schema_editor.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+        for fts_table, table, columns in FTS_TABLES:
+            for column in columns:
+                schema_editor.execute(
+                    f'CREATE INDEX IF NOT EXISTS {table}_{column}_trgm ON {table} '
+                    f'USING gin ((UPPER({column}::text)) gin_trgm_ops)'
+                )
+
+
+def drop_search_indexes(apps, schema_editor):
+    vendor = schema_editor.connection.vendor
+    for fts_table, table, columns in FTS_TABLES:
+        if vendor == 'sqlite':
+            schema_editor.execute(f'DROP TABLE IF EXISTS {fts_table}')
+        elif vendor == 'postgresql':
+            for column in columns:
+                schema_editor.execute(f'DROP INDEX IF EXISTS {table}_{column}_trgm')
+
+
+class Migration(migrations.Migration):
+
+    initial = True
+
+    dependencies = [
+        ('booking', '0008_keyset_pagination_indexes'),
+        ('devices', '0003_alter_device_status'),
+        ('user', '0003_remove_userinfo_advisor_userinfo_advisors'),
+    ]
+
+    operations = [
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,34 @@
+"""搜索索引同步：设备、用户、预约保存或删除时更新 FTS5 索引（仅 SQLite）"""
+from django.db.models.signals import post_init, post_save, post_delete
+from .index import INDEXES, index_instances, unindex_pks
+
+_MISSING = object()
+
+
+def _indexed_values(instance):
+    # 读 __dict__，only()/defer() 加载的实例不会因此多查询；未加载的字段也不会被修改
+    return tuple(instance.__dict__.get(field, _MISSING) for field in INDEXES[type(instance)].fields)
+
+
+def remember_indexed_values(sender, instance, **kwargs):
+    """记录加载时被索引的列，保存时只有这些列变化才更新索引（如只修改预约状态时不写索引）"""
+    instance._search_values = _indexed_values(instance)
+
+
+def update_index(sender, instance, created, raw=False, **kwargs):
+    if raw:
+        return
+    values = _indexed_values(instance)
+    if created or values != getattr(instance, '_search_values', None):
+        index_instances(sender, [instance])
+        instance._search_values = values
+
+
+def remove_from_index(sender, instance, **kwargs):
+    unindex_pks(sender, [instance.pk])
+
+
+for model in INDEXES:
+    post_init.connect(remember_indexed_values, sender=model, dispatch_uid=f'search_init_{model.__name__}')
+    post_save.connect(update_index, sender=model, dispatch_uid=f'search_save_{model.__name__}')
+    post_delete.connect(remove_from_index, sender=model, dispatch_uid=f'search_delete_{model.__name__}')
@@ -0,0 +1,136 @@
+from datetime import date
+from io import StringIO
+from unittest import mock
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.db import connection
+from django.db.models import Q
+from django.test import RequestFactory, TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+
+from booking.models import Booking
+from devices.models import Device
+from user.models import UserInfo
+from search.index import search, search_related
+
+
+class SearchIndexTestCase(TestCase):
+    """搜索索引测试：结果与 icontains 一致、保存/删除时同步、批量操作后可重建"""
+
+    def setUp(self):
+        """设置测试数据"""
+        self.devices = [
+            Device.objects.create(device_code='DEV001', model='Oscilloscope X1', manufacturer='Tektronix', purpose='信号测量'),
+            Device.objects.create(device_code='DEV002', model='光谱仪', manufacturer='岛津', purpose='材料分析'),
+            Device.objects.create(device_code='LAB003', model='示波器 mini', manufacturer='Rigol'),
+        ]
+        self.student = UserInfo.objects.create(
+            user_code='S2024001', name='张三丰', user_type='student',
+            department='物联网工程学院', phone='13800138000'
+        )
+        self.booking = Booking.objects.create(
+            booking_code='BK20250310001', applicant=self.student, device=self.devices[0],
+            booking_date=date(2025, 3, 10), time_slot='08:00-10:00', purpose='毕业设计测量'
+        )
+
+    def _codes(self, queryset):
+        return sorted(queryset.values_list('device_code', flat=True))
+
+    def test_same_results_as_icontains(self):
+        """测试各种长度、大小写和中文关键字的结果与多列 icontains 一致"""
+        fields = ['device_code', 'model', 'manufacturer', 'purpose']
+        for keyword in ['DEV', 'dev00', 'oscillo', 'TEK', '示波器', '光谱', '材料分析', '0', 'mini', '不存在的设备']:
+            expected = Device.objects.filter(
+                Q(device_code__icontains=keyword) | Q(model__icontains=keyword) |
+                Q(manufacturer__icontains=keyword) | Q(purpose__icontains=keyword)
+            )
+            self.assertEqual(self._codes(search(Device.objects.all(), keyword, fields)), self._codes(expected), keyword)
+
+        # 只在指定的列中查找
+        self.assertEqual(self._codes(search(Device.objects.all(), 'DEV', ['model'])), [])
+        self.assertEqual(search(Device.objects.all(), '  ').count(), 3)
+
+    def test_uses_fts_index(self):
+        """测试不少于3个字符的关键字通过 FTS5 索引查询"""
+        if connection.vendor != 'sqlite':
+            self.skipTest('FTS5 索引仅用于 SQLite')
+        with CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self._codes(search(Device.objects.all(), 'Tektronix')), ['DEV001'])
+        self.assertIn('MATCH', queries[0]['sql'])
+        self.assertNotIn('LIKE', queries[0]['sql'])
+
+    def test_falls_back_without_fts5(self):
+        """测试 SQLite 不支持 FTS5/trigram 时迁移不建虚拟表，搜索和同步退回 icontains"""
+        import importlib
+        from search import index
+        migration = importlib.import_module('search.migrations.0001_initial')
+        self.assertEqual(index.fts_supported(), connection.vendor == 'sqlite')
+
+        # 模拟探测结果为不支持（迁移和 uses_fts() 读取同一个缓存）
+        with mock.patch.dict(index._fts_support, {connection.alias: False}):
+            schema_editor = mock.Mock(connection=connection)
+            migration.create_search_indexes(None, schema_editor)
+            if connection.vendor == 'sqlite':
+                schema_editor.execute.assert_not_called()
+
+            self.assertFalse(index.uses_fts())
+            with CaptureQueriesContext(connection) as queries:
+                self.assertEqual(self._codes(search(Device.objects.all(), 'Tektronix')), ['DEV001'])
+                Device.objects.create(device_code='DEV004', model='万用表')
+            self.assertFalse([q for q in queries if 'MATCH' in q['sql'] or '_fts' in q['sql']])
+            self.assertEqual(self._codes(search(Device.objects.all(), '万用表')), ['DEV004'])
+
+    def test_index_follows_save_and_delete(self):
+        """测试修改、删除记录后索引随之更新，只修改未索引的列时不写索引"""
+        device = self.devices[2]
+        device.model = 'Multimeter 3000'
+        device.save()
+        self.assertEqual(self._codes(search(Device.objects.all(), 'multimeter')), ['LAB003'])
+        self.assertEqual(self._codes(search(Device.objects.all(), '示波器')), [])
+
+        with CaptureQueriesContext(connection) as queries:
+            self.booking.status = 'manager_approved'
+            self.booking.save()
+        self.assertFalse([q for q in queries if 'search_booking_fts' in q['sql']])
+
+        bookings = search_related(Booking.objects.all(), 'applicant', UserInfo, '张三丰', ['name'])
+        self.assertEqual(list(bookings), [self.booking])
+        self.assertEqual(search(Booking.objects.all(), '毕业设计').count(), 1)
+
+        self.booking.delete()
+        self.assertEqual(search(Booking.objects.all(), 'BK2025').count(), 0)
+        self.student.name = '李四'
+        self.student.save()
+        self.assertEqual(search(UserInfo.objects.all(), '张三丰').count(), 0)
+        self.assertEqual(search(UserInfo.objects.all(), '物联网工程').count(), 1)
+
+    def test_rebuild_after_bulk_create(self):
+        """测试 bulk_create 不触发信号，重建命令补全索引"""
+        Device.objects.bulk_create([Device(device_code='BULK001', model='批量导入设备')])
+        call_command('rebuild_search_index', stdout=StringIO())
+        self.assertEqual(self._codes(search(Device.objects.all(), 'BULK')), ['BULK001'])
+        self.assertEqual(self._codes(search(Device.objects.all(), '批量导入')), ['BULK001'])
+
+    def test_views_use_search(self):
+        """测试设备查询、设备管理和台账筛选使用搜索索引"""
+        from django.contrib.auth.models import Group
+        admin = User.objects.create_user(username='admin01', password='test123456')
+        admin.groups.add(Group.objects.create(name='设备管理员'))
+        self.client.force_login(admin)
+
+        response = self.client.get(reverse('device_manage'), {'keyword': 'rigol'})
+        self.assertEqual([device.device_code for device in response.context['devices']], ['LAB003'])
+
+        from labadmin.views import device_list
+        request = RequestFactory().get('/', {'keyword': 'tektronix'})
+        request.user = admin
+        with mock.patch('labadmin.views.render') as render:
+            device_list(request)
+        devices = render.call_args[0][2]['devices']
+        self.assertEqual([device.device_code for device in devices], ['DEV001'])
+
+        response = self.client.get(reverse('ledger:booking_ledger_list'), {'device_code': 'DEV001'})
+        self.assertEqual(response.context['total_count'], 1)
+        response = self.client.get(reverse('ledger:booking_ledger_list'), {'applicant_name': '李四'})
+        self.assertEqual(response.context['total_count'], 0)
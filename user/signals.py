@@ -0,0 +1,45 @@
+"""用户相关信号处理"""
+from django.contrib.auth.models import User, Group
+from django.db.models.signals import post_save, post_delete, pre_delete, m2m_changed
+from django.dispatch import receiver
+from jnu_lab_system.identity import invalidate_identity
+from jnu_lab_system.roles import invalidate_roles
+from .models import UserInfo
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def auth_user_changed(sender, instance, **kwargs):
+    """账户变化时，使该用户的身份缓存失效"""
+    invalidate_identity(instance.pk)
+
+
+@receiver(post_save, sender=UserInfo)
+@receiver(post_delete, sender=UserInfo)
+def user_info_changed(sender, instance, **kwargs):
+    """用户信息变化时，使关联账户的身份缓存失效"""
+    invalidate_identity(instance.auth_user_id)
+
+
+@receiver(m2m_changed, sender=User.groups.through)
+def group_membership_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """用户组成员变化时，使相关用户缓存的角色失效"""
+    if action not in ('post_add', 'post_remove', 'pre_clear'):
+        return
+    if not reverse:
+        # user.groups.add/remove/clear：instance 为用户
+        invalidate_roles(instance.pk)
+    elif action == 'pre_clear':
+        # group.user_set.clear()：清除前取得成员
+        invalidate_roles(*instance.user_set.values_list('pk', flat=True))
+    else:
+        invalidate_roles(*pk_set)
+
+
+@receiver(post_save, sender=Group)
+@receiver(pre_delete, sender=Group)
+def group_changed(sender, instance, created=False, **kwargs):
+    """用户组改名或删除时，使其成员缓存的角色失效"""
+    if created:
+        return
+    invalidate_roles(*instance.user_set.values_list('pk', flat=True))
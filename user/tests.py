@@ -1,3 +1,81 @@
+from datetime import date, timedelta
+from django.contrib.auth.models import User
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
 
-# Create your tests here.
+from booking.models import Booking, ApprovalRecord
+from devices.models import Device
+from user.models import UserInfo
+
+
+class TeacherBulkApprovalTestCase(TestCase):
+    """指导教师批量审批测试：选中的预约一次更新状态，审批记录批量写入"""
+
+    def setUp(self):
+        """设置测试数据并以教师身份登录"""
+        self.auth_user = User.objects.create_user(username='T001', password='test123456')
+        self.teacher = UserInfo.objects.create(
+            user_code='T001', name='张老师', user_type='teacher',
+            department='物联网学院', phone='13800138001', auth_user=self.auth_user
+        )
+        self.other_teacher = UserInfo.objects.create(
+            user_code='T002', name='李老师', user_type='teacher', department='物联网学院', phone='13800138002'
+        )
+        self.student = UserInfo.objects.create(
+            user_code='S001', name='王同学', user_type='student', department='物联网学院', phone='13800138003'
+        )
+        self.device = Device.objects.create(device_code='DEV001', model='示波器')
+        self.client.post(reverse('user_login'), {'username': 'T001', 'password': 'test123456', 'role': 'user'})
+
+    def _bookings(self, count, teacher, start=0):
+        Booking.objects.bulk_create([
+            Booking(
+                booking_code=f'BOOK{start + i:05d}', applicant=self.student, teacher=teacher, device=self.device,
+                booking_date=date(2025, 1, 1) + timedelta(days=start + i), time_slot='08:00-10:00',
+                status='teacher_pending'
+            )
+            for i in range(count)
+        ])
+        return list(Booking.objects.filter(teacher=teacher, booking_code__gte=f'BOOK{start:05d}')
+                    .order_by('id').values_list('id', flat=True))[:count]
+
+    def _batch(self, booking_ids, action):
+        return self.client.post(reverse('teacher_booking_approve'), {
+            'booking_ids': booking_ids, 'action': action, 'comment': '批量审批'
+        })
+
+    def test_batch_approve_500_bookings(self):
+        """测试一次批准500条预约：除分批 INSERT 外查询次数与选中数量无关"""
+        def statements(queries):
+            return [q['sql'] for q in queries if not q['sql'].startswith('INSERT')]
+
+        self._batch(self._bookings(5, self.teacher), 'approve')  # 预热会话、身份等按请求固定的查询
+        few = self._bookings(5, self.teacher, start=5)
+        with CaptureQueriesContext(connection) as small:
+            self._batch(few, 'approve')
+        ids = self._bookings(500, self.teacher, start=10)
+        with CaptureQueriesContext(connection) as queries:
+            response = self._batch(ids, 'approve')
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(len(statements(queries)), len(statements(small)))
+        self.assertLessEqual(len(queries), 40)
+
+        self.assertEqual(Booking.objects.filter(id__in=ids, status='pending').count(), 500)
+        records = ApprovalRecord.objects.filter(booking_id__in=ids)
+        self.assertEqual(records.count(), 500)
+        self.assertEqual(set(records.values_list('approval_level', 'action', 'comment')),
+                         {('teacher', 'approve', '批量审批')})
+
+    def test_batch_reject_only_own_pending_bookings(self):
+        """测试批量拒绝只处理指定自己为指导教师、待指导教师审批的预约"""
+        own = self._bookings(3, self.teacher)
+        others = self._bookings(1, self.other_teacher, start=10)
+        Booking.objects.filter(id=own[2]).update(status='pending')
+
+        self._batch(own + others, 'reject')
+        statuses = dict(Booking.objects.values_list('id', 'status'))
+        self.assertEqual([statuses[booking_id] for booking_id in own], ['teacher_rejected', 'teacher_rejected', 'pending'])
+        self.assertEqual(statuses[others[0]], 'teacher_pending')
+        self.assertEqual(ApprovalRecord.objects.filter(action='reject', approver=self.auth_user).count(), 2)
@@ -1,6 +1,6 @@
 from django.urls import path, include
 from . import views
-from booking.views import booking_apply, cancel_booking, my_booking, device_booking_detail, check_availability, get_available_time_slots
+from booking.views import booking_apply, cancel_booking, my_booking, device_booking_detail, check_availability, get_available_time_slots, batch_availability
 from user.views_teacher_approval import teacher_booking_approve
 from user.views_excel_import import import_students_excel, download_template  # 合并导入
 from user.views_all_student_bookings import teacher_all_student_bookings
@@ -18,6 +18,8 @@ urlpatterns = [
     path('check-availability/', check_availability, name='check_availability'),
     # 获取可用时段列表
     path('get-available-time-slots/', get_available_time_slots, name='get_available_time_slots'),
+    # 批量查询多设备多天的时段占用（位图矩阵）
+    path('batch-availability/', batch_availability, name='batch_availability'),
     # 我的预约页
     path('booking/my/', my_booking, name='my_booking'),
     # 删除预约
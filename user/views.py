@@ -24,6 +24,9 @@ from django.contrib.auth.hashers import make_password
 from django.contrib.auth.decorators import user_passes_test
 # 添加 StudentForm
 from .forms import UserInfoForm, RegistrationForm, StudentForm, StudentIdForm
+from jnu_lab_system.identity import get_current_user_info
+from search.index import search
+from booking.queue_counters import TEACHER_QUEUE, queue_count
 
 
 
@@ -33,7 +36,7 @@ def user_profile(request):
     """个人信息管理视图"""
     # 获取当前登录用户关联的UserInfo
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
     except UserInfo.DoesNotExist:
         messages.error(request, '未找到你的个人信息，请联系管理员！')
         # 确保重定向到首页，不会导致循环跳转
@@ -187,10 +190,10 @@ def user_home(request):
     
     # 验证用户是否有UserInfo（普通用户必须有）
     try:
-        user_info = UserInfo.objects.get(auth_user=request.user)
+        user_info = get_current_user_info(request)
         # 如果用户是管理员或负责人，不应该访问普通用户首页
-        is_admin = request.user.groups.filter(name='设备管理员').exists()
-        is_manager = request.user.groups.filter(name='实验室负责人').exists()
+        is_admin = request.roles.is_admin
+        is_manager = request.roles.is_manager
         if is_admin or is_manager or request.user.is_superuser:
             # 管理员或负责人访问普通用户首页，重定向到对应首页
             if is_admin or request.user.is_superuser:
@@ -199,8 +202,8 @@ def user_home(request):
                 return redirect('manager_home')
     except UserInfo.DoesNotExist:
         # 如果没有UserInfo，可能是管理员或负责人
-        is_admin = request.user.groups.filter(name='设备管理员').exists()
-        is_manager = request.user.groups.filter(name='实验室负责人').exists()
+        is_admin = request.roles.is_admin
+        is_manager = request.roles.is_manager
         if is_admin or request.user.is_superuser:
             return redirect('admin_home')
         elif is_manager:
@@ -212,7 +215,11 @@ def user_home(request):
             messages.error(request, '用户信息异常，请重新登录！')
             return redirect('user_login')
     
-    return render(request, 'user/home.html')
+    context = {}
+    if user_info.user_type == 'teacher':
+        # 教师：待审批的学生预约数（读取审批队列计数）
+        context['teacher_pending_count'] = queue_count(TEACHER_QUEUE, user_info)
+    return render(request, 'user/home.html', context)
 
 @login_required
 def device_list(request):
@@ -225,14 +232,8 @@ def device_list(request):
     # 基础查询：获取所有设备（按编号排序）
     devices = Device.objects.all().order_by('device_code')
     
-    # 如果有搜索关键词，过滤结果
-    if keyword:
-        devices = devices.filter(
-            Q(device_code__icontains=keyword) |  # 按设备编号搜索
-            Q(model__icontains=keyword) |        # 按型号搜索
-            Q(manufacturer__icontains=keyword) | # 按厂商搜索
-            Q(purpose__icontains=keyword)        # 按实验用途搜索
-        )
+    # 如果有搜索关键词，按设备编号/型号/厂商/实验用途搜索
+    devices = search(devices, keyword, ['device_code', 'model', 'manufacturer', 'purpose'])
 
     # 2. 准备上下文数据
     context = {
@@ -334,7 +335,7 @@ def teacher_required(function=None):
 @csrf_protect
 def add_student(request):
     """教师添加指导学生 - 第一步：输入学号"""
-    teacher_info = UserInfo.objects.get(auth_user=request.user)
+    teacher_info = get_current_user_info(request)
     
     if request.method == 'POST':
         form = StudentIdForm(request.POST)
@@ -382,7 +383,7 @@ def add_student(request):
 @csrf_protect
 def add_student_full(request):
     """教师添加指导学生 - 第二步：填写完整信息（学号不存在时）"""
-    teacher_info = UserInfo.objects.get(auth_user=request.user)
+    teacher_info = get_current_user_info(request)
     
     # 从session获取学号
     user_code = request.session.get('adding_student_code')
@@ -446,7 +447,7 @@ def add_student_full(request):
 def edit_student(request, student_id):
     """教师编辑学生信息"""
     # 获取当前教师信息
-    teacher_info = UserInfo.objects.get(auth_user=request.user)
+    teacher_info = get_current_user_info(request)
     
     # 获取学生信息，确保该学生是指定教师指导的
     student = get_object_or_404(UserInfo, id=student_id, user_type='student')
@@ -493,7 +494,7 @@ def edit_student(request, student_id):
 def remove_student(request, student_id):
     """教师移除指导学生（软删除）"""
     # 获取当前教师信息
-    teacher_info = UserInfo.objects.get(auth_user=request.user)
+    teacher_info = get_current_user_info(request)
     
     # 获取学生信息，确保该学生是指定教师指导的
     student = get_object_or_404(UserInfo, id=student_id, user_type='student')
@@ -4,13 +4,14 @@ from django.contrib.auth.decorators import login_required
 from django.contrib import messages
 from user.models import UserInfo
 from booking.models import Booking
+from jnu_lab_system.identity import get_current_user_info
 
 @login_required
 def teacher_all_student_bookings(request):
     """教师查看指定自己为指导教师的学生的预约申请"""
     # 获取当前教师信息
     try:
-        teacher_info = UserInfo.objects.get(auth_user=request.user)
+        teacher_info = get_current_user_info(request)
         # 严格检查：必须是教师类型
         if teacher_info.user_type != 'teacher':
             messages.error(request, '只有教师可以查看学生预约申请！')
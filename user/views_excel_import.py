@@ -7,6 +7,7 @@ from django.contrib.auth.models import User
 from user.models import UserInfo
 from openpyxl import load_workbook
 from django.db import transaction
+from jnu_lab_system.identity import get_current_user_info
 
 @login_required
 @csrf_protect
@@ -14,7 +15,7 @@ def import_students_excel(request):
     """教师批量导入学生（Excel）"""
     # 获取当前教师信息
     try:
-        teacher_info = UserInfo.objects.get(auth_user=request.user)
+        teacher_info = get_current_user_info(request)
         # 严格检查：必须是教师类型
         if teacher_info.user_type != 'teacher':
             messages.error(request, '只有教师可以批量导入学生！')
@@ -158,7 +159,7 @@ def download_template(request):
     """下载Excel导入模板"""
     # 验证用户是否为教师
     try:
-        teacher_info = UserInfo.objects.get(auth_user=request.user)
+        teacher_info = get_current_user_info(request)
         if teacher_info.user_type != 'teacher':
             messages.error(request, '只有教师可以下载模板！')
             return redirect('user_home')
@@ -1,11 +1,13 @@
 """教师审批学生预约申请的视图"""
-from django.shortcuts import render, redirect, get_object_or_404
+from django.shortcuts import render, redirect
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_protect
 from django.contrib import messages
 from django.db.models import Q
 from user.models import UserInfo
-from booking.models import Booking, ApprovalRecord
+from booking.models import Booking
+from jnu_lab_system.identity import get_current_user_info
+from labadmin.approvals import bulk_approve, summarize as summarize_approvals
 
 @login_required
 @csrf_protect
@@ -13,7 +15,7 @@ def teacher_booking_approve(request):
     """教师审批学生预约申请"""
     # 获取当前教师信息
     try:
-        teacher_info = UserInfo.objects.get(auth_user=request.user)
+        teacher_info = get_current_user_info(request)
         # 严格检查：必须是教师类型
         if teacher_info.user_type != 'teacher':
             messages.error(request, '只有教师可以审批学生预约申请！')
@@ -34,55 +36,38 @@ def teacher_booking_approve(request):
     bookings = Booking.objects.filter(
         status='teacher_pending',
         teacher=teacher_info  # 预约申请中的指导教师必须是当前教师
-    ).order_by('-create_time')
+    ).select_related('applicant', 'device').order_by('-create_time')
     
-    # 处理审批操作
+    # 处理审批操作：单条（booking_id）和批量（booking_ids）都在一个事务中通过预约状态机更新状态
     if request.method == 'POST':
-        booking_id = request.POST.get('booking_id')
+        booking_ids = request.POST.getlist('booking_ids')
+        if not booking_ids and request.POST.get('booking_id'):
+            booking_ids = [request.POST.get('booking_id')]
         action = request.POST.get('action')  # 'approve' 或 'reject'
-        
-        if booking_id and action:
-            booking = get_object_or_404(
-                Booking, 
-                id=booking_id
+        if action not in ('approve', 'reject'):
+            messages.error(request, '请选择批准或拒绝')
+            return redirect('teacher_booking_approve')
+        if not booking_ids:
+            messages.error(request, '请选择要审批的预约申请')
+            return redirect('teacher_booking_approve')
+        try:
+            results = bulk_approve(
+                booking_ids, action, request.user, 'teacher',
+                comment=request.POST.get('comment', ''), teacher=teacher_info
             )
-            # 验证预约申请中的指导教师是否是当前教师
-            if booking.teacher != teacher_info:
-                messages.error(request, '您无权审批该预约申请！该预约申请指定的指导教师不是您。')
-                return redirect('teacher_booking_approve')
-            
-            if action == 'approve':
-                # 教师批准：状态变为待管理员审批
-                booking.status = 'pending'
-                booking.save()
-                
-                # 记录审批日志
-                ApprovalRecord.objects.create(
-                    booking=booking,
-                    approver=request.user,
-                    approval_level='teacher',
-                    action='approve',
-                    comment=request.POST.get('comment', '')
-                )
-                
-                messages.success(request, f'已批准学生 {booking.applicant.name} 的预约申请：{booking.booking_code}')
-            elif action == 'reject':
-                # 教师拒绝
-                booking.status = 'teacher_rejected'
-                booking.save()
-                
-                # 记录审批日志
-                ApprovalRecord.objects.create(
-                    booking=booking,
-                    approver=request.user,
-                    approval_level='teacher',
-                    action='reject',
-                    comment=request.POST.get('comment', '')
-                )
-                
-                messages.success(request, f'已拒绝学生 {booking.applicant.name} 的预约申请：{booking.booking_code}')
-            
+        except ValueError as e:
+            messages.error(request, str(e))
             return redirect('teacher_booking_approve')
+        summary = summarize_approvals(results)
+        action_text = '批准' if action == 'approve' else '拒绝'
+        if summary['succeeded'] == 1 and summary['total'] == 1:
+            messages.success(request, f'已{action_text}学生的预约申请：{results[0]["booking_code"]}')
+        elif summary['succeeded']:
+            messages.success(request, f'已{action_text}{summary["succeeded"]}条学生预约申请')
+        for result in results:
+            if not result['success']:
+                messages.warning(request, f'{result["booking_code"] or result["id"]}：{result["error"]}')
+        return redirect('teacher_booking_approve')
     
     context = {
         'bookings': bookings,